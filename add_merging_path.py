@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# add_merging_path.py adds to an intersection a travel path which merges
+# into the entry lane of another part way along it.  It is used to test
+# the simulator's lane queues.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+import math
+import json
+import copy
+import pathlib
+import argparse
+
+parser = argparse.ArgumentParser (
+  formatter_class=argparse.RawDescriptionHelpFormatter,
+  description=('Add a travel path which merges into the entry lane ' +
+               'of another.'),
+  epilog=('Copyright © 2026 by John Sauter' + '\n' +
+          'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+          'see <http://gnu.org/licenses/gpl.html> for the full text ' +
+          'of the license.' + '\n' +
+          'This is free software: ' +
+          'you are free to change and redistribute it. ' + '\n' +
+          'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+          '\n'))
+
+parser.add_argument ('--version', action='version',
+                     version='add_merging_path 0.71 2026-10-19',
+                     help='print the version number and exit')
+parser.add_argument ('input-file', metavar='input_file',
+                     help='read the intersection description from this ' +
+                     'JSON file')
+parser.add_argument ('output-file', metavar='output_file',
+                     help='write the intersection description to this file')
+parser.add_argument ('--travel-path', metavar='travel_path',
+                     help='the travel path to merge into; default B5')
+parser.add_argument ('--distance', type=float, metavar='distance',
+                     help='how far along the first segment of that ' +
+                     'travel path the new one starts; default 276')
+
+error_counter = 0
+
+# Parse the command line.
+arguments = parser.parse_args ()
+arguments = vars(arguments)
+
+input_file_name = pathlib.Path(arguments ['input-file'])
+output_file_name = pathlib.Path(arguments ['output-file'])
+
+travel_path_name = "B5"
+if (arguments ['travel_path'] != None):
+  travel_path_name = arguments ['travel_path']
+
+merge_distance = 276.0
+if (arguments ['distance'] != None):
+  merge_distance = arguments ['distance']
+
+input_file = open (input_file_name, 'r')
+intersection_info = json.load (input_file)
+input_file.close()
+
+travel_paths = intersection_info ["travel paths"]
+speed_limits = intersection_info ["speed limits"]
+
+# The new travel path is a copy of the old one which starts part way
+# along its first segment, so it enters the same lane there.  It has
+# the old one's speed limits.
+travel_path = travel_paths [travel_path_name]
+merging_path_name = travel_path_name + " merge"
+merging_path = copy.deepcopy (travel_path)
+merging_path ["name"] = merging_path_name
+lane_name, start_x, start_y = travel_path ["milestones"][0]
+end_x = travel_path ["milestones"][1][1]
+end_y = travel_path ["milestones"][1][2]
+segment_length = math.hypot (end_x - start_x, end_y - start_y)
+if (merge_distance >= segment_length):
+  print ("The first segment of " + travel_path_name + " is only " +
+         str(segment_length) + " long.")
+  error_counter = error_counter + 1
+else:
+  fraction = merge_distance / segment_length
+  merging_path ["milestones"][0] = [lane_name,
+                                    start_x + ((end_x - start_x) * fraction),
+                                    start_y + ((end_y - start_y) * fraction)]
+  travel_paths [merging_path_name] = merging_path
+  for speed_limit_name in list(speed_limits.keys()):
+    path_name, slash, lane_name = speed_limit_name.partition (" / ")
+    if (path_name == travel_path_name):
+      speed_limits [merging_path_name + " / " + lane_name] = (
+        speed_limits [speed_limit_name])
+
+  output_file = open (output_file_name, 'w')
+  json.dump (intersection_info, output_file, indent = " ")
+  output_file.close()
+
+if (error_counter > 0):
+  print ("Encountered " + str(error_counter) + " errors.")
+
+# End of file add_merging_path.py
@@ -0,0 +1,548 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# binary_trace.py writes the trace of the traffic signal simulator in
+# its binary format, and prints, filters and searches such a trace.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The trace is a sequence of events.  Each event has a type, such as
+# "move traffic element", the time it happened, and the entity it
+# happened to, usually a traffic element or a signal face, named by
+# its name.  An event can carry the state of its entity, a dictionary,
+# of which only the keys whose values have changed since the entity's
+# last event are written, so a traffic element that moves records
+# little more than its new position.  An event can also carry fields,
+# which are written in full.
+#
+# The file starts with a line naming the format and the number of
+# ticks in a second.  Each time is a whole number of ticks and the
+# fraction of a tick left over, as in the events file; see
+# columnar_events.split_time.  After that come records, each starting
+# with a byte saying what it is.  An "S" record defines the next string
+# in the list of strings; event types, entity names, keys and fractions
+# of a tick are numbers which index that list.  An "E" record is an
+# event: its type, time and entity, the
+# number of changes to the state and the number of fields, then each
+# change and each field as a key and a value.  Values are written with
+# a byte giving their kind, so lists and dictionaries can be nested,
+# and shapes are written in the well-known binary format.
+#
+# The file is only ever appended to, so it can be truncated after any
+# record and appended to again, which is how the simulator resumes from
+# a checkpoint.
+#
+# The simulator also keeps its most recent events in a flight recorder
+# in memory, whether or not it is tracing, and writes them out in the
+# same format when something goes wrong.
+
+import re
+import copy
+import collections
+import struct
+import numbers
+import decimal
+import fractions
+import pprint
+import argparse
+import shapely
+
+import columnar_events
+
+# The first line in the file.
+format_name = b"simulate_traffic trace 2\n"
+
+# The header of an event: its type, time in whole ticks and fraction of
+# a tick, and entity, and how many changes and fields follow.
+event_header = struct.Struct ("<IqIIII")
+length_format = struct.Struct ("<I")
+integer_format = struct.Struct ("<q")
+float_format = struct.Struct ("<d")
+
+# Encode a value as bytes.  Values which cannot be represented are
+# written as their repr, so that anything can be traced.  Most values
+# are of a few types, so the encoder is found from the type of the
+# value, and only a new type is checked against each kind.
+def encode_value (the_value):
+  encoder = encoders.get (type(the_value))
+  if (encoder == None):
+    encoder = find_encoder (type(the_value))
+    encoders[type(the_value)] = encoder
+  return (encoder (the_value))
+
+def encode_string (the_string):
+  the_bytes = the_string.encode ("utf-8")
+  return (length_format.pack (len(the_bytes)) + the_bytes)
+
+def encode_none (the_value):
+  return (b"N")
+
+def encode_bool (the_value):
+  if (the_value):
+    return (b"T")
+  return (b"F")
+
+def encode_integer (the_value):
+  if (-(2**63) <= the_value < 2**63):
+    return (b"i" + integer_format.pack (the_value))
+  return (b"I" + encode_string (str(the_value)))
+
+def encode_float (the_value):
+  return (b"f" + float_format.pack (the_value))
+
+def encode_str (the_value):
+  return (b"s" + encode_string (the_value))
+
+def encode_fraction (the_value):
+  return (b"r" + encode_string (str(the_value)))
+
+def encode_decimal (the_value):
+  return (b"d" + encode_string (str(the_value)))
+
+def encode_geometry (the_value):
+  the_bytes = shapely.to_wkb (the_value)
+  return (b"g" + length_format.pack (len(the_bytes)) + the_bytes)
+
+def encode_dict (the_value):
+  return (b"m" + length_format.pack (len(the_value)) +
+          b"".join ([encode_value (key) + encode_value (value)
+                     for key, value in the_value.items()]))
+
+def encode_list (the_value):
+  return (b"l" + length_format.pack (len(the_value)) +
+          b"".join ([encode_value (item) for item in the_value]))
+
+def encode_tuple (the_value):
+  return (b"t" + length_format.pack (len(the_value)) +
+          b"".join ([encode_value (item) for item in the_value]))
+
+# Sort the members of a set so an unchanged set encodes the same way.
+def encode_set (the_value):
+  return (b"e" + length_format.pack (len(the_value)) +
+          b"".join (sorted ([encode_value (item) for item in the_value])))
+
+# An object without a repr of its own shows only its class, rather than
+# an address which would make it seem to change.
+def encode_object (the_value):
+  if (type(the_value).__repr__ is object.__repr__):
+    return (b"o" + encode_string ("<" + type(the_value).__name__ + ">"))
+  return (b"o" + encode_string (repr(the_value)))
+
+encoders = {type(None): encode_none, bool: encode_bool, int: encode_integer,
+            float: encode_float, str: encode_str,
+            fractions.Fraction: encode_fraction,
+            decimal.Decimal: encode_decimal, dict: encode_dict,
+            list: encode_list, tuple: encode_tuple, set: encode_set,
+            frozenset: encode_set}
+
+# Choose the encoder for a type not seen before, such as a subclass or
+# a numpy number.
+def find_encoder (the_type):
+  for base_type, encoder in ((bool, encode_bool),
+                             (numbers.Integral, encode_integer),
+                             (float, encode_float), (str, encode_str),
+                             (fractions.Fraction, encode_fraction),
+                             (decimal.Decimal, encode_decimal),
+                             (shapely.Geometry, encode_geometry),
+                             (dict, encode_dict), (list, encode_list),
+                             (tuple, encode_tuple),
+                             ((set, frozenset), encode_set)):
+    if (issubclass (the_type, base_type)):
+      return (encoder)
+  return (encode_object)
+
+# A value which has been removed from the state of an entity.
+class Removed:
+  def __repr__ (self):
+    return ("<removed>")
+
+removed = Removed ()
+
+# The types of value which are copied when they are recorded, so that
+# a later change to them is seen.
+mutable_types = (list, dict, set)
+
+# Is a value the same as the one last recorded?  A value equal to one
+# of another type, such as 1 and 1.0, has changed.
+def is_unchanged (the_value, last_value):
+  if (type(the_value) is not type(last_value)):
+    return (False)
+  try:
+    return (bool(the_value == last_value))
+  except (ValueError, TypeError):
+    return (False)
+
+# Write the trace.  Records are collected in a buffer, which is written
+# to the file when it grows past buffer_size.  The writer can be
+# pickled; its file is not, and must be given again with reopen.
+class TraceWriter:
+  def __init__ (self, file_name, ticks_per_second, buffer_size=1 << 20):
+    self.ticks_per_second = ticks_per_second
+    self.buffer_size = buffer_size
+    self.codes = dict()
+    self.states = dict()
+    self.buffer = bytearray()
+    self.file = open (file_name, "wb")
+    self.file.write (format_name)
+    self.file.write (integer_format.pack (ticks_per_second))
+    return
+
+  def __getstate__ (self):
+    state = dict(self.__dict__)
+    del state["file"]
+    return (state)
+
+  # Continue writing to the file, discarding anything after position.
+  def reopen (self, file_name, position):
+    self.file = open (file_name, "r+b")
+    self.file.seek (position)
+    self.file.truncate ()
+    return
+
+  # Return the number which stands for a string, defining it first if
+  # it is new.
+  def code (self, the_string):
+    the_code = self.codes.get (the_string)
+    if (the_code == None):
+      the_code = len(self.codes)
+      self.codes[the_string] = the_code
+      self.buffer += b"S" + encode_string (the_string)
+    return (the_code)
+
+  # Record an event of event_type which happened to the named entity at
+  # the_time.  Of the state, only the keys whose values differ from
+  # the entity's last event are written; a key which has gone is
+  # written with the value "X".  The fields are written in full.  The
+  # writer keeps a copy of each value it has written, since comparing
+  # a value with it is much faster than encoding the value again.
+  def record (self, event_type, the_time, entity_name, state=None,
+              fields=None):
+    if (entity_name == None):
+      entity_name = ""
+    changes = list()
+    if (state != None):
+      last_state = self.states.get (entity_name)
+      if (last_state == None):
+        last_state = dict()
+        self.states[entity_name] = last_state
+      for key, value in state.items():
+        if (not is_unchanged (value, last_state.get (key, removed))):
+          if (type(value) in mutable_types):
+            last_state[key] = copy.deepcopy (value)
+          else:
+            last_state[key] = value
+          changes.append ((key, encode_value (value)))
+      for key in [key for key in last_state if (key not in state)]:
+        del last_state[key]
+        changes.append ((key, b"X"))
+    if (fields == None):
+      fields = dict()
+    whole_ticks, tick_fraction = columnar_events.split_time (
+      the_time, self.ticks_per_second)
+    header = event_header.pack (self.code (event_type), whole_ticks,
+                                self.code (tick_fraction),
+                                self.code (entity_name), len(changes),
+                                len(fields))
+    the_record = [b"E", header]
+    for key, encoded_value in changes:
+      the_record.append (length_format.pack (self.code (key)))
+      the_record.append (encoded_value)
+    for key, value in fields.items():
+      the_record.append (length_format.pack (self.code (key)))
+      the_record.append (encode_value (value))
+    self.buffer += b"".join (the_record)
+    if (len(self.buffer) >= self.buffer_size):
+      self.write_buffer ()
+    return
+
+  def write_buffer (self):
+    self.file.write (self.buffer)
+    self.buffer.clear()
+    return
+
+  def flush (self):
+    self.write_buffer ()
+    self.file.flush()
+    return
+
+  def tell (self):
+    return (self.file.tell())
+
+  def close (self):
+    self.flush ()
+    self.file.close()
+    return
+
+# Keep the last size events in memory, so that when something goes
+# wrong they can be written out as a trace.  Recording an event only
+# appends it to a deque, which forgets the oldest event when it is
+# full.
+class FlightRecorder:
+  def __init__ (self, size):
+    self.events = collections.deque (maxlen=size)
+    return
+
+  def record (self, event_type, the_time, entity_name, fields):
+    self.events.append ((event_type, the_time, entity_name, fields))
+    return
+
+  # Keep the last size events from now on.
+  def resize (self, size):
+    self.events = collections.deque (self.events, maxlen=size)
+    return
+
+  # Write the events to a trace file, followed by a "dump" event at
+  # the_time giving the reason.
+  def dump (self, file_name, ticks_per_second, the_time, reason):
+    writer = TraceWriter (file_name, ticks_per_second)
+    for event_type, event_time, entity_name, fields in list(self.events):
+      writer.record (event_type, event_time, entity_name, fields=fields)
+    writer.record ("dump", the_time, None, fields={"reason": reason})
+    writer.close ()
+    return
+
+# Read exactly size bytes, or fail.
+def read_bytes (the_file, size):
+  the_bytes = the_file.read (size)
+  if (len(the_bytes) != size):
+    raise ValueError ("the trace file ends in the middle of a record")
+  return (the_bytes)
+
+def decode_string (the_file):
+  the_length = length_format.unpack (read_bytes (the_file, 4))[0]
+  return (read_bytes (the_file, the_length).decode ("utf-8"))
+
+# Read a value written by encode_value.
+def decode_value (the_file):
+  kind = read_bytes (the_file, 1)
+  match kind:
+    case b"N":
+      return (None)
+    case b"T":
+      return (True)
+    case b"F":
+      return (False)
+    case b"X":
+      return (removed)
+    case b"i":
+      return (integer_format.unpack (read_bytes (the_file, 8))[0])
+    case b"I":
+      return (int(decode_string (the_file)))
+    case b"f":
+      return (float_format.unpack (read_bytes (the_file, 8))[0])
+    case b"s":
+      return (decode_string (the_file))
+    case b"r":
+      return (fractions.Fraction (decode_string (the_file)))
+    case b"d":
+      return (decimal.Decimal (decode_string (the_file)))
+    case b"g":
+      the_length = length_format.unpack (read_bytes (the_file, 4))[0]
+      return (shapely.from_wkb (read_bytes (the_file, the_length)))
+    case b"m":
+      the_length = length_format.unpack (read_bytes (the_file, 4))[0]
+      the_dict = dict()
+      for index in range(the_length):
+        key = decode_value (the_file)
+        the_dict[key] = decode_value (the_file)
+      return (the_dict)
+    case b"l" | b"t" | b"e":
+      the_length = length_format.unpack (read_bytes (the_file, 4))[0]
+      items = [decode_value (the_file) for index in range(the_length)]
+      if (kind == b"t"):
+        return (tuple(items))
+      if (kind == b"e"):
+        return (set(items))
+      return (items)
+    case b"o":
+      return (ReprValue (decode_string (the_file)))
+  raise ValueError ("unknown kind of value " + repr(kind) +
+                    " in the trace file")
+
+# A value which was written as its repr, and prints as it.
+class ReprValue:
+  def __init__ (self, text):
+    self.text = text
+    return
+
+  def __repr__ (self):
+    return (self.text)
+
+  def __eq__ (self, other):
+    return (isinstance (other, ReprValue) and (self.text == other.text))
+
+  def __hash__ (self):
+    return (hash(self.text))
+
+# Read a trace file and yield its events in order.  Each is a
+# dictionary holding the time as an exact fraction, the event type,
+# the entity name, which is empty for an event of the whole
+# simulation, the changes to the entity's state, the fields, and the
+# state of the entity after the changes.  The state is kept up to date
+# as the file is read, so take a copy to keep it.
+def read_trace (file_name):
+  strings = list()
+  states = dict()
+  with open (file_name, "rb") as the_file:
+    if (the_file.readline() != format_name):
+      raise ValueError (str(file_name) + " is not a simulator trace file")
+    ticks_per_second = integer_format.unpack (read_bytes (the_file, 8))[0]
+    while (True):
+      kind = the_file.read (1)
+      if (kind == b""):
+        return
+      if (kind == b"S"):
+        strings.append (decode_string (the_file))
+        continue
+      if (kind != b"E"):
+        raise ValueError ("unknown kind of record " + repr(kind) +
+                          " in the trace file")
+      (type_code, whole_ticks, fraction_code, entity_code, change_count,
+       field_count) = event_header.unpack (
+         read_bytes (the_file, event_header.size))
+      entity_name = strings[entity_code]
+      changes = dict()
+      for index in range(change_count):
+        key_code = length_format.unpack (read_bytes (the_file, 4))[0]
+        changes[strings[key_code]] = decode_value (the_file)
+      fields = dict()
+      for index in range(field_count):
+        key_code = length_format.unpack (read_bytes (the_file, 4))[0]
+        fields[strings[key_code]] = decode_value (the_file)
+      state = states.setdefault (entity_name, dict())
+      for key, value in changes.items():
+        if (value is removed):
+          del state[key]
+        else:
+          state[key] = value
+      yield ({"time": columnar_events.join_time (
+                whole_ticks, strings[fraction_code], ticks_per_second),
+              "type": strings[type_code], "entity": entity_name,
+              "changes": changes, "fields": fields, "state": state})
+
+# Format the clock for display, as the simulator does.
+def format_time (the_time):
+  return (f'{the_time:07.3f}')
+
+# Format an event for printing: a line with its time, type and entity,
+# then the changes to the entity's state, or its whole state, and the
+# fields.
+def format_event (event, show_state):
+  the_text = format_time (event["time"]) + " " + event["type"]
+  if (event["entity"] != ""):
+    the_text = the_text + " " + event["entity"]
+  the_text = the_text + ":\n"
+  if (show_state and (event["state"] != dict())):
+    the_text = the_text + pprint.pformat (event["state"]) + "\n"
+  elif ((not show_state) and (event["changes"] != dict())):
+    the_text = the_text + pprint.pformat (event["changes"]) + "\n"
+  if (event["fields"] != dict()):
+    the_text = the_text + pprint.pformat (event["fields"]) + "\n"
+  return (the_text)
+
+def main ():
+  parser = argparse.ArgumentParser (
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=('Print, filter and search the binary trace of a ' +
+                 'traffic signal simulation.'),
+    epilog=('Copyright © 2026 by John Sauter' + '\n' +
+            'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+            'see <https://gnu.org/licenses/gpl.html> for the full text ' +
+            'of the license.' + '\n' +
+            'This is free software: ' +
+            'you are free to change and redistribute it. ' + '\n' +
+            'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+            '\n'))
+
+  parser.add_argument ('--version', action='version',
+                       version='binary_trace 0.1 2026-10-19',
+                       help='print the version number and exit')
+  parser.add_argument ('--trace-file', metavar='trace_file', required=True,
+                       help='the binary trace written by simulate_traffic.py')
+  parser.add_argument ('--type', metavar='event_type', action='append',
+                       help='print only events of this type; ' +
+                       'may be given more than once')
+  parser.add_argument ('--entity', metavar='entity_name', action='append',
+                       help='print only events which happened to this ' +
+                       'traffic element or signal face; ' +
+                       'may be given more than once')
+  parser.add_argument ('--start', type=decimal.Decimal, metavar='start',
+                       help='do not print events before this time')
+  parser.add_argument ('--end', type=decimal.Decimal, metavar='end',
+                       help='do not print events after this time')
+  parser.add_argument ('--search', metavar='pattern',
+                       help='print only events whose printed text ' +
+                       'matches this regular expression')
+  parser.add_argument ('--show-state', action='store_true',
+                       help='print the whole state of the entity after ' +
+                       'each event, rather than just what changed')
+  parser.add_argument ('--summary', action='store_true',
+                       help='instead of printing the events, print how ' +
+                       'many there are of each type')
+
+  arguments = vars(parser.parse_args ())
+  event_types = arguments ['type']
+  entity_names = arguments ['entity']
+  start_time = None
+  if (arguments ['start'] != None):
+    start_time = fractions.Fraction (arguments ['start'])
+  end_time = None
+  if (arguments ['end'] != None):
+    end_time = fractions.Fraction (arguments ['end'])
+  pattern = None
+  if (arguments ['search'] != None):
+    pattern = re.compile (arguments ['search'])
+
+  # Every event must be read, even those not printed, to keep the
+  # states up to date.
+  counts = dict()
+  for event in read_trace (arguments ['trace_file']):
+    if ((event_types != None) and (event["type"] not in event_types)):
+      continue
+    if ((entity_names != None) and (event["entity"] not in entity_names)):
+      continue
+    if ((start_time != None) and (event["time"] < start_time)):
+      continue
+    if ((end_time != None) and (event["time"] > end_time)):
+      continue
+    if ((pattern == None) and arguments ['summary']):
+      counts[event["type"]] = counts.get (event["type"], 0) + 1
+      continue
+    the_text = format_event (event, arguments ['show_state'])
+    if ((pattern != None) and (pattern.search (the_text) == None)):
+      continue
+    if (arguments ['summary']):
+      counts[event["type"]] = counts.get (event["type"], 0) + 1
+      continue
+    print (the_text)
+
+  if (arguments ['summary']):
+    for event_type in sorted(counts):
+      print (str(counts[event_type]) + " " + event_type)
+  return
+
+if (__name__ == "__main__"):
+  main ()
+
+# End of file binary_trace.py
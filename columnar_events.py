@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# columnar_events.py writes and reads the events output of the traffic
+# signal simulator in its binary, columnar format.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The file is a sequence of arrays in numpy's .npy format, one after
+# another.  The first names the format and the second holds the number
+# of ticks in a second.  Each time is a whole number of ticks and the
+# fraction of a tick left over, which is almost always zero; see
+# split_time.  The rest of the file is chunks of three arrays: the
+# strings first used in the chunk, then the traffic element events and
+# the lamp events, as numpy record arrays.  Names, lanes, types, tags,
+# travel paths and fractions of a tick are numbers, which index the
+# list of strings built up from the start of the file.  The sequence
+# number of an event is its place among all of the events, so the two
+# kinds can be put back in order.
+#
+# The file is only ever appended to, a chunk at a time, so it can be
+# truncated after any chunk and appended to again, which is how the
+# simulator resumes from a checkpoint.
+
+import os
+import math
+import fractions
+import numpy as np
+
+# The first array in the file.
+format_name = np.array (["simulate_traffic events", "2"])
+
+# The columns of the traffic element events and of the lamp events.
+element_dtype = np.dtype ([("sequence", "i8"), ("time", "i8"),
+                           ("time_fraction", "i4"), ("lane", "i4"),
+                           ("type", "i4"), ("tag", "i4"),
+                           ("name", "i4"), ("position_x", "f8"),
+                           ("position_y", "f8"), ("destination_x", "f8"),
+                           ("destination_y", "f8"), ("orientation", "f8"),
+                           ("length", "f8"), ("speed", "f8"),
+                           ("travel_path", "i4"), ("present", "?")])
+lamp_dtype = np.dtype ([("sequence", "i8"), ("time", "i8"),
+                        ("time_fraction", "i4"), ("signal_face", "i4"),
+                        ("lamp", "i4")])
+
+# Each tick is a millisecond, or a fraction of one if the clock step
+# needs it.
+def ticks_per_second (clock_step):
+  return (math.lcm (1000, fractions.Fraction (clock_step).denominator))
+
+# Split a time into a whole number of ticks and the fraction of a tick
+# left over, as a string, so that every time is kept exactly.  Most
+# times are on a tick, and their fraction is "0", but a timer of
+# variable duration can end between ticks, at a time with many digits.
+# This is the encoding of times in both the events file and the binary
+# trace.
+def split_time (the_time, ticks_per_second):
+  the_ticks = fractions.Fraction (the_time) * ticks_per_second
+  whole_ticks = math.floor (the_ticks)
+  return ((whole_ticks, str(the_ticks - whole_ticks)))
+
+# Put a time split by split_time back together, as an exact fraction.
+def join_time (whole_ticks, tick_fraction, ticks_per_second):
+  if (tick_fraction == "0"):
+    return (fractions.Fraction (whole_ticks, ticks_per_second))
+  return ((whole_ticks + fractions.Fraction (tick_fraction)) /
+          ticks_per_second)
+
+# Write events in chunks of chunk_size.  The writer can be pickled; its
+# file is not, and must be given again with reopen.
+class ColumnarEventsWriter:
+  def __init__ (self, file_name, ticks_per_second, chunk_size=16384):
+    self.ticks_per_second = ticks_per_second
+    self.chunk_size = chunk_size
+    self.codes = dict()
+    self.new_strings = list()
+    self.elements = list()
+    self.lamps = list()
+    self.sequence = 0
+    self.file = open (file_name, "wb")
+    np.save (self.file, format_name)
+    np.save (self.file, np.array ([ticks_per_second], dtype="i8"))
+    return
+
+  def __getstate__ (self):
+    state = dict(self.__dict__)
+    del state["file"]
+    return (state)
+
+  # Continue writing to the file, discarding anything after position.
+  def reopen (self, file_name, position):
+    self.file = open (file_name, "r+b")
+    self.file.seek (position)
+    self.file.truncate ()
+    return
+
+  # Return the number which stands for a string.
+  def code (self, the_string):
+    the_code = self.codes.get (the_string)
+    if (the_code == None):
+      the_code = len(self.codes)
+      self.codes[the_string] = the_code
+      self.new_strings.append (the_string)
+    return (the_code)
+
+  def write_element (self, the_time, lane_name, element_type, tag, name,
+                     position_x, position_y, destination_x, destination_y,
+                     orientation, length, speed, travel_path_name, present):
+    whole_ticks, tick_fraction = split_time (the_time,
+                                             self.ticks_per_second)
+    self.elements.append ((self.sequence, whole_ticks,
+                           self.code (tick_fraction), self.code (lane_name),
+                           self.code (element_type), self.code (tag),
+                           self.code (name),
+                           position_x, position_y, destination_x,
+                           destination_y, orientation, length, speed,
+                           self.code (travel_path_name), present))
+    self.sequence = self.sequence + 1
+    if (len(self.elements) >= self.chunk_size):
+      self.write_chunk ()
+    return
+
+  def write_lamp (self, the_time, signal_face_name, lamp_name):
+    whole_ticks, tick_fraction = split_time (the_time,
+                                             self.ticks_per_second)
+    self.lamps.append ((self.sequence, whole_ticks, self.code (tick_fraction),
+                        self.code (signal_face_name), self.code (lamp_name)))
+    self.sequence = self.sequence + 1
+    if (len(self.lamps) >= self.chunk_size):
+      self.write_chunk ()
+    return
+
+  # Write the events not yet written as a chunk.
+  def write_chunk (self):
+    if ((len(self.elements) == 0) and (len(self.lamps) == 0)):
+      return
+    np.save (self.file, np.array (self.new_strings, dtype=str))
+    np.save (self.file, np.array (self.elements, dtype=element_dtype))
+    np.save (self.file, np.array (self.lamps, dtype=lamp_dtype))
+    self.new_strings.clear()
+    self.elements.clear()
+    self.lamps.clear()
+    return
+
+  def flush (self):
+    self.write_chunk ()
+    self.file.flush()
+    return
+
+  def tell (self):
+    return (self.file.tell())
+
+  def close (self):
+    self.flush ()
+    self.file.close()
+    return
+
+# Does the file hold columnar events, rather than CSV?
+def is_columnar (file_name):
+  with open (file_name, "rb") as the_file:
+    return (the_file.read (6) == b"\x93NUMPY")
+
+# Read a whole file.  Return the number of ticks in a second, the list
+# of strings, and all of the traffic element events and lamp events,
+# each as a single record array.
+def load_columnar_events (file_name):
+  strings = list()
+  element_chunks = list()
+  lamp_chunks = list()
+  with open (file_name, "rb") as the_file:
+    file_size = os.fstat (the_file.fileno()).st_size
+    if (list(np.load (the_file)) != list(format_name)):
+      raise ValueError (str(file_name) + " is not a simulator events file")
+    ticks_per_second = int(np.load (the_file)[0])
+    while (the_file.tell() < file_size):
+      strings.extend (np.load (the_file).tolist())
+      element_chunks.append (np.load (the_file))
+      lamp_chunks.append (np.load (the_file))
+  elements = np.concatenate ([np.zeros (0, dtype=element_dtype)] +
+                             element_chunks)
+  lamps = np.concatenate ([np.zeros (0, dtype=lamp_dtype)] + lamp_chunks)
+  return ((ticks_per_second, strings, elements, lamps))
+
+# Read a file and return its events in order, each as a dictionary
+# with the same keys as the rows of the CSV events file.  Times are
+# exact fractions, and other numbers are fractions equal to what the
+# CSV file would have held.
+def read_columnar_events (file_name):
+  ticks_per_second, strings, elements, lamps = load_columnar_events (
+    file_name)
+  rows = list()
+  for element in elements.tolist():
+    (sequence, whole_ticks, tick_fraction, lane, element_type, tag, name,
+     position_x, position_y, destination_x, destination_y, orientation,
+     length, speed, travel_path, present) = element
+    rows.append ((sequence,
+                  {"time": join_time (whole_ticks, strings[tick_fraction],
+                                      ticks_per_second),
+                   "lane": strings[lane], "type": strings[element_type],
+                   "color": strings[tag], "name": strings[name],
+                   "position_x": fractions.Fraction (repr(position_x)),
+                   "position_y": fractions.Fraction (repr(position_y)),
+                   "destination_x": fractions.Fraction (
+                     repr(destination_x)),
+                   "destination_y": fractions.Fraction (
+                     repr(destination_y)),
+                   "orientation": fractions.Fraction (repr(orientation)),
+                   "length": fractions.Fraction (repr(length)),
+                   "speed": fractions.Fraction (repr(speed)),
+                   "travel path": strings[travel_path],
+                   "present": present}))
+  for lamp in lamps.tolist():
+    sequence, whole_ticks, tick_fraction, signal_face, lamp_name = lamp
+    rows.append ((sequence,
+                  {"time": join_time (whole_ticks, strings[tick_fraction],
+                                      ticks_per_second),
+                   "lane": strings[signal_face], "type": "lamp",
+                   "color": strings[lamp_name], "name": None,
+                   "position_x": None, "position_y": None,
+                   "destination_x": None, "destination_y": None,
+                   "orientation": None, "length": None, "speed": None,
+                   "travel path": None, "present": None}))
+  rows.sort (key=lambda row: row[0])
+  return ([row for sequence, row in rows])
+
+# End of file columnar_events.py
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# event_bus.py carries the events of the traffic signal simulator to
+# the outputs which want them.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# Each kind of event is a class below.  An output subscribes to the
+# kinds it wants, and the simulator makes an event only if some output
+# wants it, so a run with no outputs for a kind of event pays nothing
+# for it.  Subscribers are called in the order they subscribed, while
+# the simulator waits, so an event can refer to a traffic element and
+# a subscriber sees the element as it was when the event happened.
+#
+# Each event can give its type, the name of the traffic element or
+# signal face it happened to, and a dictionary of its other values, for
+# outputs, such as the flight recorder, which take any kind of event.
+
+# A signal face has changed the lamp it shows.
+class LampChange:
+  __slots__ = ("time", "signal_face_name", "lamp_name")
+
+  def __init__ (self, the_time, signal_face_name, lamp_name):
+    self.time = the_time
+    self.signal_face_name = signal_face_name
+    self.lamp_name = lamp_name
+    return
+
+  def event_type (self):
+    return ("lamp")
+
+  def entity_name (self):
+    return (self.signal_face_name)
+
+  def fields (self):
+    return ({"lamp": self.lamp_name})
+
+# Something has happened to a traffic element, named by the tag, such
+# as "stopped" or "blocked".
+class ElementEvent:
+  __slots__ = ("time", "traffic_element", "tag")
+
+  def __init__ (self, the_time, traffic_element, tag):
+    self.time = the_time
+    self.traffic_element = traffic_element
+    self.tag = tag
+    return
+
+  def event_type (self):
+    return (self.tag)
+
+  def entity_name (self):
+    return (self.traffic_element.name)
+
+  def fields (self):
+    return ({"lane": self.traffic_element.current_lane,
+             "position x": self.traffic_element.position_x,
+             "position y": self.traffic_element.position_y,
+             "speed": self.traffic_element.speed,
+             "blocker": self.traffic_element.blocker_name})
+
+# A toggle of a signal face has changed its value.
+class ToggleChange:
+  __slots__ = ("time", "signal_face_name", "toggle_name", "value", "source")
+
+  def __init__ (self, the_time, signal_face_name, toggle_name, value,
+                source):
+    self.time = the_time
+    self.signal_face_name = signal_face_name
+    self.toggle_name = toggle_name
+    self.value = value
+    self.source = source
+    return
+
+  def event_type (self):
+    return ("toggle")
+
+  def entity_name (self):
+    return (self.signal_face_name)
+
+  def fields (self):
+    return ({"toggle": self.toggle_name, "value": self.value,
+             "source": self.source})
+
+# A timer of a signal face has started or completed.  Only a timer
+# which has started has a duration and a reason, which may be empty.
+class TimerEvent:
+  __slots__ = ("time", "signal_face_name", "timer_name", "event",
+               "duration", "reason")
+
+  def __init__ (self, the_time, signal_face_name, timer_name, event,
+                duration=None, reason=None):
+    self.time = the_time
+    self.signal_face_name = signal_face_name
+    self.timer_name = timer_name
+    self.event = event
+    self.duration = duration
+    self.reason = reason
+    return
+
+  def event_type (self):
+    return ("timer " + self.event)
+
+  def entity_name (self):
+    return (self.signal_face_name)
+
+  def fields (self):
+    if (self.event != "started"):
+      return ({"timer": self.timer_name})
+    return ({"timer": self.timer_name, "duration": self.duration,
+             "reason": self.reason})
+
+# A signal face has entered a different state or substate.
+class StateChange:
+  __slots__ = ("time", "signal_face_name", "old_state_name",
+               "old_substate_name", "state_name", "substate_name")
+
+  def __init__ (self, the_time, signal_face_name, old_state_name,
+                old_substate_name, state_name, substate_name):
+    self.time = the_time
+    self.signal_face_name = signal_face_name
+    self.old_state_name = old_state_name
+    self.old_substate_name = old_substate_name
+    self.state_name = state_name
+    self.substate_name = substate_name
+    return
+
+  def event_type (self):
+    return ("state")
+
+  def entity_name (self):
+    return (self.signal_face_name)
+
+  def fields (self):
+    return ({"old state": self.old_state_name,
+             "old substate": self.old_substate_name,
+             "state": self.state_name, "substate": self.substate_name})
+
+# The safety check has found two conflicting signal faces both green.
+class ConflictingGreens:
+  __slots__ = ("time", "signal_face_name", "conflicting_signal_face_name")
+
+  def __init__ (self, the_time, signal_face_name,
+                conflicting_signal_face_name):
+    self.time = the_time
+    self.signal_face_name = signal_face_name
+    self.conflicting_signal_face_name = conflicting_signal_face_name
+    return
+
+  def event_type (self):
+    return ("conflicting greens")
+
+  def entity_name (self):
+    return (self.signal_face_name)
+
+  def fields (self):
+    return ({"conflicting signal face": self.conflicting_signal_face_name})
+
+# All of the kinds of event.
+event_classes = (LampChange, ElementEvent, ToggleChange, TimerEvent,
+                 StateChange, ConflictingGreens)
+
+# The subscribers to each kind of event, indexed by its class.
+class EventBus:
+  def __init__ (self):
+    self.subscribers = dict()
+    return
+
+  # Call subscriber with each event of the kinds given, or of every kind
+  # if none are given.
+  def subscribe (self, subscriber, *event_kinds):
+    if (len(event_kinds) == 0):
+      event_kinds = event_classes
+    for event_kind in event_kinds:
+      self.subscribers.setdefault (event_kind, list()).append (subscriber)
+    return
+
+  # Does any subscriber want events of this kind?  Check before making
+  # the event.
+  def wants (self, event_kind):
+    return (event_kind in self.subscribers)
+
+  def emit (self, event):
+    for subscriber in self.subscribers[type(event)]:
+      subscriber (event)
+    return
+
+# End of file event_bus.py
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# event_database.py records what happens in a traffic signal simulation
+# in an SQLite database, indexed so that the events of a face, a
+# traffic element or a stretch of time can be found without reading
+# all of them.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The database has four tables: lamp changes, traffic element events,
+# toggle changes and timer events.  Times are in seconds.  Every row
+# has a sequence number, its place among all of the rows of all of the
+# tables, so the events can be put back in the order they happened and
+# everything recorded after a checkpoint can be removed when resuming
+# from it.  For example, the lamps shown by signal face C between 412
+# and 460 seconds are
+#
+#   select time, lamp from lamp_changes
+#     where signal_face = 'C' and time between 412 and 460;
+#
+# and the traffic elements blocked by truck 0012 are
+#
+#   select distinct name from element_events
+#     where event = 'blocked' and blocker = 'truck 0012';
+#
+# The last lamp change before the start of a range gives the lamp
+# shown at its start.
+
+import os
+import sqlite3
+
+# The definitions of the tables and their indexes.
+schema = """
+create table lamp_changes (
+  sequence integer primary key, time real, signal_face text, lamp text);
+create table element_events (
+  sequence integer primary key, time real, name text, type text,
+  lane text, event text, travel_path text, position_x real,
+  position_y real, speed real, present integer, blocker text);
+create table toggle_changes (
+  sequence integer primary key, time real, signal_face text,
+  toggle text, value integer, source text);
+create table timer_events (
+  sequence integer primary key, time real, signal_face text,
+  timer text, event text, duration real, reason text);
+create index lamp_changes_face on lamp_changes (signal_face, time);
+create index lamp_changes_time on lamp_changes (time);
+create index element_events_name on element_events (name, time);
+create index element_events_time on element_events (time);
+create index element_events_blocker on element_events (blocker);
+create index toggle_changes_face on toggle_changes (signal_face, time);
+create index toggle_changes_time on toggle_changes (time);
+create index timer_events_face on timer_events (signal_face, time);
+create index timer_events_time on timer_events (time);
+"""
+
+# The number of columns in each table.
+table_widths = {"lamp_changes": 4, "element_events": 12,
+                "toggle_changes": 6, "timer_events": 7}
+
+# Record events in the database, inserting them in one transaction for
+# each chunk_size events.  Like an output file, the database has a
+# position, which is the number of events recorded.  The recorder can
+# be pickled; its connection is not, and must be made again with
+# reopen.
+class EventDatabase:
+  def __init__ (self, file_name, chunk_size=10000):
+    self.chunk_size = chunk_size
+    self.sequence = 0
+    self.pending = {table_name: list() for table_name in table_widths}
+    self.pending_count = 0
+    if (os.path.exists (file_name)):
+      os.remove (file_name)
+    self.connection = sqlite3.connect (file_name)
+    self.connection.executescript (schema)
+    self.connection.commit()
+    return
+
+  def __getstate__ (self):
+    state = dict(self.__dict__)
+    del state["connection"]
+    return (state)
+
+  # Continue recording in the database, discarding any events recorded
+  # after position.
+  def reopen (self, file_name, position):
+    self.connection = sqlite3.connect (file_name)
+    with self.connection:
+      for table_name in table_widths:
+        self.connection.execute ("delete from " + table_name +
+                                 " where sequence >= ?", (position,))
+    return
+
+  # Add a row to a table, after the sequence number.
+  def add (self, table_name, row):
+    self.pending[table_name].append ((self.sequence,) + row)
+    self.sequence = self.sequence + 1
+    self.pending_count = self.pending_count + 1
+    if (self.pending_count >= self.chunk_size):
+      self.flush ()
+    return
+
+  def add_lamp_change (self, the_time, signal_face_name, lamp_name):
+    self.add ("lamp_changes", (float(the_time), signal_face_name,
+                               lamp_name))
+    return
+
+  def add_element_event (self, the_time, traffic_element, event):
+    self.add ("element_events",
+              (float(the_time), traffic_element.name, traffic_element.type,
+               traffic_element.current_lane, event,
+               traffic_element.travel_path_name,
+               float(traffic_element.position_x),
+               float(traffic_element.position_y),
+               float(traffic_element.speed), traffic_element.present,
+               traffic_element.blocker_name))
+    return
+
+  def add_toggle_change (self, the_time, signal_face_name, toggle_name,
+                         value, source):
+    if (source == ""):
+      source = None
+    self.add ("toggle_changes", (float(the_time), signal_face_name,
+                                 toggle_name, value, source))
+    return
+
+  def add_timer_event (self, the_time, signal_face_name, timer_name,
+                       event, duration=None, reason=None):
+    if (duration != None):
+      duration = float(duration)
+    if (reason == ""):
+      reason = None
+    self.add ("timer_events", (float(the_time), signal_face_name,
+                               timer_name, event, duration, reason))
+    return
+
+  # Insert the events not yet inserted, in a single transaction.
+  def flush (self):
+    if (self.pending_count == 0):
+      return
+    with self.connection:
+      for table_name in table_widths:
+        rows = self.pending[table_name]
+        if (len(rows) > 0):
+          self.connection.executemany (
+            "insert into " + table_name + " values (" +
+            ", ".join(["?"] * table_widths[table_name]) + ")", rows)
+          rows.clear()
+    self.pending_count = 0
+    return
+
+  def tell (self):
+    return (self.sequence)
+
+  def close (self):
+    self.flush ()
+    self.connection.close()
+    return
+
+# End of file event_database.py
@@ -0,0 +1,469 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# optimize_timing.py searches for the timer durations and waiting limits
+# of an intersection which give the best traffic flow.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The intersection file is one written by define_four_corners.py or
+# another of the define scripts.  The arguments after -- are passed to
+# simulate_traffic.py, and describe the traffic, with a script or an
+# arrivals file and a duration; they must not include an intersection
+# file, since the optimizer supplies one for each point it tries.
+#
+# Each parameter sets one timer, or the waiting limit, of a group of
+# signal faces.  Unless a parameters file is given, the signal faces
+# which share a value for a timer share a parameter, which may range
+# from half to twice that value.  A parameters file is a JSON list:
+#
+# [{"name": "through minimum green", "timer": "Minimum Green",
+#   "signal faces": ["B", "D", "F", "H"],
+#   "low": 6, "high": 20, "step": 2},
+#  {"name": "waiting limit", "timer": "waiting limit",
+#   "signal faces": ["A", "B", "C", "D", "E", "F", "G", "H"],
+#   "low": 30, "high": 120, "step": 15}]
+#
+# The search starts from the values in the intersection file and moves
+# a step up or down in each parameter.  All of the neighbours of the
+# current point are simulated in parallel, and the best of them becomes
+# the current point if it improves the objective.  If none does, the
+# steps are halved, until they are smaller than the resolution or the
+# budget of simulations runs out.
+#
+# Every simulation's statistics are kept in evaluations.json in the
+# results directory, so running the optimizer again, perhaps with a
+# larger budget or a different objective, simulates only new points.
+
+import os
+import sys
+import io
+import math
+import time
+import copy
+import hashlib
+import traceback
+import contextlib
+import multiprocessing
+import pathlib
+import json
+import argparse
+
+from sweep_scenarios import resolve_inputs
+
+# The timers whose durations are searched unless a parameters file
+# says otherwise.
+tuned_timer_names = ("Minimum Green", "Passage", "Maximum Green",
+                     "Yellow Change", "Red Clearance", "waiting limit")
+
+# Convert the statistics of a simulation into the objective, which is
+# to be made as small as possible.
+def mean_delay_objective (statistics):
+  return (float(statistics["mean_delay"]))
+
+def max_wait_objective (statistics):
+  return (max([float(wait_time) for wait_time in
+               statistics["max_wait_times"].values()], default=0.0))
+
+def p95_wait_objective (statistics):
+  return (max([wait["wait"]["p95"] for wait in
+               statistics["distributions"]["signal faces"].values()
+               if (wait["wait"]["count"] > 0)], default=0.0))
+
+def throughput_objective (statistics):
+  return (-float(statistics["exit_count"]))
+
+objectives = {"mean-delay": mean_delay_objective,
+              "max-wait": max_wait_objective,
+              "p95-wait": p95_wait_objective,
+              "throughput": throughput_objective}
+
+# Each worker imports the simulator once and keeps it for all of the
+# points it evaluates.
+def start_worker ():
+  global simulate_traffic
+  import simulate_traffic
+  return
+
+# Simulate one point in a worker.  Return its key and either its
+# statistics or a description of what went wrong.
+def run_point (point):
+  key, intersection, the_arguments, point_directory = point
+  point_directory.mkdir (parents=True, exist_ok=True)
+  intersection_file_name = point_directory / "intersection.json"
+  with open (intersection_file_name, "w") as intersection_file:
+    json.dump (intersection, intersection_file, indent=2)
+  original_directory = os.getcwd()
+  console_file = open (point_directory / "console.txt", "w")
+  try:
+    os.chdir (point_directory)
+    with (contextlib.redirect_stdout (console_file),
+          contextlib.redirect_stderr (console_file)):
+      outcome = simulate_traffic.main (
+        the_arguments + ["--intersection-file", str(intersection_file_name)])
+    if (outcome["error_count"] > 0):
+      outcome = {"error": str(outcome["error_count"]) + " errors"}
+  except (Exception, SystemExit) as the_exception:
+    outcome = {"error": repr(the_exception)}
+    console_file.write (traceback.format_exc())
+  finally:
+    os.chdir (original_directory)
+    console_file.close()
+  return ((key, outcome))
+
+# Find the timer of a signal face by name.
+def find_timer (signal_face, timer_name):
+  for timer in signal_face["timers"]:
+    if (timer["name"] == timer_name):
+      return (timer)
+  return (None)
+
+# Return the value of a parameter for a signal face, or None if the
+# signal face does not have it or its duration is unlimited.
+def face_value (signal_face, timer_name):
+  if (timer_name == "waiting limit"):
+    return (signal_face.get ("waiting limit"))
+  timer = find_timer (signal_face, timer_name)
+  if ((timer == None) or (timer["duration"][0] == "inf")):
+    return (None)
+  return (float(timer["duration"][0]))
+
+# Build the default parameters: the signal faces which share a value
+# for a timer share a parameter.
+def default_parameters (intersection):
+  parameters = list()
+  for timer_name in tuned_timer_names:
+    groups = dict()
+    for signal_face in intersection["signal faces"]:
+      value = face_value (signal_face, timer_name)
+      if ((value != None) and (value > 0)):
+        groups.setdefault (value, list()).append (signal_face["name"])
+    for value in sorted(groups):
+      parameters.append ({"name": (timer_name + " " +
+                                   "".join(groups[value])),
+                          "timer": timer_name,
+                          "signal faces": groups[value],
+                          "low": value / 2, "high": value * 2,
+                          "step": value / 4})
+  return (parameters)
+
+# The value of a parameter in the intersection as given.  If its
+# signal faces disagree, the first one is used.
+def starting_value (intersection, parameter):
+  for signal_face in intersection["signal faces"]:
+    if (signal_face["name"] in parameter["signal faces"]):
+      value = face_value (signal_face, parameter["timer"])
+      if (value != None):
+        return (min(max(value, parameter["low"]), parameter["high"]))
+  return (parameter["low"])
+
+# Return a copy of the intersection with the parameters set to the
+# given values.  The maximum of a variable duration is its first
+# element, so that is the one replaced.
+def apply_values (intersection, parameters, values):
+  new_intersection = copy.deepcopy (intersection)
+  for parameter, value in zip (parameters, values):
+    for signal_face in new_intersection["signal faces"]:
+      if (signal_face["name"] not in parameter["signal faces"]):
+        continue
+      if (parameter["timer"] == "waiting limit"):
+        signal_face["waiting limit"] = value
+      else:
+        timer = find_timer (signal_face, parameter["timer"])
+        if (timer != None):
+          timer["duration"] = [f'{value:.3f}'] + timer["duration"][1:]
+  return (new_intersection)
+
+# Values are kept to the millisecond, like the simulator's clock, so
+# the same point always has the same key.
+def point_key (values):
+  return (",".join(f'{value:.3f}' for value in values))
+
+# The neighbours of a point, a step up and a step down in each
+# parameter, staying within the bounds.
+def neighbours (parameters, values, steps):
+  result = list()
+  for index, parameter in enumerate(parameters):
+    for direction in (-1, 1):
+      value = round(min(max(values[index] + direction * steps[index],
+                            parameter["low"]), parameter["high"]), 3)
+      if (value != values[index]):
+        new_values = list(values)
+        new_values[index] = value
+        result.append (new_values)
+  return (result)
+
+# Read the evaluations of earlier runs, unless they were made with a
+# different intersection, parameters or simulator arguments.
+def read_evaluations (evaluations_file_name, signature):
+  try:
+    with open (evaluations_file_name, "r") as evaluations_file:
+      evaluations = json.load (evaluations_file)
+  except (OSError, ValueError):
+    return (dict())
+  if (evaluations.get ("signature") != signature):
+    return (dict())
+  return (evaluations["points"])
+
+# Write the evaluations, replacing the previous file only when the new
+# one is complete.
+def write_evaluations (evaluations_file_name, signature, points):
+  partial_file_name = str(evaluations_file_name) + ".partial"
+  with open (partial_file_name, "w") as evaluations_file:
+    json.dump ({"signature": signature, "points": points},
+               evaluations_file, indent=2)
+    evaluations_file.write ("\n")
+  os.replace (partial_file_name, evaluations_file_name)
+  return
+
+def main ():
+  global error_counter
+
+  parser = argparse.ArgumentParser (
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=('Search for the timer durations which make an ' +
+                 'intersection work best.'),
+    epilog=('Copyright © 2026 by John Sauter' + '\n' +
+            'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+            'see <https://gnu.org/licenses/gpl.html> for the full text ' +
+            'of the license.' + '\n' +
+            'This is free software: ' +
+            'you are free to change and redistribute it. ' + '\n' +
+            'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+            '\n'))
+
+  parser.add_argument ('--version', action='version',
+                       version='optimize_timing 0.1 2026-10-19',
+                       help='print the version number and exit')
+  parser.add_argument ('--intersection-file', metavar='intersection_file',
+                       required=True,
+                       help='the intersection whose timing is optimized')
+  parser.add_argument ('--results-directory', metavar='results_directory',
+                       required=True,
+                       help='write the output of each simulation into a ' +
+                       'subdirectory of this directory')
+  parser.add_argument ('--output-file', metavar='output_file',
+                       help='write the best intersection found here, ' +
+                       'default is best_intersection.json in the results ' +
+                       'directory')
+  parser.add_argument ('--parameters-file', metavar='parameters_file',
+                       help='JSON list of the parameters to search, ' +
+                       'default is every timer which affects the flow')
+  parser.add_argument ('--objective', choices=sorted(objectives),
+                       help='what to optimize: mean-delay (the default), ' +
+                       'max-wait, the longest wait at any signal face, ' +
+                       'p95-wait, the largest 95th percentile wait at a ' +
+                       'signal face, or throughput, the number of ' +
+                       'traffic elements which leave')
+  parser.add_argument ('--budget', type=int, metavar='budget',
+                       help='the most simulations to run, default 100')
+  parser.add_argument ('--time-limit', type=float, metavar='time_limit',
+                       help='start no more simulations after this many ' +
+                       'seconds')
+  parser.add_argument ('--resolution', type=float, metavar='resolution',
+                       help='stop when the steps are smaller than this ' +
+                       'many seconds, default 0.1')
+  parser.add_argument ('--jobs', type=int, metavar='jobs',
+                       help='number of simulations to run at once, ' +
+                       'default is the number of processors')
+  parser.add_argument ('--verbose', type=int, metavar='verbosity_level',
+                       help='control the amount of output from the ' +
+                       'program: 1 is normal, 0 suppresses summary messages')
+  parser.add_argument ('simulator_arguments', nargs=argparse.REMAINDER,
+                       help='arguments for simulate_traffic.py, after --')
+
+  arguments = vars(parser.parse_args ())
+  intersection_file_name = pathlib.Path(
+    arguments ['intersection_file']).resolve()
+  results_directory = pathlib.Path(arguments ['results_directory']).resolve()
+  output_file_name = results_directory / "best_intersection.json"
+  if (arguments ['output_file'] != None):
+    output_file_name = pathlib.Path(arguments ['output_file']).resolve()
+  objective_name = "mean-delay"
+  if (arguments ['objective'] != None):
+    objective_name = arguments ['objective']
+  objective = objectives[objective_name]
+  budget = 100
+  if (arguments ['budget'] != None):
+    budget = arguments ['budget']
+  time_limit = math.inf
+  if (arguments ['time_limit'] != None):
+    time_limit = arguments ['time_limit']
+  resolution = 0.1
+  if (arguments ['resolution'] != None):
+    resolution = arguments ['resolution']
+  jobs = os.cpu_count()
+  if (arguments ['jobs'] != None):
+    jobs = arguments ['jobs']
+  verbosity_level = 1
+  if (arguments ['verbose'] != None):
+    verbosity_level = arguments ['verbose']
+
+  with open (intersection_file_name, "r") as intersection_file:
+    intersection = json.load (intersection_file)
+  if (arguments ['parameters_file'] != None):
+    with open (arguments ['parameters_file'], "r") as parameters_file:
+      parameters = json.load (parameters_file)
+  else:
+    parameters = default_parameters (intersection)
+  for parameter in parameters:
+    if (not (0 <= parameter["low"] <= parameter["high"])):
+      parser.error ("parameter " + parameter["name"] + " has bad bounds")
+    if (parameter["step"] <= 0):
+      parser.error ("parameter " + parameter["name"] + " has a bad step")
+
+  # Check the simulator's arguments before running anything.
+  import simulate_traffic
+  simulator_arguments = arguments ['simulator_arguments']
+  if ((len(simulator_arguments) > 0) and (simulator_arguments[0] == "--")):
+    simulator_arguments = simulator_arguments[1:]
+  simulator_arguments = resolve_inputs (simulator_arguments,
+                                        pathlib.Path.cwd())
+  try:
+    with contextlib.redirect_stderr (io.StringIO()) as error_text:
+      simulator_options = vars(simulate_traffic.parser.parse_args (
+        simulator_arguments))
+  except SystemExit:
+    parser.error ("invalid simulator arguments: " +
+                  (error_text.getvalue().strip().splitlines() + [""])[-1])
+  if (simulator_options ['intersection_file'] != None):
+    parser.error ("the simulator arguments must not name an " +
+                  "intersection file")
+
+  # The evaluations of earlier runs can be used only if they simulated
+  # the same traffic through the same intersection, with the same
+  # simulator.
+  signature_hash = hashlib.sha256 ()
+  simulate_traffic.hash_simulator_source (signature_hash)
+  with open (intersection_file_name, "rb") as intersection_file:
+    signature_hash.update (intersection_file.read())
+  signature_hash.update (json.dumps ([parameters, simulator_arguments],
+                                     sort_keys=True).encode())
+  signature = signature_hash.hexdigest()
+  results_directory.mkdir (parents=True, exist_ok=True)
+  evaluations_file_name = results_directory / "evaluations.json"
+  evaluations = read_evaluations (evaluations_file_name, signature)
+
+  # The objective of a point, which is infinite if its simulation
+  # failed, so it is never chosen.
+  def point_objective (key):
+    if ("error" in evaluations[key]):
+      return (math.inf)
+    return (objective (evaluations[key]))
+
+  # Simulate, in parallel, those of the given points which have not
+  # been simulated before, as far as the budget allows.
+  def evaluate (points):
+    nonlocal simulation_count
+    new_points = list()
+    for values in points:
+      key = point_key (values)
+      if ((key not in evaluations) and
+          (key not in [new_key for new_key, new_values in new_points])):
+        new_points.append ((key, values))
+    new_points = new_points[:budget - simulation_count]
+    tasks = [(key, apply_values (intersection, parameters, values),
+              simulator_arguments,
+              results_directory / ("point_" + key.replace (",", "_")))
+             for key, values in new_points]
+    for key, outcome in pool.imap (run_point, tasks):
+      evaluations[key] = outcome
+      simulation_count = simulation_count + 1
+      if ((verbosity_level >= 2) and ("error" in outcome)):
+        print ("Point " + key + " failed: " + outcome["error"])
+    if (len(tasks) > 0):
+      write_evaluations (evaluations_file_name, signature, evaluations)
+    return
+
+  error_counter = 0
+  start_clock = time.monotonic()
+  simulation_count = 0
+  values = [round(starting_value (intersection, parameter), 3)
+            for parameter in parameters]
+  steps = [parameter["step"] for parameter in parameters]
+  with multiprocessing.Pool (processes=max(jobs, 1),
+                             initializer=start_worker) as pool:
+    evaluate ([values])
+    if (point_key (values) not in evaluations):
+      parser.error ("the budget does not allow any simulations")
+    if (point_objective (point_key (values)) == math.inf):
+      print ("The starting point failed: " +
+             evaluations[point_key (values)]["error"])
+      error_counter = error_counter + 1
+    while ((error_counter == 0) and
+           (max(steps, default=0) >= resolution)):
+      candidates = neighbours (parameters, values, steps)
+      evaluate (candidates)
+      evaluated = [candidate for candidate in candidates
+                   if (point_key (candidate) in evaluations)]
+      best = min(evaluated, default=None,
+                 key=lambda candidate: point_objective (
+                   point_key (candidate)))
+      if ((best != None) and
+          (point_objective (point_key (best)) <
+           point_objective (point_key (values)))):
+        values = best
+        if (verbosity_level >= 2):
+          print ("Moved to " + point_key (values) + ", objective " +
+                 f'{point_objective (point_key (values)):.3f}' + ".")
+      elif (len(evaluated) < len(candidates)):
+        # Some neighbours could not be simulated within the budget.
+        break
+      else:
+        steps = [step / 2 for step in steps]
+      if ((simulation_count >= budget) or
+          (time.monotonic() - start_clock > time_limit)):
+        break
+
+  # Write the best intersection found, and a description of it.
+  best_key = point_key (values)
+  with open (output_file_name, "w") as output_file:
+    json.dump (apply_values (intersection, parameters, values), output_file,
+               indent=2)
+  with open (results_directory / "best.json", "w") as best_file:
+    json.dump ({"objective": objective_name,
+                "value": point_objective (best_key),
+                "converged": max(steps, default=0) < resolution,
+                "simulations": simulation_count,
+                "parameters": {parameter["name"]: value for parameter, value
+                               in zip (parameters, values)},
+                "statistics": evaluations[best_key]}, best_file, indent=2)
+    best_file.write ("\n")
+
+  if (verbosity_level >= 1):
+    print ("Ran " + str(simulation_count) + " simulations in " +
+           f'{time.monotonic() - start_clock:.1f}' + " seconds; " +
+           objective_name + " is " +
+           f'{point_objective (best_key):.3f}' + " with")
+    for parameter, value in zip (parameters, values):
+      print (f'{parameter["name"]:>30}: {value:8.3f}')
+  if (error_counter > 0):
+    print ("Encountered " + str(error_counter) + " errors.")
+    sys.exit (1)
+  return
+
+if (__name__ == "__main__"):
+  main ()
+
+# End of file optimize_timing.py
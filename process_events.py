@@ -41,6 +41,8 @@ import pathlib
 import json
 import argparse
 
+import columnar_events
+
 parser = argparse.ArgumentParser (
   formatter_class=argparse.RawDescriptionHelpFormatter,
   description=('Render the output of the traffic signal simulator.'),
@@ -181,73 +183,79 @@ events = dict()
 
 latest_time = fractions.Fraction(0)
 
+# Read the events file, in either of the formats the simulator writes.
+def read_events (events_file_name):
+  if (columnar_events.is_columnar (events_file_name)):
+    yield from columnar_events.read_columnar_events (events_file_name)
+  else:
+    with open (events_file_name, 'r') as events_file:
+      yield from csv.DictReader (events_file)
+
 if (do_events_input):
-  with open (events_file_name, 'r') as events_file:
-    reader = csv.DictReader (events_file)
-    for row in reader:
+  for row in read_events (events_file_name):
 
-      if (do_trace):
-        trace_file.write ("Reading a row from the CSV file:\n")
-        pprint.pprint (row, trace_file)
-        
-      the_time = fractions.Fraction (row['time'])
-      if (the_time > latest_time):
-        latest_time = the_time
-      if (the_time not in events):
-        events[the_time] = list()
-      events_list = events[the_time]
-      the_lane_name = row['lane']
-      the_type = row['type']
-      the_color = row['color']
-      the_name = row['name']
-      position_x = row['position_x']
-      if (position_x != None):
-        position_x = fractions.Fraction(position_x)
-      position_y = row['position_y']
-      if (position_y != None):
-        position_y = fractions.Fraction(position_y)
-      destination_x = row['destination_x']
-      if (destination_x != None):
-        destination_x = fractions.Fraction(destination_x)
-      destination_y = row['destination_y']
-      if (destination_y != None):
-        destination_y = fractions.Fraction(destination_y)
-      orientation = row['orientation']
-      if (orientation != None):
-        orientation = float(fractions.Fraction(orientation))
-      the_length = row['length']
-      if (the_length != None):
-        the_length = fractions.Fraction(the_length)
-      the_speed = row['speed']
-      if (the_speed != None):
-        the_speed = fractions.Fraction(the_speed)
-      the_travel_path_name = row['travel path']
-      the_presence = row['present']
-      match the_presence:
-        case "True":
-          the_presence = True
-        case "False":
-          the_presence = False
-
-      the_event = dict()
-      the_event["time"] = the_time
-      the_event["name"] = the_name
-      the_event["lane name"] = the_lane_name
-      the_event["type"] = the_type
-      the_event["color"] = the_color
-      the_event["counter"] = None
-      the_event["position x"] = position_x
-      the_event["position y"] = position_y
-      the_event["destination x"] = destination_x
-      the_event["destination y"] = destination_y
-      the_event["orientation"] = orientation
-      the_event["length"] = the_length
-      the_event["speed"] = the_speed
-      the_event["travel path"] = the_travel_path_name
-      the_event["present"] = the_presence
-      the_event["source"] = "script"
+    if (do_trace):
+      trace_file.write ("Reading a row from the CSV file:\n")
+      pprint.pprint (row, trace_file)
       
-      events_list.append(the_event)
+    the_time = fractions.Fraction (row['time'])
+    if (the_time > latest_time):
+      latest_time = the_time
+    if (the_time not in events):
+      events[the_time] = list()
+    events_list = events[the_time]
+    the_lane_name = row['lane']
+    the_type = row['type']
+    the_color = row['color']
+    the_name = row['name']
+    position_x = row['position_x']
+    if (position_x != None):
+      position_x = fractions.Fraction(position_x)
+    position_y = row['position_y']
+    if (position_y != None):
+      position_y = fractions.Fraction(position_y)
+    destination_x = row['destination_x']
+    if (destination_x != None):
+      destination_x = fractions.Fraction(destination_x)
+    destination_y = row['destination_y']
+    if (destination_y != None):
+      destination_y = fractions.Fraction(destination_y)
+    orientation = row['orientation']
+    if (orientation != None):
+      orientation = float(fractions.Fraction(orientation))
+    the_length = row['length']
+    if (the_length != None):
+      the_length = fractions.Fraction(the_length)
+    the_speed = row['speed']
+    if (the_speed != None):
+      the_speed = fractions.Fraction(the_speed)
+    the_travel_path_name = row['travel path']
+    the_presence = row['present']
+    match the_presence:
+      case "True":
+        the_presence = True
+      case "False":
+        the_presence = False
+
+    the_event = dict()
+    the_event["time"] = the_time
+    the_event["name"] = the_name
+    the_event["lane name"] = the_lane_name
+    the_event["type"] = the_type
+    the_event["color"] = the_color
+    the_event["counter"] = None
+    the_event["position x"] = position_x
+    the_event["position y"] = position_y
+    the_event["destination x"] = destination_x
+    the_event["destination y"] = destination_y
+    the_event["orientation"] = orientation
+    the_event["length"] = the_length
+    the_event["speed"] = the_speed
+    the_event["travel path"] = the_travel_path_name
+    the_event["present"] = the_presence
+    the_event["source"] = "script"
+    
+    events_list.append(the_event)
 
 # Run the animation for one second after the last event
 # unless the duration is specified.
@@ -0,0 +1,446 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# render_table.py writes the LaTeX table of a traffic signal simulation
+# from the table log the simulator recorded.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The table log has a line for every event which could appear in the
+# table, whatever the table level, its start and end times and the
+# options that control its detail.  Each line is a JSON object with
+# the time of the event as an exact fraction, the table level of the
+# event, the lane or signal face, the text of the row and whether the
+# event is important, for --only-important.  A row which ends with the
+# green lists also has the names in each list, and a state transition
+# has its old and new states and substates, and the conditions of the
+# exit taken, in place of text.  The simulator writes its own table
+# with the same code, so a table rendered from the log is the same as
+# one the simulator would have written with the same options.
+#
+# A long table can be split into chunks, each its own longtable in its
+# own file, with at most a given number of rows or covering at most a
+# given number of seconds.  The table file is then an index, which
+# inputs the chunks in order, and a document can input either the
+# index or just the chunks it needs.
+
+import os
+import decimal
+import fractions
+import json
+import argparse
+
+# Format the clock for display, as the simulator does.
+def format_time (the_time):
+  return (f'{the_time:07.3f}')
+
+def cap_first_letter (the_string):
+  return (the_string[0].upper() + the_string[1:])
+
+# The start and end of the LaTeX longtable.  A chunk after the first
+# continues the table, so it keeps the table's number and is left out
+# of the list of tables.
+def table_header (table_caption, continued=False):
+  if (continued):
+    return ("\\addtocounter{table}{-1}\n" +
+            "\\begin{longtable}{c | P{1.00cm} | p{9.25cm}}\n" +
+            "  \\caption[]{" + table_caption + " continued} \\\\\n" +
+            "  Time & Lane & Event \\endfirsthead \n" +
+            "  \\caption[]{" + table_caption + " continued} \\\\\n" +
+            "  Time & Lane & Events \\endhead \n")
+  return ("\\begin{longtable}{c | P{1.00cm} | p{9.25cm}}\n" +
+          "  \\caption{" + table_caption + "} \\\\\n" +
+          "  Time & Lane & Event \\endfirsthead \n" +
+          "  \\caption{" + table_caption + " continued} \\\\\n" +
+          "  Time & Lane & Events \\endhead \n")
+
+def table_footer ():
+  return ("\\hline \\end{longtable}\n")
+
+# Format one of the green lists, given the names of its signal faces,
+# if requested.
+def format_list (the_names, list_name, extra_text, show_green_lists):
+  if (not show_green_lists):
+    return ("")
+
+  if (len(the_names) == 0):
+    return (list_name + " is empty.")
+
+  if (len(the_names) == 1):
+    return (list_name + extra_text + the_names[0] + ". ")
+
+  if (len(the_names) == 2):
+    return (list_name + extra_text + the_names[0] + " and " +
+            the_names[1] + ". ")
+
+  return (list_name + extra_text + ", ".join(the_names[:-1]) + ", and " +
+          the_names[-1] + ". ")
+
+# Format the three green lists: requesting green, requesting clearance
+# and turned green early.
+def format_lists (green_lists, show_green_lists):
+  return (format_list (green_lists[0], "List Requesting Green",
+                       " contains ", show_green_lists) + " " +
+          format_list (green_lists[1], "List Requesting Clearance",
+                       " contains ", show_green_lists) + " " +
+          format_list (green_lists[2], "List Turned Green Early",
+                       " contains ", show_green_lists))
+
+# Describe a state transition.  If no description is needed return the
+# empty string.  The conditions of the exit are lists of the kind of
+# condition, the toggle or timer it tests and whether that is
+# important; they are None if the transition did not take an exit.
+def describe_transition (transition, show_substates,
+                         explain_state_transitions, only_important):
+  old_state_name = transition["old state"]
+  old_substate_name = transition["old substate"]
+  state_name = transition["state"]
+  substate_name = transition["substate"]
+  if (show_substates):
+    if ((old_state_name == state_name) and
+        (old_substate_name == substate_name)):
+      return ("")
+  else:
+    if (old_state_name == state_name):
+      return ("")
+
+  if (len(old_state_name) == 0):
+    description = "enter state " + state_name
+    if (show_substates):
+      description = description + " substate " + substate_name
+  else:
+    description = "transition from state " + old_state_name
+    if (show_substates):
+      description = description + " substate " + old_substate_name
+    description = description + " to state " + state_name
+    if (show_substates):
+      description = description + " substate " + substate_name
+
+  conditions = transition["conditions"]
+  if ((not explain_state_transitions) or (conditions == None)):
+    return (description)
+
+  description = description + " because"
+  first_condition = True
+  for condition_kind, condition_name, important in conditions:
+    if (only_important and (not important)):
+      continue
+    if (first_condition):
+      first_condition = False
+    else:
+      description = description + " and"
+    match condition_kind:
+      case "toggle is true":
+        description = description + " toggle " + condition_name + " is true"
+      case "toggle is false":
+        description = (description + " toggle " + condition_name +
+                       " is false")
+      case "timer is completed":
+        description = (description + " timer " + condition_name +
+                       " has completed")
+      case "timer not complete":
+        description = (description + " timer " + condition_name +
+                       " has not completed")
+  return (description)
+
+# Build an entry of the table log.
+def table_entry (the_time, the_level, lane_name, the_text, important=True,
+                 green_lists=None, transition=None):
+  entry = {"time": the_time, "level": the_level, "lane": lane_name,
+           "text": the_text, "important": important}
+  if (green_lists != None):
+    entry["lists"] = green_lists
+  if (transition != None):
+    entry["transition"] = transition
+  return (entry)
+
+# Convert an entry to a line of the table log, and back.
+def format_entry (entry):
+  line_entry = dict(entry)
+  line_entry["time"] = str(entry["time"])
+  return (json.dumps (line_entry) + "\n")
+
+def parse_entry (the_line):
+  entry = json.loads (the_line)
+  entry["time"] = fractions.Fraction (entry["time"])
+  return (entry)
+
+# Choose the rows of the table from the entries of the table log and
+# format them.  A row shows its time only if it differs from the time
+# of the row before, so the renderer remembers that time; it can be
+# pickled with the simulator.
+class TableRenderer:
+  def __init__ (self, table_level=0,
+                table_start_time=decimal.Decimal ('-1.000'),
+                table_end_time=decimal.Decimal ('Infinity'),
+                only_important=False, show_substates=False,
+                show_green_lists=False, explain_state_transitions=False):
+    self.table_level = table_level
+    self.table_start_time = table_start_time
+    self.table_end_time = table_end_time
+    self.only_important = only_important
+    self.show_substates = show_substates
+    self.show_green_lists = show_green_lists
+    self.explain_state_transitions = explain_state_transitions
+    self.previous_time = None
+    return
+
+  # Does the table show events of this level at this time?
+  def shows (self, the_level, the_time):
+    if (the_level > self.table_level):
+      return False
+    if (the_time <= self.table_start_time):
+      return False
+    if (the_time > self.table_end_time):
+      return False
+    return True
+
+  # Return the row of the table for an entry, or None if the table
+  # does not show it.
+  def render (self, entry):
+    if (not self.shows (entry["level"], entry["time"])):
+      return (None)
+    if (self.only_important and (not entry["important"])):
+      return (None)
+    the_text = entry["text"]
+    if ("transition" in entry):
+      description = describe_transition (entry["transition"],
+                                         self.show_substates,
+                                         self.explain_state_transitions,
+                                         self.only_important)
+      if (len(description) == 0):
+        return (None)
+      the_text = " " + cap_first_letter (description) + ". "
+    if ("lists" in entry):
+      the_text = the_text + format_lists (entry["lists"],
+                                          self.show_green_lists)
+    if (entry["time"] == self.previous_time):
+      time_text = " "
+    else:
+      time_text = format_time (entry["time"])
+      self.previous_time = entry["time"]
+    return ("\\hline " + time_text + " & " + entry["lane"] + " &" +
+            the_text + "\\\\\n")
+
+# Write a table in chunks.  The rows of the chunk being built are kept
+# in memory, and written to its file, along with the line of the index
+# which inputs it, when the chunk is full, so the files on disk only
+# ever hold whole chunks.  The chunk files are named after the index
+# file, with the number of the chunk added.  The writer can be pickled,
+# with the rows of its chunk; the index file is not, and must be given
+# again with reopen.
+class ChunkedTableWriter:
+  def __init__ (self, file_name, table_caption, chunk_rows=None,
+                chunk_seconds=None):
+    self.file_name = file_name
+    self.table_caption = table_caption
+    self.chunk_rows = chunk_rows
+    self.chunk_seconds = chunk_seconds
+    self.chunk_count = 0
+    self.rows = list()
+    self.chunk_start_time = None
+    self.index_file = open (file_name, "w")
+    return
+
+  def __getstate__ (self):
+    state = dict(self.__dict__)
+    del state["index_file"]
+    return (state)
+
+  # Continue writing the index, discarding anything after position, and
+  # remove any chunk files written after it.
+  def reopen (self, file_name, position):
+    self.file_name = file_name
+    self.index_file = open (file_name, "r+")
+    self.index_file.seek (position)
+    self.index_file.truncate ()
+    chunk_number = self.chunk_count + 1
+    while (os.path.exists (self.chunk_file_name (chunk_number))):
+      os.remove (self.chunk_file_name (chunk_number))
+      chunk_number = chunk_number + 1
+    return
+
+  def chunk_file_name (self, chunk_number):
+    return (os.path.splitext (self.file_name)[0] +
+            f'_{chunk_number:04d}' + os.path.splitext (self.file_name)[1])
+
+  # Should the chunk be written before adding a row at the_time?
+  def is_full (self, the_time):
+    if (len(self.rows) == 0):
+      return False
+    if ((self.chunk_rows != None) and (len(self.rows) >= self.chunk_rows)):
+      return True
+    if ((self.chunk_seconds != None) and
+        (the_time >= self.chunk_start_time + self.chunk_seconds)):
+      return True
+    return False
+
+  # Add the row for an entry, if the renderer shows it.  A new chunk is
+  # a new longtable, so its first row shows its time.
+  def add (self, entry, renderer):
+    if (self.is_full (entry["time"])):
+      self.write_chunk ()
+      renderer.previous_time = None
+    the_row = renderer.render (entry)
+    if (the_row != None):
+      if (len(self.rows) == 0):
+        self.chunk_start_time = entry["time"]
+      self.rows.append (the_row)
+    return
+
+  # Write the chunk being built to its file and input it from the index.
+  def write_chunk (self):
+    self.chunk_count = self.chunk_count + 1
+    chunk_file_name = self.chunk_file_name (self.chunk_count)
+    with open (chunk_file_name, "w") as chunk_file:
+      chunk_file.write (table_header (self.table_caption,
+                                      self.chunk_count > 1))
+      chunk_file.writelines (self.rows)
+      chunk_file.write (table_footer ())
+    self.index_file.write ("\\input{" + os.path.basename (chunk_file_name) +
+                           "}\n")
+    self.rows = list()
+    return
+
+  def flush (self):
+    self.index_file.flush()
+    return
+
+  def tell (self):
+    return (self.index_file.tell())
+
+  def close (self):
+    self.index_file.close()
+    return
+
+  # Write the last chunk, even if the table is empty, and close the
+  # index.
+  def finish (self):
+    if ((len(self.rows) > 0) or (self.chunk_count == 0)):
+      self.write_chunk ()
+    self.close ()
+    return
+
+def main ():
+  parser = argparse.ArgumentParser (
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=('Write the LaTeX table of a traffic signal simulation ' +
+                 'from its table log.'),
+    epilog=('Copyright © 2026 by John Sauter' + '\n' +
+            'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+            'see <https://gnu.org/licenses/gpl.html> for the full text ' +
+            'of the license.' + '\n' +
+            'This is free software: ' +
+            'you are free to change and redistribute it. ' + '\n' +
+            'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+            '\n'))
+
+  parser.add_argument ('--version', action='version',
+                       version='render_table 0.1 2026-10-19',
+                       help='print the version number and exit')
+  parser.add_argument ('--table-log-file', metavar='table_log_file',
+                       required=True,
+                       help='the table log written by simulate_traffic.py')
+  parser.add_argument ('--table-file', metavar='table_file', required=True,
+                       help='write the LaTeX longtable to this file')
+  parser.add_argument ('--table-level', type=int, metavar='table_level',
+                       help='control the level of detail in the table: ' +
+                       '1 is normal, 0 none')
+  parser.add_argument ('--table-start', type=decimal.Decimal,
+                       metavar='table_start',
+                       help='do not include information before this time' +
+                       ' in the LaTex table, default is -1.000')
+  parser.add_argument ('--table-end', type=decimal.Decimal,
+                       metavar='table_end',
+                       help='do not include information after this time' +
+                       ' in the LaTex table, default is unlimited')
+  parser.add_argument ('--table-caption', metavar='table_caption',
+                       help='caption of LaTex table.')
+  parser.add_argument ('--table-chunk-rows', type=int,
+                       metavar='table_chunk_rows',
+                       help='split the table into chunks of at most this ' +
+                       'many rows; the table file inputs the chunks')
+  parser.add_argument ('--table-chunk-seconds', type=decimal.Decimal,
+                       metavar='table_chunk_seconds',
+                       help='split the table into chunks covering at most ' +
+                       'this many seconds; the table file inputs the chunks')
+  parser.add_argument ('--explain-state-transitions', action='store_true',
+                       help='give reasons for state transitions')
+  parser.add_argument ('--only-important', action='store_true',
+                       help='Only log important toggles and timers')
+  parser.add_argument ('--show-substates', action='store_true',
+                       help='show substates in the table')
+  parser.add_argument ('--show-green-lists', action='store_true',
+                       help='show the green lists in the table')
+
+  arguments = vars(parser.parse_args ())
+  table_level = 0
+  if (arguments ['table_level'] != None):
+    table_level = arguments ['table_level']
+  table_start_time = decimal.Decimal ('-1.000')
+  if (arguments ['table_start'] != None):
+    table_start_time = arguments ['table_start']
+  table_end_time = decimal.Decimal ('Infinity')
+  if (arguments ['table_end'] != None):
+    table_end_time = arguments ['table_end']
+  table_caption = "no caption"
+  if (arguments ['table_caption'] != None):
+    table_caption = arguments ['table_caption']
+  chunk_rows = arguments ['table_chunk_rows']
+  if ((chunk_rows != None) and (chunk_rows <= 0)):
+    parser.error ("--table-chunk-rows must be positive")
+  chunk_seconds = arguments ['table_chunk_seconds']
+  if (chunk_seconds != None):
+    if (chunk_seconds <= 0):
+      parser.error ("--table-chunk-seconds must be positive")
+    chunk_seconds = fractions.Fraction (chunk_seconds)
+
+  renderer = TableRenderer (
+    table_level=table_level, table_start_time=table_start_time,
+    table_end_time=table_end_time,
+    only_important=arguments ['only_important'],
+    show_substates=arguments ['show_substates'],
+    show_green_lists=arguments ['show_green_lists'],
+    explain_state_transitions=arguments ['explain_state_transitions'])
+  with open (arguments ['table_log_file'], "r") as table_log_file:
+    if ((chunk_rows != None) or (chunk_seconds != None)):
+      writer = ChunkedTableWriter (arguments ['table_file'], table_caption,
+                                   chunk_rows, chunk_seconds)
+      for the_line in table_log_file:
+        writer.add (parse_entry (the_line), renderer)
+      writer.finish ()
+      return
+    with open (arguments ['table_file'], "w") as table_file:
+      table_file.write (table_header (table_caption))
+      for the_line in table_log_file:
+        the_row = renderer.render (parse_entry (the_line))
+        if (the_row != None):
+          table_file.write (the_row)
+      table_file.write (table_footer ())
+  return
+
+if (__name__ == "__main__"):
+  main ()
+
+# End of file render_table.py
@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# run_ensemble.py runs replications of a traffic signal simulation
+# and reports confidence intervals for its statistics.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The arguments after -- are passed to simulate_traffic.py, and must
+# include an arrivals file.  Each replication runs the simulation with
+# its own seed for the generated arrivals, in its own subdirectory of
+# the results directory.  The statistics of each replication are the
+# number of traffic elements which left the simulation, their mean
+# delay, and the mean and maximum wait at each signal face.
+#
+# Replications run in parallel.  Once at least the minimum number have
+# finished, the half width of the confidence interval of each statistic
+# is compared with its mean, and when every one is within the requested
+# precision no more replications are started.  Replications are
+# considered in the order of their seeds, not the order they finish,
+# so the number used, and the result, do not depend on timing.
+
+import os
+import sys
+import io
+import math
+import statistics
+import traceback
+import contextlib
+import multiprocessing
+import queue
+import pathlib
+import json
+import csv
+import argparse
+import scipy.stats
+
+from sweep_scenarios import resolve_inputs
+
+# Each worker imports the simulator once and keeps it for all of the
+# replications it runs.
+def start_worker ():
+  global simulate_traffic
+  import simulate_traffic
+  return
+
+# Run one replication in a worker.  Return its number and either its
+# statistics or a description of what went wrong.
+def run_replication (replication):
+  number, seed, the_arguments, replication_directory = replication
+  original_directory = os.getcwd()
+  console_file = None
+  try:
+    replication_directory.mkdir (parents=True, exist_ok=True)
+    console_file = open (replication_directory / "console.txt", "w")
+    os.chdir (replication_directory)
+    with (contextlib.redirect_stdout (console_file),
+          contextlib.redirect_stderr (console_file)):
+      outcome = simulate_traffic.main (the_arguments +
+                                       ["--arrivals-seed", str(seed)])
+    if (outcome["error_count"] > 0):
+      outcome = {"error": str(outcome["error_count"]) + " errors"}
+  except (Exception, SystemExit) as the_exception:
+    outcome = {"error": repr(the_exception)}
+    if (console_file != None):
+      console_file.write (traceback.format_exc())
+  finally:
+    os.chdir (original_directory)
+    if (console_file != None):
+      console_file.close()
+  return ((number, outcome))
+
+# Extract the statistics of a replication as numbers, indexed by name.
+def replication_values (outcome, face_names):
+  values = dict()
+  values["exit count"] = float(outcome["exit_count"])
+  values["mean delay"] = float(outcome["mean_delay"])
+  for face_name in face_names:
+    values["mean wait " + face_name] = float(
+      outcome["mean_wait_times"].get (face_name, 0))
+    values["max wait " + face_name] = float(
+      outcome["max_wait_times"].get (face_name, 0))
+  return (values)
+
+# Compute the mean, standard deviation and confidence interval half
+# width of each statistic over the given replications.
+def summarize (outcomes, confidence):
+  face_names = set()
+  for outcome in outcomes:
+    face_names.update (outcome["max_wait_times"])
+  values_list = [replication_values (outcome, sorted(face_names))
+                 for outcome in outcomes]
+  count = len(values_list)
+  t_value = scipy.stats.t.ppf ((1 + confidence) / 2, count - 1)
+  summary = dict()
+  for name in values_list[0]:
+    values = [the_values[name] for the_values in values_list]
+    mean = statistics.fmean (values)
+    stdev = statistics.stdev (values)
+    summary[name] = {"mean": mean, "stdev": stdev,
+                     "half_width": t_value * stdev / math.sqrt (count)}
+  return (summary)
+
+# Is every confidence interval within the precision of its mean?
+def is_precise (summary, precision):
+  return (all(((the_summary["half_width"] == 0) or
+               (the_summary["half_width"] <=
+                precision * abs(the_summary["mean"])))
+              for the_summary in summary.values()))
+
+def main ():
+  global error_counter
+
+  parser = argparse.ArgumentParser (
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=('Run replications of a traffic signal simulation ' +
+                 'until its statistics are known precisely.'),
+    epilog=('Copyright © 2026 by John Sauter' + '\n' +
+            'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+            'see <https://gnu.org/licenses/gpl.html> for the full text ' +
+            'of the license.' + '\n' +
+            'This is free software: ' +
+            'you are free to change and redistribute it. ' + '\n' +
+            'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+            '\n'))
+
+  parser.add_argument ('--version', action='version',
+                       version='run_ensemble 0.1 2026-10-19',
+                       help='print the version number and exit')
+  parser.add_argument ('--results-directory', metavar='results_directory',
+                       required=True,
+                       help='write the output of each replication into a ' +
+                       'subdirectory of this directory')
+  parser.add_argument ('--replications', type=int, metavar='replications',
+                       help='the most replications to run, default 100')
+  parser.add_argument ('--min-replications', type=int,
+                       metavar='min_replications',
+                       help='the fewest replications to run, default 5')
+  parser.add_argument ('--precision', type=float, metavar='precision',
+                       help='stop when each confidence interval half ' +
+                       'width is at most this fraction of its mean, ' +
+                       'default 0.05')
+  parser.add_argument ('--confidence', type=float, metavar='confidence',
+                       help='confidence level of the intervals, ' +
+                       'default 0.95')
+  parser.add_argument ('--seed', type=int, metavar='seed',
+                       help='arrivals seed of the first replication; ' +
+                       'the others follow it, default 1')
+  parser.add_argument ('--jobs', type=int, metavar='jobs',
+                       help='number of replications to run at once, ' +
+                       'default is the number of processors')
+  parser.add_argument ('--verbose', type=int, metavar='verbosity_level',
+                       help='control the amount of output from the ' +
+                       'program: 1 is normal, 0 suppresses summary messages')
+  parser.add_argument ('simulator_arguments', nargs=argparse.REMAINDER,
+                       help='arguments for simulate_traffic.py, after --')
+
+  arguments = vars(parser.parse_args ())
+  results_directory = pathlib.Path(arguments ['results_directory']).resolve()
+  max_replications = 100
+  if (arguments ['replications'] != None):
+    max_replications = arguments ['replications']
+  min_replications = 5
+  if (arguments ['min_replications'] != None):
+    min_replications = arguments ['min_replications']
+  precision = 0.05
+  if (arguments ['precision'] != None):
+    precision = arguments ['precision']
+  confidence = 0.95
+  if (arguments ['confidence'] != None):
+    confidence = arguments ['confidence']
+  first_seed = 1
+  if (arguments ['seed'] != None):
+    first_seed = arguments ['seed']
+  jobs = os.cpu_count()
+  if (arguments ['jobs'] != None):
+    jobs = arguments ['jobs']
+  verbosity_level = 1
+  if (arguments ['verbose'] != None):
+    verbosity_level = arguments ['verbose']
+
+  if (min_replications < 2):
+    parser.error ("at least two replications are needed for a " +
+                  "confidence interval")
+  if (max_replications < min_replications):
+    parser.error ("--replications is less than --min-replications")
+  if (not (0 < confidence < 1)):
+    parser.error ("--confidence must be between 0 and 1")
+
+  # Check the simulator's arguments before running anything.
+  import simulate_traffic
+  simulator_arguments = arguments ['simulator_arguments']
+  if ((len(simulator_arguments) > 0) and (simulator_arguments[0] == "--")):
+    simulator_arguments = simulator_arguments[1:]
+  simulator_arguments = resolve_inputs (simulator_arguments,
+                                        pathlib.Path.cwd())
+  try:
+    with contextlib.redirect_stderr (io.StringIO()) as error_text:
+      simulator_options = vars(simulate_traffic.parser.parse_args (
+        simulator_arguments))
+  except SystemExit:
+    parser.error ("invalid simulator arguments: " +
+                  (error_text.getvalue().strip().splitlines() + [""])[-1])
+  if (simulator_options ['arrivals_file'] == None):
+    parser.error ("the simulator arguments need an --arrivals-file, " +
+                  "or every replication would be the same")
+
+  # Keep jobs replications running until the statistics are precise
+  # enough.  Finished replications wait in outcomes until all of the
+  # ones before them have finished.
+  error_counter = 0
+  results_directory.mkdir (parents=True, exist_ok=True)
+  finished = queue.Queue()
+  outcomes = dict()
+  used_count = 0
+  started_count = 0
+  running_count = 0
+  summary = None
+  converged = False
+  with multiprocessing.Pool (processes=min(jobs, max_replications),
+                             initializer=start_worker) as pool:
+    while (True):
+      while ((running_count < jobs) and
+             (started_count < max_replications) and
+             (not converged) and (error_counter == 0)):
+        replication = (started_count, first_seed + started_count,
+                       simulator_arguments,
+                       results_directory /
+                       f'replication_{started_count + 1:04d}')
+        # A replication which fails outside of run_replication, for
+        # example because its worker died, still finishes.
+        pool.apply_async (
+          run_replication, (replication,), callback=finished.put,
+          error_callback=(lambda the_exception, number=started_count:
+                          finished.put ((number,
+                                         {"error": repr(the_exception)}))))
+        started_count = started_count + 1
+        running_count = running_count + 1
+      if ((running_count == 0) or converged):
+        break
+      number, outcome = finished.get()
+      running_count = running_count - 1
+      outcomes[number] = outcome
+      while ((not converged) and (used_count in outcomes)):
+        if ("error" in outcomes[used_count]):
+          print ("Replication " + str(used_count + 1) + " failed: " +
+                 outcomes[used_count]["error"])
+          error_counter = error_counter + 1
+          break
+        used_count = used_count + 1
+        if (used_count >= min_replications):
+          summary = summarize ([outcomes[index]
+                                for index in range(0, used_count)],
+                               confidence)
+          converged = is_precise (summary, precision)
+        if (verbosity_level >= 2):
+          print ("Replication " + str(used_count) + " done.")
+      if (error_counter > 0):
+        break
+
+  # Write the statistics of each replication used and the summary.
+  with open (results_directory / "replications.csv", "w", newline="") as \
+       replications_file:
+    writer = csv.writer (replications_file)
+    writer.writerow (["replication", "seed", "exit_count", "mean_delay",
+                      "mean_wait_times", "max_wait_times"])
+    for index in range(0, used_count):
+      outcome = outcomes[index]
+      writer.writerow ([index + 1, first_seed + index,
+                        outcome["exit_count"], outcome["mean_delay"],
+                        json.dumps (outcome["mean_wait_times"]),
+                        json.dumps (outcome["max_wait_times"])])
+  with open (results_directory / "summary.json", "w") as summary_file:
+    json.dump ({"replications": used_count, "converged": converged,
+                "confidence": confidence, "precision": precision,
+                "statistics": summary}, summary_file, indent=2)
+    summary_file.write ("\n")
+
+  if ((verbosity_level >= 1) and (summary != None)):
+    print ("Used " + str(used_count) + " replications; " +
+           ("the statistics are" if converged else
+            "not all statistics are") + " within " + f'{precision:.1%}' +
+           " at " + f'{confidence:.0%}' + " confidence.")
+    for name in summary:
+      print (f'{name:>20}: {summary[name]["mean"]:10.3f} ' +
+             f'± {summary[name]["half_width"]:.3f}')
+  if (error_counter > 0):
+    print ("Encountered " + str(error_counter) + " errors.")
+    sys.exit (1)
+  return
+
+if (__name__ == "__main__"):
+  main ()
+
+# End of file run_ensemble.py
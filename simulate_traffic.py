@@ -26,6 +26,9 @@
 #     telephone: (603) 424-1188
 #     e-mail: John_Sauter@systemeyescomputerstore.com
 
+import os
+import sys
+import io
 import math
 import pprint
 import decimal
@@ -33,9 +36,28 @@ import fractions
 import pathlib
 import json
 import csv
+import time
+import random
+import heapq
+import hashlib
+import shutil
+import tempfile
+import contextlib
+import traceback
+import pickle
+import zlib
+import signal
+import threading
 import shapely
+import numpy as np
 import argparse
 
+import binary_trace
+import columnar_events
+import event_bus
+import event_database
+import render_table
+
 parser = argparse.ArgumentParser (
   formatter_class=argparse.RawDescriptionHelpFormatter,
   description=('Simulate an intersection controlled by a traffic signal.'),
@@ -53,13 +75,50 @@ parser.add_argument ('--version', action='version',
                      help='print the version number and exit')
 parser.add_argument ('--trace-file', metavar='trace_file',
                      help='write trace output to the specified file')
+parser.add_argument ('--trace-format', choices=("text", "binary"),
+                     help='write the trace file as text, the default, or ' +
+                     'as binary records of what changed, which is much ' +
+                     'faster and smaller; print it with binary_trace.py')
 parser.add_argument ('--intersection-file', metavar='intersection_file',
                      help='JSON description of the intersection')
 parser.add_argument ('--events-file', metavar='events_file',
                      help='write event output to the specified file')
+parser.add_argument ('--events-format', choices=("csv", "numpy"),
+                     help='write the event file as CSV, the default, or ' +
+                     'as typed columns in numpy arrays, which is smaller ' +
+                     'and faster to read')
+parser.add_argument ('--database-file', metavar='database_file',
+                     help='record lamp changes, traffic element events, ' +
+                     'toggle changes and timer events in this SQLite ' +
+                     'database, indexed by time, signal face and name')
+parser.add_argument ('--trips-file', metavar='trips_file',
+                     help='write one line for each traffic element, ' +
+                     'describing its trip, to this CSV file')
+parser.add_argument ('--time-series-file', metavar='time_series_file',
+                     help='write the number of traffic elements stopped ' +
+                     'and moving in each lane, and the occupancy of each ' +
+                     'sensor, sampled over time, to this numpy file')
+parser.add_argument ('--sample-interval', type=decimal.Decimal,
+                     metavar='sample_interval',
+                     help='seconds between the samples in the time ' +
+                     'series file, default 1')
+parser.add_argument ('--flight-recorder-size', type=int,
+                     metavar='flight_recorder_size',
+                     help='remember this many of the most recent toggle, ' +
+                     'timer, state, lamp and traffic element events, and ' +
+                     'write them out on an error, a safety check failure ' +
+                     'or SIGUSR1; default 10000, 0 remembers none')
+parser.add_argument ('--flight-recorder-file', metavar='flight_recorder_file',
+                     help='write the remembered events to files named ' +
+                     'after this one, in the binary trace format; ' +
+                     'default flight_recorder.bin')
 parser.add_argument ('--table-file', metavar='table_file',
                      help='write LaTeX table output to the specified file' +
                      ' as a LaTex longtable.')
+parser.add_argument ('--table-log-file', metavar='table_log_file',
+                     help='record every event which could appear in the ' +
+                     'LaTeX table in this file, so render_table.py can ' +
+                     'write tables with any level, times and detail')
 parser.add_argument ('--table-level', type=int, metavar='table_level',
                      help='control the level of detail in the table: ' +
                      '1 is normal, 0 none')
@@ -71,8 +130,17 @@ parser.add_argument ('--table-end', type=decimal.Decimal,
                      metavar='table_end',
                      help='do not include information after this time' +
                      ' in the LaTex table, default is unlimited')
+parser.add_argument ('--table-chunk-rows', type=int,
+                     metavar='table_chunk_rows',
+                     help='split the table into chunks of at most this ' +
+                     'many rows; the table file inputs the chunks')
+parser.add_argument ('--table-chunk-seconds', type=decimal.Decimal,
+                     metavar='table_chunk_seconds',
+                     help='split the table into chunks covering at most ' +
+                     'this many seconds; the table file inputs the chunks')
 parser.add_argument ('--flush-table-file', action='store_true',
-                     help='Flush the table file after each line for debugging')
+                     help='Flush the table file after each pass of the ' +
+                     'main loop for debugging')
 parser.add_argument ('--duration', type=decimal.Decimal, metavar='duration',
                      help='length of time to run the simulator, ' +
                      'default is 0.000')
@@ -82,11 +150,21 @@ parser.add_argument ('--last-event-time', metavar='last_event_time',
                      help='time of last event written to this file'),
 parser.add_argument ('--script-input', metavar='script_input',
                      help='actions for the simulator to execute')
+parser.add_argument ('--arrivals-file', metavar='arrivals_file',
+                     help='generate arrivals from the distributions in ' +
+                     'this JSON file, as well as any in the script')
+parser.add_argument ('--arrivals-seed', type=int, metavar='arrivals_seed',
+                     help='seed for the generated arrivals, in place of ' +
+                     'the seed in the arrivals file')
 parser.add_argument ('--clock-step', metavar='clock_step',
                      help="set the size of the simulation's clock step; " +
                      'default is 0.01 seconds.')
 parser.add_argument ('--print-statistics', action='store_true',
                      help='print statistics about the simulation')
+parser.add_argument ('--statistics-file', metavar='statistics_file',
+                     help='write the statistics of the simulation, ' +
+                     'including the distributions of waits and delays, ' +
+                     'to this file as JSON')
 parser.add_argument ('--explain-state-transitions', action='store_true',
                      help='give reasons for state transitions')
 parser.add_argument ('--only-important', action='store_true',
@@ -98,121 +176,42 @@ parser.add_argument ('--show-green-lists', action='store_true',
 parser.add_argument ('--verbose', type=int, metavar='verbosity_level',
                      help='control the amount of output from the program: ' +
                      '1 is normal, 0 suppresses summary messages')
-
-do_trace = False
-trace_file_name = ""
-do_intersection = False
-intersection_file_name = ""
-do_events_output = False
-events_file_name = ""
-do_table_output = False
-table_file_name = ""
-table_level = 0
-end_time = decimal.Decimal ('0.000')
-table_start_time  = decimal.Decimal ('-1.000')
-table_end_time = decimal.Decimal ('Infinity')
-table_caption = "no caption"
-do_script_input = False
-script_input_file = ""
-do_last_event_time_output = False
-clock_step = fractions.Fraction ("0.001")
-print_statistics = False
-explain_state_transitions = False
-flush_table_file = False
-only_important = False
-show_substates = False
-show_green_lists = False
-verbosity_level = 1
-error_counter = 0
-
-# Verbosity_level and table level:
-# 1 only errors (and statistics if requested)
-# 2 add lamp changes, script actions, and vehicles and pedestrians
-#   arriving, leaving and reaching milestones
-# 3 add state changes 
-# 4 add toggle and sensor changes
-# 5 add blocking and lots of other items for debugging
-# 6 add tests of toggles
-
-# Parse the command line.
-arguments = parser.parse_args ()
-arguments = vars(arguments)
-
-if (arguments ['trace_file'] != None):
-  do_trace = True
-  trace_file_name = arguments ['trace_file']
-  trace_file_name = pathlib.Path(trace_file_name)
-  trace_file = open (trace_file_name, 'w')
-
-if (arguments ['intersection_file'] != None):
-  do_intersection = True
-  intersection_file_name = arguments ['intersection_file']
-  intersection_file_name = pathlib.Path(intersection_file_name)
-
-if (arguments ['events_file'] != None):
-  do_events_output = True
-  events_file_name = arguments ['events_file']
-  events_file_name = pathlib.Path(events_file_name)
-
-if (arguments ['table_file'] != None):
-  do_table_output = True
-  table_file_name = arguments ['table_file']
-  table_file_name = pathlib.Path(table_file_name)
-
-if ((arguments ['table_level'] != None) and do_table_output):
-  table_level = arguments ['table_level']
-
-if (arguments ['duration'] != None):
-  end_time = arguments ['duration']
-  
-if (arguments ['table_start'] != None):
-  table_start_time = arguments ['table_start']
-
-if (arguments ['table_end'] != None):
-  table_end_time = arguments ['table_end']
-
-if (arguments ['table_caption'] != None):
-  table_caption = arguments ['table_caption']
-  
-if (arguments ['script_input'] != None):
-  do_script_input = True
-  script_file_name = arguments ['script_input']
-  script_file_name = pathlib.Path(script_file_name)
-  
-if (arguments ['last_event_time'] != None):
-  do_last_event_time_output = True
-  last_event_time_file_name = arguments ['last_event_time']
-  last_event_time_file_name = pathlib.Path(last_event_time_file_name)
-
-if (arguments ['clock_step'] != None):
-  clock_step = arguments ['clock_step']
-  clock_step = decimal.Decimal (clock_step)
-  clock_step = fractions.Fraction (clock_step)
-
-if (arguments ['print_statistics'] != None):
-  print_statistics = arguments ['print_statistics']
-
-if (arguments ['explain_state_transitions'] != None):
-  explain_state_transitions = arguments ['explain_state_transitions']
-
-if (arguments ['flush_table_file'] != None):
-  flush_table_file = arguments ['flush_table_file']
-
-if (arguments ['only_important'] != None):
-  only_important = arguments ['only_important']
-
-if (arguments ['show_substates'] != None):
-  show_substates = arguments ['show_substates']
-
-if (arguments ['show_green_lists'] != None):
-  show_green_lists = arguments ['show_green_lists']
-
-if (arguments ['verbose'] != None):
-  verbosity_level = int(arguments ['verbose'])
-
-start_time = decimal.Decimal("0.000")
-current_time = fractions.Fraction(start_time)
-last_event_time = current_time
+parser.add_argument ('--checkpoint-file', metavar='checkpoint_file',
+                     help='save the state of the simulation in this file ' +
+                     'at the end of the run')
+parser.add_argument ('--checkpoint-every', type=decimal.Decimal,
+                     metavar='checkpoint_every',
+                     help='also save the state of the simulation each ' +
+                     'time this many seconds of simulated time pass')
+parser.add_argument ('--resume-from', metavar='resume_from',
+                     help='continue the simulation saved in this ' +
+                     'checkpoint file; its intersection, script and ' +
+                     'output options replace those given here')
+parser.add_argument ('--branch-at', type=decimal.Decimal, metavar='branch_at',
+                     help='time at which the branches given by --branch ' +
+                     'leave the simulation')
+parser.add_argument ('--branch', action='append', metavar='name=script',
+                     help='also run a what-if branch which replaces the ' +
+                     'rest of the script with this script; may be given ' +
+                     'more than once')
+parser.add_argument ('--jobs', type=int, metavar='jobs',
+                     help='number of branches to run at once, ' +
+                     'default is the number of processors')
+parser.add_argument ('--no-cache', action='store_true',
+                     help='always run the simulation, and do not save ' +
+                     'its results in the cache')
+parser.add_argument ('--cache-directory', metavar='cache_directory',
+                     help='where to keep the results of earlier runs, ' +
+                     'default is ~/.cache/simulate_traffic')
+parser.add_argument ('--cache-size', type=int, metavar='cache_size',
+                     help='the most megabytes the cache may hold, ' +
+                     'default is 1024')
+parser.add_argument ('--incremental-every', type=decimal.Decimal,
+                     metavar='incremental_every',
+                     help='save checkpoints in the cache this many ' +
+                     'seconds of simulated time apart, so a run whose ' +
+                     'script differs only later can start from one; ' +
+                     'default is 60, 0 saves none')
 
 #
 # Subroutine to capitolize the first letter of a string.
@@ -220,133 +219,10 @@ last_event_time = current_time
 def cap_first_letter (the_string):
   return (the_string[0].upper() + the_string[1:])
 
-# Subroutine to determine if it is OK to append a line to the table.
-def table_OK (the_level):
-  if (not do_table_output):
-    return False
-  if (the_level > table_level):
-    return False
-  if (current_time <= table_start_time):
-    return False
-  if (current_time > table_end_time):
-    return False
-  return True
-
-# Write the first lines in the table file.
-
-if (do_table_output):
-  table_file = open (table_file_name, 'w')
-  table_file.write ("\\begin{longtable}{c | P{1.00cm} | p{9.25cm}}\n")
-  table_file.write ("  \\caption{" + table_caption + "} \\\\\n")
-  table_file.write ("  Time & Lane & Event \\endfirsthead \n")
-  table_file.write ("  \\caption{" + table_caption + " continued} \\\\\n")
-  table_file.write ("  Time & Lane & Events \\endhead \n")
-  if (flush_table_file):
-    table_file.flush()
-
-# Write the first line in the event file.
-if (do_events_output):
-  events_file = open (events_file_name, 'w')
-  events_file.write ("time,lane,type,color,name,position_x,position_y," +
-                     "destination_x,destination_y,orientation,length,speed," +
-                     "travel path,present\n")
-
-# Subroutine to write a traffic element event to the event file.
-def write_event (traffic_element, tag):
-  global last_event_time
-  
-  events_file.write (str(current_time) + "," +
-                     traffic_element["current lane"] + "," +
-                     traffic_element["type"] + "," +
-                     tag + "," +
-                     traffic_element["name"] + "," +
-                     str(traffic_element["position x"]) + "," +
-                     str(traffic_element["position y"]) + "," +
-                     str(traffic_element["target x"]) + "," +
-                     str(traffic_element["target y"]) + "," +
-                     str(traffic_element["angle"]) + "," +
-                     str(traffic_element["length"]) + "," +
-                     str(traffic_element["speed"]) + "," +
-                     traffic_element["travel path name"] + "," +
-                     str(traffic_element["present"]) + "\n")
-  last_event_time = current_time
-  return
-
-# Read the intersection information.
-
-if (do_intersection):
-  intersection_file = open (intersection_file_name, 'r')
-  intersection_info = json.load (intersection_file)
-  finite_state_machine = intersection_info["finite state machine"]
-  intersection_file.close()
-else:
-  intersection_info = dict()
-  finite_state_machine = dict()
-
-signal_faces_list = intersection_info ["signal faces"]
-signal_faces_dict = dict()
-for signal_face in signal_faces_list:
-  signal_face_name = signal_face["name"]
-  signal_faces_dict[signal_face_name] = signal_face
-
-travel_paths = intersection_info ["travel paths"]
-speed_limits = intersection_info ["speed limits"]
-car_length = intersection_info ["car length"]
-car_width = intersection_info ["car width"]
-truck_length = intersection_info ["truck length"]
-truck_width = intersection_info ["truck width"]
-crosswalk_width = intersection_info ["crosswalk width"]
-
-for signal_face in signal_faces_list:
-  signal_face ["clearance requested by"] = set()
-  
-if (do_trace):
-  trace_file.write ("Starting Signal Faces:\n")
-  pprint.pprint (signal_faces_list, trace_file)
-
-# Read the script file, if one was specified.
-script_set = set()
-if (do_script_input):
-  with open (script_file_name, 'r') as scriptfile:
-    reader = csv.DictReader (scriptfile)
-    for row in reader:
-      the_time = fractions.Fraction (row['time'])
-      the_operator = row['operator']
-      signal_face_name = row['signal face']
-      the_operand = row['operand']
-      permissive_delay = fractions.Fraction (row['permissive_delay'])
-      the_count = int(row['count'])
-      the_interval = fractions.Fraction (row['interval'])
-      for counter in range(0, the_count):
-        this_time = the_time + (the_interval * counter);
-        this_action = (this_time, the_operator, signal_face_name, the_operand,
-                       permissive_delay)
-        script_set.add(this_action)
- 
-  if (do_trace):
-    trace_file.write ("Script:\n")
-    pprint.pprint (script_set, trace_file)
-    trace_file.write ("\n")
-  
-# System Programs
-
-# The clock is advanced only if this cycle has resulted in no activity.
-no_activity = True              
-
 # Format the clock for display
 def format_time(the_time):
   return (f'{the_time:07.3f}')
 
-# Format the clock for display unless it has the same value as last time,
-# in which case just produce a blank space.
-previous_time = None
-def format_time_N(the_time):
-  global previous_time
-  if (the_time == previous_time):
-    return (" ")
-  previous_time = the_time
-  return (format_time (the_time))
-
 # Format a duration in seconds for display using LaTeX.
 def remove_exponent(d):
   return (d.quantize(decimal.Decimal(1)) if d == d.to_integral() \
@@ -393,7 +269,7 @@ def format_angle (the_angle_in_radians):
 
 # Format a traffic element's place name for display.
 def place_name(traffic_element):
-  current_lane = traffic_element["current lane"]
+  current_lane = traffic_element.current_lane
   match current_lane:
     case "intersection":
       return ("the intersection")
@@ -403,2260 +279,4771 @@ def place_name(traffic_element):
       return ("lane " + current_lane)
   return (None)
 
-# Return the value of a named toggle in a specified signal face.
-def toggle_value (signal_face, toggle_name):
-  global error_counter
-                                            
-  toggles = signal_face["toggles"]
-  for the_toggle in toggles:
-    if (the_toggle["name"] == toggle_name):
-      if (verbosity_level >= 6):
-        print (format_time(current_time) + " toggle " + signal_face["name"] +
-               "/" + toggle_name + " is " + str(the_toggle["value"]) + ",")
-      return (the_toggle["value"])
-
-  error_counter = error_counter + 1
-  if (verbosity_level >= 1):
-    print (format_time(current_time) + "signal face " + signal_face["name"] +
-           " testing unknown toggle " + toggle_name + ".")
-  return None
-
-# Set the value of a named toggle in a specified signal face.
-def set_toggle_value (signal_face, toggle_name, new_value, source):
-  global no_activity
-  global error_counter
-  
-  toggles = signal_face["toggles"]
-  for the_toggle in toggles:
-    if (the_toggle["name"] == toggle_name):
-      if (the_toggle["value"] != new_value):
-        if (new_value):
-          operator = "Set toggle "
-        else:
-          operator = "Clear toggle "
-        if (source != ""):
-          byline = " by " + source
-        else:
-          byline = ""
-          
-        if (verbosity_level >= 4):
-          print (format_time(current_time) + " signal face " +
-                 signal_face["name"] + " " + operator + toggle_name + byline +
-                 ".")
-            
-        if (table_OK (4) and ((not only_important) or
-                              the_toggle["important"])):
-          table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                            signal_face["name"] + " & " + operator + 
-                            toggle_name + byline + ". \\\\\n")
-          if (flush_table_file):
-            table_file.flush()
-        no_activity = False
-        the_toggle["value"] = new_value
-
-        # Compute the maximum time a traffic element must wait at this
-        # signal face.  The wait time starts when a sensor triggers a
-        # toggle and ends when traffic is flowing through that signal face.
-        if ((toggle_name == "Traffic Flowing") and ("waiting" in signal_face)):
-          if (signal_face["waiting"]):
-            signal_face["waiting"] = False
-            wait_time = current_time - signal_face["wait start"]
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " signal face " +
-                     signal_face["name"] + " finishes waiting: " +
-                     format_time(wait_time) + ".")
-            if (table_OK (5)):
-              table_file.write ("\\hline " + format_time_N(current_time) +
-                                " & " + signal_face ["name"] +
-                                " & finishes waiting for " +
-                                format_time(wait_time) + ".\\\\\n")
-              if (flush_table_file):
-                table_file.flush()
-            if ("max wait time" not in signal_face):
-              signal_face ["max wait time"] = wait_time
-              signal_face ["max wait start"] = signal_face["wait start"]
-            else:
-              if (wait_time > signal_face["max wait time"]):
-                signal_face["max wait time"] = wait_time
-                signal_face["max wait start"] = signal_face["wait start"]
-                        
+# subroutine to convert a fraction to a decimal
+def convert_fraction_to_decimal (the_fraction):
+  the_numerator = the_fraction.numerator
+  the_denominator = the_fraction.denominator
+  result = decimal.Decimal(the_numerator) / decimal.Decimal(the_denominator)
+  return (result)
+
+# A traffic element is a car, truck or pedestrian who is close to the
+# intersection.  Its attributes are slots, which keeps it small and
+# quick to access in the movement loop.
+class TrafficElement:
+  __slots__ = ("name", "number", "type", "travel_path_name",
+               "permissive_delay",
+               "milestones", "segments", "milestone_index", "was_stopped",
+               "length", "width", "current_time", "present",
+               "blocker_name", "stopped_time", "old_speed",
+               "current_lane", "next_lane", "start_x", "start_y",
+               "target_x", "target_y", "distance_between_milestones",
+               "distance_remaining", "position_x", "position_y",
+               "speed", "angle", "shape", "stop_shape", "go_shape",
+               "shapes_distance_remaining", "queue_lane", "leader",
+               "follower", "start_time", "stop_count", "wait_time",
+               "last_wait_time", "blocker")
+
+  # The slots which are shown in the trace file.  Those set by
+  # new_milestone, rebuild_shapes and blocking are left unset until
+  # they are first assigned, and the trace shows only the slots which
+  # are set.
+  trace_slots = ("name", "type", "travel_path_name", "permissive_delay",
+                 "milestones", "milestone_index", "was_stopped", "length",
+                 "width", "current_time", "present", "blocker_name",
+                 "stopped_time", "old_speed", "current_lane", "next_lane",
+                 "start_x", "start_y", "target_x", "target_y",
+                 "distance_between_milestones", "distance_remaining",
+                 "position_x", "position_y", "speed", "angle", "shape",
+                 "stop_shape", "go_shape")
+  unset_slots = ("current_lane", "next_lane", "start_x", "start_y",
+                 "target_x", "target_y", "distance_between_milestones",
+                 "distance_remaining", "position_x", "position_y",
+                 "speed", "angle", "shape", "stop_shape", "go_shape",
+                 "old_speed")
+
+  def __init__ (self):
+    for slot_name in self.__slots__:
+      if (slot_name not in self.unset_slots):
+        setattr (self, slot_name, None)
+    self.milestone_index = -1
+    self.was_stopped = False
+    self.present = True
+    self.stop_count = 0
+    self.wait_time = 0.0
+    return
+
+  # Return the traffic element as a dictionary for the trace file, with
+  # spaces instead of underscores in the names of its slots.
+  def as_dict (self):
+    the_dict = dict()
+    for slot_name in self.trace_slots:
+      if (hasattr (self, slot_name)):
+        the_dict[slot_name.replace("_", " ")] = getattr (self, slot_name)
+    return (the_dict)
+
+# The segments of a travel path, compiled when the intersection is read
+# so that reaching a milestone needs no square roots, arc tangents or
+# speed limit lookups.  Segment i runs from milestone i to milestone i+1.
+# Each attribute is a list indexed by segment number.  The angle of a
+# segment of length zero is None, because it is indeterminate.
+#
+# The lane start distance is the cumulative distance at which the
+# travel path would have been at the start of the segment's lane
+# queue, and the queue name names that queue; see align_lane_queues.
+# Between the geometric check starts and ends, measured from the start
+# of the segment, a traffic element might be blocked by a traffic
+# element in some other lane; see find_lane_interactions.
+class SegmentTable:
+  __slots__ = ("lane_names", "next_lane_names", "start_x", "start_y",
+               "end_x", "end_y", "lengths", "angles",
+               "cumulative_distances", "lane_start_distances",
+               "queue_names", "speed_limits", "stopped_speed_limits",
+               "geometric_check_starts", "geometric_check_ends")
+
+  def __init__ (self, travel_path_name, milestones_list,
+                speed_limit):
+    for slot_name in self.__slots__:
+      setattr (self, slot_name, list())
+    cumulative_distance = 0
+    lane_start_distance = 0
+    for segment_index in range(0, len(milestones_list) - 1):
+      start_milestone = milestones_list[segment_index]
+      end_milestone = milestones_list[segment_index + 1]
+      lane_name = start_milestone[0]
+      start_x = start_milestone[1]
+      start_y = start_milestone[2]
+      end_x = end_milestone[1]
+      end_y = end_milestone[2]
+      segment_length = math.sqrt(((start_x-end_x)**2) +
+                                 ((start_y-end_y)**2))
+      if (segment_length > 0):
+        segment_angle = math.atan2 (end_x - start_x, start_y - end_y)
+      else:
+        segment_angle = None
+      self.lane_names.append (lane_name)
+      self.next_lane_names.append (end_milestone[0])
+      self.start_x.append (start_x)
+      self.start_y.append (start_y)
+      self.end_x.append (end_x)
+      self.end_y.append (end_y)
+      self.lengths.append (segment_length)
+      self.angles.append (segment_angle)
+      if ((segment_index > 0) and (lane_name != self.lane_names[-2])):
+        lane_start_distance = cumulative_distance
+      self.cumulative_distances.append (cumulative_distance)
+      self.lane_start_distances.append (lane_start_distance)
+      self.queue_names.append (lane_name)
+      self.geometric_check_starts.append (0)
+      self.geometric_check_ends.append (math.inf)
+      self.speed_limits.append (speed_limit (lane_name, travel_path_name,
+                                             False))
+      self.stopped_speed_limits.append (speed_limit (lane_name,
+                                                     travel_path_name, True))
+      cumulative_distance = cumulative_distance + segment_length
+    return
+
+  # The time it takes to travel the path at the speed limit.
+  def free_flow_time (self):
+    free_flow_time = 0.0
+    for segment_index in range(0, len(self.lengths)):
+      if (self.speed_limits[segment_index] > 0):
+        free_flow_time = (free_flow_time +
+                          (self.lengths[segment_index] /
+                           self.speed_limits[segment_index]))
+    return (free_flow_time)
+
+# Compute the shapes of many traffic elements at once.  The coordinates
+# are computed the same way shapely.geometry.box and
+# shapely.affinity.rotate compute them, so the shapes are identical to
+# those made by rebuild_shapes.
+def build_shapes (position_x, position_y, widths, lengths, angles):
+  cos_angles = np.array ([math.cos(the_angle) for the_angle in angles])
+  sin_angles = np.array ([math.sin(the_angle) for the_angle in angles])
+  cos_angles[np.abs(cos_angles) < 2.5e-16] = 0.0
+  sin_angles[np.abs(sin_angles) < 2.5e-16] = 0.0
+  offset_x = position_x - position_x * cos_angles + position_y * sin_angles
+  offset_y = position_y - position_x * sin_angles - position_y * cos_angles
+  min_x = position_x - (widths / 2.0)
+  max_x = position_x + (widths / 2.0)
+  min_y = position_y
+  stop_clearance = lengths / 3
+  go_clearance = stop_clearance * 1.5
+
+  shape_lists = list()
+  for max_y in (position_y + lengths, min_y - stop_clearance,
+                min_y - go_clearance):
+    # The corners in the order that shapely.geometry.box lists them.
+    corners_x = np.stack ((max_x, max_x, min_x, min_x, max_x), axis=1)
+    corners_y = np.stack ((min_y, max_y, max_y, min_y, min_y), axis=1)
+    rotated_x = ((cos_angles[:, None] * corners_x) +
+                 (-sin_angles[:, None] * corners_y) + offset_x[:, None])
+    rotated_y = ((sin_angles[:, None] * corners_x) +
+                 (cos_angles[:, None] * corners_y) + offset_y[:, None])
+    shape_lists.append (shapely.polygons (np.stack ((rotated_x, rotated_y),
+                                                    axis=-1)))
+  return (list(zip(*shape_lists)))
+
+# Traffic elements in the intersection or a crosswalk cross each
+# other's paths, so they do not form queues.
+def is_queue_lane (lane_name):
+  return (lane_name not in ("intersection", "crosswalk"))
+
+# Return how far along a lane the point (x, y) is.  The lane is given by
+# the line a travel path follows through it.  Points before the start of
+# the line are at negative distances.
+def lane_position (lane_line, x, y):
+  position = lane_line.project (shapely.geometry.Point (x, y))
+  if (position > 0):
+    return (position)
+  (start_x, start_y), (next_x, next_y) = lane_line.coords[0:2]
+  first_length = math.hypot (next_x - start_x, next_y - start_y)
+  return ((((x - start_x) * (next_x - start_x)) +
+           ((y - start_y) * (next_y - start_y))) / first_length)
+
+# Return how far a traffic element has travelled into its lane queue.
+def distance_into_lane (traffic_element):
+  segments = traffic_element.segments
+  segment_index = traffic_element.milestone_index
+  return (segments.cumulative_distances[segment_index] -
+          segments.lane_start_distances[segment_index] +
+          segments.lengths[segment_index] -
+          traffic_element.distance_remaining)
+
+# Return the only traffic element that can block this one, if
+# there is just one; otherwise return None.  The traffic element's
+# shapes are not moved back when it is blocked, so use the distance
+# at which they were built.
+def single_possible_blocker (traffic_element):
+  if (traffic_element.leader == None):
+    return (None)
+  segments = traffic_element.segments
+  segment_index = traffic_element.milestone_index
+  distance_travelled = (segments.lengths[segment_index] -
+                        traffic_element.shapes_distance_remaining)
+  if ((distance_travelled >= segments.geometric_check_starts[segment_index])
+      and
+      (distance_travelled <= segments.geometric_check_ends[segment_index])):
+    return (None)
+  return (traffic_element.leader)
+
+def timer_state (signal_face, timer_name):
+  timers_list = signal_face["timers"]
+  for the_timer in timers_list:
+    if (the_timer["name"] == timer_name):
+      return the_timer["state"]
+
+# Read a script file and return its actions in the order they appear.
+def read_script (script_file_name):
+  script_actions = list()
+  with open (script_file_name, 'r') as scriptfile:
+    reader = csv.DictReader (scriptfile)
+    for row in reader:
+      the_time = fractions.Fraction (row['time'])
+      the_operator = row['operator']
+      signal_face_name = row['signal face']
+      the_operand = row['operand']
+      permissive_delay = fractions.Fraction (row['permissive_delay'])
+      the_count = int(row['count'])
+      the_interval = fractions.Fraction (row['interval'])
+      for counter in range(0, the_count):
+        this_time = the_time + (the_interval * counter);
+        this_action = (this_time, the_operator, signal_face_name,
+                       the_operand,
+                       permissive_delay)
+        script_actions.append(this_action)
+  return (script_actions)
+
+# Arrivals can also be generated instead of listed in a script.  An
+# arrivals file is JSON:
+#
+# {"seed": 1,
+#  "streams": [
+#    {"type": "car", "signal face": "B", "travel path": "A4",
+#     "permissive delay": 1, "start": 200, "end": 3800,
+#     "distribution": "poisson", "rate": 600}]}
+#
+# Each stream sends traffic elements of one type along one travel path
+# from its start time until its end time, at rate traffic elements per
+# hour.  The distributions are:
+#   poisson: arrivals at random, at a steady rate;
+#   platoon: arrivals at random, but only while an upstream signal is
+#     green.  The signal is green for "green" seconds of each "cycle"
+#     seconds, starting "offset" seconds into the cycle;
+#   time of day: arrivals at random, at a rate which changes over the
+#     day.  "volumes" is a list of [time, rate] pairs; the rate between
+#     them is interpolated, and after the last it stays at the last
+#     rate.
+# Arrivals in a stream are at least "headway" seconds apart, default 2,
+# since traffic elements cannot enter on top of one another.  Each
+# stream has its own random number generator, seeded from the seed and
+# the stream's place in the list, so adding a stream does not change
+# the arrivals of the others.
+class ArrivalStream:
+  def __init__ (self, stream_info, seed, stream_number):
+    self.element_type = stream_info["type"]
+    self.signal_face_name = stream_info["signal face"]
+    self.travel_path_name = stream_info["travel path"]
+    self.permissive_delay = fractions.Fraction (
+      str(stream_info.get ("permissive delay", 1)))
+    self.start_time = float(stream_info.get ("start", 0))
+    self.end_time = float(stream_info.get ("end", math.inf))
+    self.headway = float(stream_info.get ("headway", 2))
+    self.distribution = stream_info["distribution"]
+    match self.distribution:
+      case "poisson":
+        self.rate = float(stream_info["rate"]) / 3600
+      case "platoon":
+        self.cycle = float(stream_info["cycle"])
+        self.green = float(stream_info["green"])
+        self.offset = float(stream_info.get ("offset", 0))
+        self.rate = (float(stream_info["rate"]) * self.cycle /
+                     (self.green * 3600))
+        self.green_clock = 0.0
+      case "time of day":
+        self.volumes = [(float(the_time), float(volume) / 3600)
+                        for the_time, volume in stream_info["volumes"]]
+        self.rate = max(volume for the_time, volume in self.volumes)
+        # The rate after the last time stays at the last rate, so if
+        # that is zero there are no arrivals after it.
+        last_time, last_rate = self.volumes[-1]
+        if (last_rate <= 0):
+          self.end_time = min(self.end_time, last_time)
+      case _:
+        raise ValueError ("unknown distribution " + self.distribution)
+    self.random = random.Random (str(seed) + "/" + str(stream_number))
+    self.clock = self.start_time
+    self.previous_arrival = -math.inf
+    self.next_time = None
+    self.advance ()
+
+  # The rate of a time of day stream at the given time.
+  def rate_at (self, the_time):
+    if (the_time <= self.volumes[0][0]):
+      return (self.volumes[0][1])
+    for index in range(1, len(self.volumes)):
+      end_time, end_rate = self.volumes[index]
+      if (the_time <= end_time):
+        start_time, start_rate = self.volumes[index - 1]
+        return (start_rate + ((end_rate - start_rate) *
+                              (the_time - start_time) /
+                              (end_time - start_time)))
+    return (self.volumes[-1][1])
+
+  # Find the time of the next arrival.  Next_time is None once the
+  # stream has ended.
+  def advance (self):
+    if (self.rate <= 0):
+      self.next_time = None
       return
-    
-  if (verbosity_level >= 1):
-    print (format_time(current_time) + " setting unknown toggle " +
-           signal_face["name"] + "/" + toggle_name + ".")
-  error_counter = error_counter + 1
-  return
+    match self.distribution:
+      case "poisson":
+        self.clock = self.clock + self.random.expovariate (self.rate)
+      case "platoon":
+        self.green_clock = (self.green_clock +
+                            self.random.expovariate (self.rate))
+        cycle_number = math.floor (self.green_clock / self.green)
+        self.clock = (self.start_time + self.offset +
+                      (cycle_number * self.cycle) +
+                      (self.green_clock - (cycle_number * self.green)))
+      case "time of day":
+        # Choose arrivals at the highest rate, and keep each with a
+        # probability in proportion to the rate at that time.
+        while (self.clock < self.end_time):
+          self.clock = self.clock + self.random.expovariate (self.rate)
+          if ((self.random.random() * self.rate) <=
+              self.rate_at (self.clock)):
+            break
+    self.clock = max(self.clock, self.previous_arrival + self.headway)
+    self.previous_arrival = self.clock
+    if (self.clock >= self.end_time):
+      self.next_time = None
+    else:
+      self.next_time = fractions.Fraction (round (self.clock * 1000), 1000)
+    return
 
-# Return True if traffic can not be permitted to flow through the specified
-# signal face if traffic is already allowed to flow through the specified
-# conflicting signal face.
-def does_conflict (signal_face, conflicting_signal_face):
-  conflict_set = signal_face["conflicts"]
-  if (conflicting_signal_face ["name"] in conflict_set):
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " lane " +
-             signal_face["name"] + " conflicts with " +
-             conflicting_signal_face ["name"] + ".")
-    if (do_trace):
-      trace_file.write ("Lane " + signal_face ["name"] +
-                        " conflicts with lane " +
-                        conflicting_signal_face["name"] + ".\n")
-      pprint.pprint (conflict_set, trace_file)
-      trace_file.write ("\n")
+# A quantile sketch summarizes a stream of measurements, such as the
+# wait at a signal face, in a fixed amount of memory, however long the
+# simulation runs.  Each measurement is counted in a bucket whose upper
+# bound is gamma times its lower bound, so a quantile taken from the
+# buckets is within relative_accuracy of the true value.  Measurements
+# smaller than the clock's resolution of a millisecond are counted as
+# zero.  A measurement between a millisecond and a year lands in one of
+# about 1,300 buckets, and only buckets which are used are stored.
+class QuantileSketch:
+  __slots__ = ("count", "total", "minimum", "maximum", "zero_count",
+               "buckets")
+  relative_accuracy = 0.01
+  gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+  log_gamma = math.log (gamma)
+  smallest = 0.001
+
+  def __init__ (self):
+    self.count = 0
+    self.total = 0.0
+    self.minimum = math.inf
+    self.maximum = -math.inf
+    self.zero_count = 0
+    self.buckets = dict()
+    return
 
-    return True
-  
-  if (verbosity_level >= 5):
-    print (format_time(current_time) + " signal face " + signal_face["name"] +
-           " does not conflict with " + conflicting_signal_face ["name"] + ".")
-  if (do_trace):
-    trace_file.write ("Lane " + signal_face ["name"] +
-                      " does not conflct with lane " +
-                      conflicting_signal_face["name"] + ".\n")
-    pprint.pprint (conflict_set, trace_file)
-    trace_file.write ("\n")
-    
-  return False
-
-# Allow signal faces to turn green in the order they requested, but
-# allow non-conflicting faces to turn green even if they were requested
-# later, provided they haven't already turned green while the oldest
-# request is waiting for its turn and provided the oldest request has not
-# been waiting too long.
-
-requesting_green = list()
-allowed_green = list()
-had_its_chance = list()
-
-# Format one of the above lists for display, if requested.
-def format_list (the_list, list_name, extra_text):
-  if (not show_green_lists):
-    return ("")
-  
-  if (len(the_list) == 0):
-    return (list_name + " is empty.")
-  
-  if (len(the_list) == 1):
-    list_element = the_list[0]
-    return (list_name + extra_text + list_element["name"] + ". ")
-  
-  if (len(the_list) == 2):
-    list_element_1 = the_list[0]
-    list_element_2 = the_list[1]
-    return (list_name + extra_text + list_element_1["name"] + " and " +
-            list_element_2["name"] + ". ")
-  
-  the_elements = list()
-  the_elements.append (list_name + extra_text)
-  for list_element in the_list:
-    the_elements.append (list_element["name"] + ", ")
-  last_element = the_elements.pop()
-  last_element = last_element[0:-2]
-  last_element = "and " + last_element + ". "
-  the_elements.append(last_element)
-  return ("".join(the_elements))
-
-def format_lists():
-  string_01 = format_list (requesting_green, "List Requesting Green",
-                           " contains ")
-  string_02 = format_list (allowed_green, "List Requesting Clearance",
-                           " contains ")
-  string_03 = format_list (had_its_chance, "List Turned Green Early",
-                           " contains ")
-  return (string_01 + " " + string_02 + " " + string_03)
-
-def green_request_granted():
-  global requesting_green
-  global allowed_green
-  global had_its_chance
-  global no_activity
-
-  if (do_trace):
-    trace_file.write ("Starting Green Request Granted system program.\n")
-    
-  # If a signal face is on the requesting green list, but is no longer
-  # requesting green, remove it from the list.  This usually happens
-  # because the signal face has turned green, but can also happen
-  # if a vehicle makes a permissive right turn so the signal face
-  # no longer needs to turn green.
-  
-  to_remove = list()
-  for signal_face in requesting_green:
-    if (not toggle_value(signal_face, "Request Green")):
-      if (verbosity_level >= 4):
-        print (format_time(current_time) + " signal face " +
-               signal_face["name"] + " is no longer requesting green.")
-      to_remove.append(signal_face)
-  for signal_face in to_remove:
-    requesting_green.remove(signal_face)
-    if (table_OK (4)):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        signal_face["name"] + " & " +
-                        "is no longer requesting green.  " +
-                        format_lists() + "\\\\\n")
-      
-      if (flush_table_file):
-        table_file.flush()
-    
-  # Likewise, if a signal face is on the allowed green list, but is no
-  # longer interested in turning green, remove it from the list.
-  to_remove = list()
-  for signal_face in allowed_green:
-    if (not toggle_value(signal_face, "Request Green")):
-      if (not ((toggle_value(signal_face, "Request Clearance")) or
-               toggle_value(signal_face, "Request Partial Clearance"))):
-        if (verbosity_level >= 4):
-          print (format_time(current_time) + " signal face " +
-                 signal_face["name"] + " no longer requesting clearance.")
+  def add (self, value):
+    value = float(value)
+    self.count = self.count + 1
+    self.total = self.total + value
+    self.minimum = min(self.minimum, value)
+    self.maximum = max(self.maximum, value)
+    if (value < self.smallest):
+      self.zero_count = self.zero_count + 1
+    else:
+      index = math.ceil (math.log (value) / self.log_gamma)
+      self.buckets[index] = self.buckets.get (index, 0) + 1
+    return
+
+  # Return the smallest value which is at least the given fraction of
+  # the measurements.
+  def quantile (self, fraction):
+    if (self.count == 0):
+      return (0.0)
+    rank = max(math.ceil (fraction * self.count), 1) - 1
+    seen = self.zero_count
+    if (rank < seen):
+      return (max(self.minimum, 0.0))
+    for index in sorted(self.buckets):
+      seen = seen + self.buckets[index]
+      if (rank < seen):
+        value = 2 * (self.gamma ** index) / (self.gamma + 1)
+        return (min(max(value, self.minimum), self.maximum))
+    return (self.maximum)
+
+  # Summarize the measurements in a form that can be written as JSON.
+  def summary (self):
+    if (self.count == 0):
+      return ({"count": 0})
+    return ({"count": self.count,
+             "mean": round(self.total / self.count, 3),
+             "min": round(self.minimum, 3),
+             "max": round(self.maximum, 3),
+             "p50": round(self.quantile (0.50), 3),
+             "p95": round(self.quantile (0.95), 3),
+             "p99": round(self.quantile (0.99), 3)})
+
+# Format the mean and quantiles of a sketch's summary for display.
+def format_quantiles (summary):
+  if (summary["count"] == 0):
+    return ("none")
+  return ("mean " + f'{summary["mean"]:.3f}' +
+          " p50 " + f'{summary["p50"]:.3f}' +
+          " p95 " + f'{summary["p95"]:.3f}' +
+          " p99 " + f'{summary["p99"]:.3f}')
+
+# The measurements kept for each travel path, each in its own sketch:
+# how long each traffic element was stopped, how many times it stopped,
+# its travel time and its delay.
+travel_path_measurements = ("wait", "stops", "travel time", "delay")
+
+# A time series is a sequence of samples, each a row of numbers taken
+# at the same interval, kept at several resolutions.  The finest is the
+# samples themselves; at each coarser resolution, given in seconds, the
+# samples in each period are reduced to their mean and maximum.  A
+# coarser resolution which is not a multiple of the interval is not
+# kept.  Each resolution keeps only its most recent rows, in a ring
+# buffer, so the memory used is fixed: by default an hour of samples
+# taken each second, a day of minutes and a week of quarter hours.
+class TimeSeries:
+  def __init__ (self, column_names, interval, capacity=3600,
+                coarser_resolutions=((60, 1440), (900, 672))):
+    self.column_names = column_names
+    self.interval = interval
+    self.levels = [self.new_level (1, capacity)]
+    for resolution, level_capacity in coarser_resolutions:
+      window = fractions.Fraction (resolution) / interval
+      if ((window.denominator == 1) and (window > 1)):
+        self.levels.append (self.new_level (int(window), level_capacity))
+    return
+
+  # Start a resolution which combines window samples into each row.
+  def new_level (self, window, capacity):
+    column_count = len(self.column_names)
+    return ({"resolution": float(window * self.interval), "window": window,
+             "times": np.zeros (capacity),
+             "means": np.zeros ((capacity, column_count), dtype=np.float32),
+             "maxima": np.zeros ((capacity, column_count),
+                                 dtype=np.float32),
+             "next_row": 0, "row_count": 0, "pending_count": 0,
+             "pending_start": 0.0, "pending_sum": np.zeros (column_count),
+             "pending_max": np.zeros (column_count)})
+
+  # Add a sample taken at the given time.
+  def add (self, the_time, values):
+    for level in self.levels:
+      if (level["pending_count"] == 0):
+        level["pending_start"] = the_time
+        level["pending_sum"][:] = values
+        level["pending_max"][:] = values
+      else:
+        level["pending_sum"] += values
+        np.maximum (level["pending_max"], values, out=level["pending_max"])
+      level["pending_count"] = level["pending_count"] + 1
+      if (level["pending_count"] == level["window"]):
+        row = level["next_row"]
+        level["times"][row] = level["pending_start"]
+        level["means"][row] = level["pending_sum"] / level["window"]
+        level["maxima"][row] = level["pending_max"]
+        level["next_row"] = (row + 1) % len(level["times"])
+        level["row_count"] = min(level["row_count"] + 1,
+                                 len(level["times"]))
+        level["pending_count"] = 0
+    return
+
+  # Write the time series as a compressed numpy archive.  For each
+  # resolution, named by its number of seconds, there are the start
+  # times of its rows, oldest first, and their means and maxima.  A
+  # period which had not finished is left out.
+  def save (self, file_name):
+    arrays = {"columns": np.array (self.column_names)}
+    for level in self.levels:
+      rows = np.roll (np.arange (len(level["times"])), -level["next_row"])
+      rows = rows[len(rows) - level["row_count"]:]
+      name = f'{level["resolution"]:g}'
+      arrays["time_" + name] = level["times"][rows]
+      arrays["mean_" + name] = level["means"][rows]
+      arrays["max_" + name] = level["maxima"][rows]
+    with open (file_name, "wb") as time_series_file:
+      np.savez_compressed (time_series_file, **arrays)
+    return
+
+# The output files of a simulation, named by the attribute which holds
+# each when it is open.
+output_file_attributes = ("trace_file", "table_file", "events_file",
+                          "trips_file", "database_file", "table_log_file")
+
+# The output files which are not plain files.  They are kept in a
+# checkpoint, without their files, since they remember some of what
+# they have written.
+output_writer_types = (columnar_events.ColumnarEventsWriter,
+                       event_database.EventDatabase,
+                       render_table.ChunkedTableWriter,
+                       binary_trace.TraceWriter)
+
+# At most this many flight recorder dumps are written for errors and
+# safety check failures in one run, so a failure which repeats does not
+# fill the disk.
+max_flight_recorder_dumps = 10
+
+# The kinds of event the flight recorder keeps, and of the traffic
+# element events, the ones it keeps.  Lamp changes and traffic elements
+# moving along are left out, so a run with only the flight recorder
+# makes few events.
+flight_recorder_events = (event_bus.ElementEvent, event_bus.ToggleChange,
+                          event_bus.TimerEvent, event_bus.StateChange,
+                          event_bus.ConflictingGreens)
+flight_recorder_element_tags = ("stopped", "blocked", "unblocked")
+
+# The columns of the trips file.  The outcome of a trip is "exited" if
+# the traffic element reached the end of its travel path, "blocked" if
+# it could not enter because another was in the way, or "present" if it
+# was still travelling when the simulation ended.  A traffic element
+# which is blocked is not spawned later, so it has no travel time.
+trips_file_header = ("name,type,travel path,outcome,spawn time,exit time," +
+                     "travel time,free flow time,delay,stopped time," +
+                     "stops,blocked by\n")
+
+# A simulation of one intersection.  The simulation owns all of its
+# state, so several can be run, one after another or side by side, in
+# the same process.  Create it with the output options, then call
+# load_intersection, load_script if there is a script, run_until as
+# many times as needed, and finish to write the end of the output
+# files.  Step runs the state machines, the script and the traffic
+# elements for a single pass of the main loop.  Between passes the whole
+# state of the simulation can be saved in a checkpoint file, and a run
+# resumed from that file writes the same output as one which was never
+# interrupted.
+#
+# Verbosity_level and table level:
+# 1 only errors (and statistics if requested)
+# 2 add lamp changes, script actions, and vehicles and pedestrians
+#   arriving, leaving and reaching milestones
+# 3 add state changes 
+# 4 add toggle and sensor changes
+# 5 add blocking and lots of other items for debugging
+# 6 add tests of toggles
+class Simulation:
+
+  def __init__ (self, trace_file_name=None, events_file_name=None,
+                table_file_name=None, table_level=0,
+                table_start_time=decimal.Decimal ('-1.000'),
+                table_end_time=decimal.Decimal ('Infinity'),
+                table_caption="no caption", flush_table_file=False,
+                clock_step=fractions.Fraction ("0.001"),
+                print_statistics=False, explain_state_transitions=False,
+                only_important=False, show_substates=False,
+                show_green_lists=False, verbosity_level=1,
+                trips_file_name=None, time_series_file_name=None,
+                sample_interval=fractions.Fraction (1),
+                events_format="csv", database_file_name=None,
+                table_log_file_name=None, table_chunk_rows=None,
+                table_chunk_seconds=None, trace_format="text",
+                flight_recorder_size=10000,
+                flight_recorder_file_name="flight_recorder.bin"):
+    self.do_trace = (trace_file_name != None)
+    self.trace_format = trace_format
+    self.do_events_output = (events_file_name != None)
+    self.events_format = events_format
+    self.do_database_output = (database_file_name != None)
+    self.do_trips_output = (trips_file_name != None)
+    self.do_table_output = (table_file_name != None)
+    self.chunk_table = ((table_chunk_rows != None) or
+                        (table_chunk_seconds != None))
+    self.do_table_log = (table_log_file_name != None)
+    self.table_level = table_level
+    self.end_time = fractions.Fraction (0)
+    self.table_start_time = table_start_time
+    self.table_end_time = table_end_time
+    self.table_caption = table_caption
+    self.clock_step = clock_step
+    self.print_statistics = print_statistics
+    self.explain_state_transitions = explain_state_transitions
+    self.flush_table_file = flush_table_file
+    self.only_important = only_important
+    self.show_substates = show_substates
+    self.show_green_lists = show_green_lists
+    self.verbosity_level = verbosity_level
+    self.error_counter = 0
+
+    start_time = decimal.Decimal("0.000")
+    self.current_time = fractions.Fraction(start_time)
+    self.last_event_time = self.current_time
+
+    # The clock is advanced only if this cycle has resulted in no activity.
+    self.no_activity = True
+
+    # The table renderer chooses and formats the rows of the table.
+    self.table_renderer = render_table.TableRenderer (
+      table_level=table_level, table_start_time=table_start_time,
+      table_end_time=table_end_time, only_important=only_important,
+      show_substates=show_substates, show_green_lists=show_green_lists,
+      explain_state_transitions=explain_state_transitions)
+
+    # Allow signal faces to turn green in the order they requested, but
+    # allow non-conflicting faces to turn green even if they were
+    # requested later, provided they haven't already turned green while
+    # the oldest request is waiting for its turn and provided the oldest
+    # request has not been waiting too long.
+    self.requesting_green = list()
+    self.allowed_green = list()
+    self.had_its_chance = list()
+
+    self.running_timers = list()
+
+    # The script actions, ordered by time and, for actions at the same
+    # time, by the order they were read, so the simulation does not
+    # depend on how Python happens to order a set.
+    self.script_actions = list()
+    self.script_set = set()
+
+    # The generated arrival streams, as a heap ordered by the time of
+    # each stream's next arrival.  See load_arrivals.
+    self.arrival_streams = list()
+
+    # The traffic elements dictionary holds each traffic element in the
+    # simulation, indexed by its name.  A traffic element is removed
+    # when it leaves, so a long run does not scan or keep the ones which
+    # have gone; only the count of those which started is kept.
+    self.traffic_elements = dict()
+    self.traffic_element_count = 0
+    self.next_traffic_element_number = 0
+
+    # The number of traffic elements which have left the simulation,
+    # and the total of their delays, in seconds.  The delay of a
+    # traffic element is how much longer it took to travel its path
+    # than it would have at the speed limit.
+    self.exit_count = 0
+    self.total_delay = 0.0
+
+    # The distributions of the waits at each signal face, and of the
+    # measurements of the traffic elements which left along each travel
+    # path, as quantile sketches, so their memory does not grow with
+    # the length of the simulation.
+    self.wait_sketches = dict()
+    self.travel_path_sketches = dict()
+
+    # Traffic elements in the same lane form a queue, ordered by how far
+    # they have travelled into the lane.  Each traffic element in a queue
+    # knows its leader, the traffic element just ahead of it, and its
+    # follower.  Away from the places where lanes meet, a traffic element
+    # can only be blocked by its leader, so it does not need to be tested
+    # against every other traffic element.
+    self.lane_queues = dict()
+
+    # The compiled travel paths, the traffic elements present on each
+    # travel path, in the order they were spawned, and the permissive
+    # areas; these are filled in by load_intersection.
+    self.travel_path_segments = dict()
+    self.travel_path_elements = dict()
+    self.permissive_areas = dict()
+
+    # The output files are reopened by name when resuming from a
+    # checkpoint.
+    self.trace_file_name = trace_file_name
+    self.table_file_name = table_file_name
+    self.events_file_name = events_file_name
+    self.trips_file_name = trips_file_name
+    self.database_file_name = database_file_name
+    self.table_log_file_name = table_log_file_name
+
+    # If requested, the lanes and sensors are sampled each time the
+    # clock passes next_sample_time; see take_samples.
+    self.time_series_file_name = time_series_file_name
+    self.sample_interval = sample_interval
+    self.time_series = None
+    self.next_sample_time = None
+
+    # If requested, a checkpoint is written each time the clock passes
+    # next_checkpoint_time; see schedule_checkpoints.
+    self.checkpoint_file_name = None
+    self.checkpoint_interval = None
+    self.next_checkpoint_time = None
+
+    # The flight recorder remembers the most recent events, to be
+    # written out if something goes wrong; see dump_flight_recorder.
+    self.flight_recorder = None
+    self.flight_recorder_dumps = 0
+    self.set_flight_recorder (flight_recorder_size, flight_recorder_file_name)
+
+    if (self.do_trace and (trace_format == "binary")):
+      self.trace_file = binary_trace.TraceWriter (
+        trace_file_name, columnar_events.ticks_per_second (clock_step))
+    elif (self.do_trace):
+      self.trace_file = open (trace_file_name, 'w')
+
+    # Write the first lines in the table file.  A chunked table is
+    # written a chunk at a time.
+    if (self.do_table_output and self.chunk_table):
+      self.table_file = render_table.ChunkedTableWriter (
+        table_file_name, self.table_caption, table_chunk_rows,
+        table_chunk_seconds)
+    elif (self.do_table_output):
+      self.table_file = open (table_file_name, 'w')
+      self.table_file.write (render_table.table_header (self.table_caption))
+      if (self.flush_table_file):
+        self.table_file.flush()
+
+    # The table log holds every line that could be in the table.
+    if (self.do_table_log):
+      self.table_log_file = open (table_log_file_name, 'w')
+
+    # Write the first line in the event file.
+    if (self.do_events_output and (events_format == "numpy")):
+      self.events_file = columnar_events.ColumnarEventsWriter (
+        events_file_name, columnar_events.ticks_per_second (clock_step))
+    elif (self.do_events_output):
+      self.events_file = open (events_file_name, 'w')
+      self.events_file.write (
+        "time,lane,type,color,name,position_x,position_y," +
+        "destination_x,destination_y,orientation,length,speed," +
+        "travel path,present\n")
+
+    # Write the first line in the trips file.
+    if (self.do_trips_output):
+      self.trips_file = open (trips_file_name, 'w')
+      self.trips_file.write (trips_file_header)
+
+    if (self.do_database_output):
+      self.database_file = event_database.EventDatabase (database_file_name)
+
+    return
+
+  # Read the intersection information and compile its travel paths.
+  def load_intersection (self, intersection_file_name):
+    if (intersection_file_name != None):
+      intersection_file = open (intersection_file_name, 'r')
+      self.intersection_info = json.load (intersection_file)
+      self.finite_state_machine = (
+        self.intersection_info["finite state machine"])
+      intersection_file.close()
+    else:
+      self.intersection_info = dict()
+      self.finite_state_machine = dict()
+
+    self.signal_faces_list = self.intersection_info ["signal faces"]
+    self.signal_faces_dict = dict()
+    for signal_face in self.signal_faces_list:
+      signal_face_name = signal_face["name"]
+      self.signal_faces_dict[signal_face_name] = signal_face
+
+    self.travel_paths = self.intersection_info ["travel paths"]
+    self.speed_limits = self.intersection_info ["speed limits"]
+    self.car_length = self.intersection_info ["car length"]
+    self.car_width = self.intersection_info ["car width"]
+    self.truck_length = self.intersection_info ["truck length"]
+    self.truck_width = self.intersection_info ["truck width"]
+    self.crosswalk_width = self.intersection_info ["crosswalk width"]
+
+    for signal_face in self.signal_faces_list:
+      signal_face ["clearance requested by"] = set()
+
+    if (self.do_trace):
+      self.trace_signal_faces ("starting signal face",
+                               "Starting Signal Faces:\n")
+
+    for travel_path_name in self.travel_paths:
+      travel_path = self.travel_paths[travel_path_name]
+      self.travel_path_segments[travel_path_name] = SegmentTable (
+        travel_path_name, travel_path["milestones"], self.speed_limit)
+      self.travel_path_elements[travel_path_name] = dict()
+    self.align_lane_queues ()
+    self.find_lane_interactions ()
+    self.compile_permissive_areas ()
+    return
+
+  # Read a script file.  Its actions are added to any already read.
+  # Actions before start_time are left out; they have already been
+  # performed by a simulation continued from a checkpoint.
+  def load_script (self, script_file_name, start_time=None):
+    for this_action in read_script (script_file_name):
+      if ((start_time != None) and (this_action[0] < start_time)):
+        continue
+      if (this_action not in self.script_set):
+        self.script_set.add(this_action)
+        self.script_actions.append(this_action)
+    self.script_actions.sort(key=lambda the_action: the_action[0])
+
+    if (self.do_trace):
+      self.trace ("script", None, "Script:\n", items=(self.script_set,),
+                  fields={"actions": self.script_actions}, ending="\n")
+    return
+
+  # Read an arrivals file and start its streams.  If seed is given it
+  # replaces the seed in the file.  The arrivals are generated one at a
+  # time as the simulation reaches them, so a long run does not need
+  # more memory.
+  def load_arrivals (self, arrivals_file_name, seed=None):
+    with open (arrivals_file_name, 'r') as arrivals_file:
+      arrivals_info = json.load (arrivals_file)
+    if (seed == None):
+      seed = arrivals_info.get ("seed", 0)
+    for stream_info in arrivals_info["streams"]:
+      stream_number = len(self.arrival_streams)
+      stream = ArrivalStream (stream_info, seed, stream_number)
+      if (stream.next_time != None):
+        heapq.heappush (self.arrival_streams,
+                        (stream.next_time, stream_number, stream))
+
+    if (self.do_trace):
+      self.trace ("arrival streams", None, "Arrival streams:\n",
+                  items=(arrivals_info,), fields={"streams": arrivals_info})
+    return
+
+  # Forget the script actions not yet performed.
+  def clear_script (self):
+    self.script_actions = list()
+    self.script_set = set()
+    return
+
+  # Subroutine to determine if it is OK to append a line to the table.
+  def table_OK (self, the_level):
+    if (not self.do_table_output):
+      return False
+    return (self.table_renderer.shows (the_level, self.current_time))
+
+  # Subroutine to determine if a line is wanted in the table or the
+  # table log.
+  def table_wanted (self, the_level):
+    return (self.do_table_log or self.table_OK (the_level))
+
+  # Subroutine to add a line to the table log and, if the table shows
+  # it, to the table.  The text follows the lane name; a line can also
+  # end with the green lists or describe a state transition, which are
+  # formatted as the table's options require.
+  def table_row (self, the_level, lane_name, the_text, important=True,
+                 green_lists=None, transition=None):
+    entry = render_table.table_entry (self.current_time, the_level,
+                                      lane_name, the_text, important,
+                                      green_lists, transition)
+    if (self.do_table_log):
+      self.table_log_file.write (render_table.format_entry (entry))
+    if (self.do_table_output and self.chunk_table):
+      self.table_file.add (entry, self.table_renderer)
+    elif (self.do_table_output):
+      the_row = self.table_renderer.render (entry)
+      if (the_row != None):
+        self.table_file.write (the_row)
+    return
+
+  # Subroutine to write an event to the trace.  The text trace gets the
+  # message, then a pretty-printed copy of the state and of each of the
+  # items, then the ending.  The binary trace records the event type,
+  # the keys of the entity's state which have changed since its last
+  # event, and the fields, which stand in for the items and for the
+  # values in the message.
+  def trace (self, event_type, entity_name, message, state=None, items=(),
+             fields=None, ending=""):
+    if (self.trace_format == "binary"):
+      self.trace_file.record (event_type, self.current_time, entity_name,
+                              state, fields)
+      return
+    self.trace_file.write (message)
+    if (state != None):
+      pprint.pprint (state, self.trace_file)
+    for item in items:
+      pprint.pprint (item, self.trace_file)
+    self.trace_file.write (ending)
+    return
+
+  # Subroutine to write every signal face to the trace.  The text trace
+  # prints them as a list; the binary trace records an event for each.
+  def trace_signal_faces (self, event_type, message):
+    if (self.trace_format == "binary"):
+      for signal_face in self.signal_faces_list:
+        self.trace (event_type, signal_face["name"], message,
+                    state=signal_face)
+      return
+    self.trace (event_type, None, message, items=(self.signal_faces_list,))
+    return
+
+  # Subroutine to set how many events the flight recorder remembers, and
+  # where it writes them.  A size of 0 turns it off.
+  def set_flight_recorder (self, size, file_name):
+    self.flight_recorder_file_name = file_name
+    if (size == 0):
+      self.flight_recorder = None
+    elif (self.flight_recorder == None):
+      self.flight_recorder = binary_trace.FlightRecorder (size)
+    else:
+      self.flight_recorder.resize (size)
+    self.subscribe_outputs ()
+    return
+
+  # Write the events in the flight recorder to a new file, named after
+  # the flight recorder file with the number of the dump added.  A dump
+  # asked for, with SIGUSR1, is always written; others only up to
+  # max_flight_recorder_dumps.
+  def dump_flight_recorder (self, reason, requested=False):
+    if (self.flight_recorder == None):
+      return
+    if ((not requested) and
+        (self.flight_recorder_dumps >= max_flight_recorder_dumps)):
+      return
+    self.flight_recorder_dumps = self.flight_recorder_dumps + 1
+    file_name = pathlib.Path(self.flight_recorder_file_name)
+    file_name = file_name.with_stem (
+      file_name.stem + f'_{self.flight_recorder_dumps:04d}')
+    self.flight_recorder.dump (file_name,
+                               columnar_events.ticks_per_second (
+                                 self.clock_step),
+                               self.current_time, reason)
+    if (self.verbosity_level >= 1):
+      print (format_time(self.current_time) + " wrote the flight " +
+             "recorder to " + str(file_name) + " because of " + reason +
+             ".")
+    return
+
+  # Subscribe the outputs which were requested to the events they
+  # record.  Events nobody subscribes to are not made; see emit sites.
+  def subscribe_outputs (self):
+    self.bus = event_bus.EventBus ()
+    if (self.do_events_output):
+      self.bus.subscribe (self.write_event, event_bus.ElementEvent)
+      self.bus.subscribe (self.write_lamp_event, event_bus.LampChange)
+    if (self.do_database_output):
+      self.bus.subscribe (self.add_database_event, event_bus.ElementEvent,
+                          event_bus.LampChange, event_bus.ToggleChange,
+                          event_bus.TimerEvent)
+    if (self.flight_recorder != None):
+      self.bus.subscribe (self.remember, *flight_recorder_events)
+    return
+
+  # Subroutine to remember an event in the flight recorder.
+  def remember (self, event):
+    if ((type(event) is event_bus.ElementEvent) and
+        (event.tag not in flight_recorder_element_tags)):
+      return
+    self.flight_recorder.record (event.event_type (), event.time,
+                                 event.entity_name (), event.fields ())
+    return
+
+  # Subroutine to write a traffic element event to the event file.
+  def write_event (self, event):
+    traffic_element = event.traffic_element
+    if (self.events_format == "numpy"):
+      self.events_file.write_element (
+        event.time, traffic_element.current_lane,
+        traffic_element.type, event.tag, traffic_element.name,
+        traffic_element.position_x, traffic_element.position_y,
+        traffic_element.target_x, traffic_element.target_y,
+        traffic_element.angle, traffic_element.length,
+        traffic_element.speed, traffic_element.travel_path_name,
+        traffic_element.present)
+      self.last_event_time = event.time
+      return
+    self.events_file.write (str(event.time) + "," +
+                            traffic_element.current_lane + "," +
+                            traffic_element.type + "," +
+                            event.tag + "," +
+                            traffic_element.name + "," +
+                            str(traffic_element.position_x) + "," +
+                            str(traffic_element.position_y) + "," +
+                            str(traffic_element.target_x) + "," +
+                            str(traffic_element.target_y) + "," +
+                            str(traffic_element.angle) + "," +
+                            str(traffic_element.length) + "," +
+                            str(traffic_element.speed) + "," +
+                            traffic_element.travel_path_name + "," +
+                            str(traffic_element.present) + "\n")
+    self.last_event_time = event.time
+    return
+
+  # Subroutine to write a lamp change to the event file.
+  def write_lamp_event (self, event):
+    if (self.events_format == "numpy"):
+      self.events_file.write_lamp (event.time, event.signal_face_name,
+                                   event.lamp_name)
+    else:
+      self.events_file.write (str(event.time) + "," +
+                              event.signal_face_name + ",lamp," +
+                              event.lamp_name + "\n")
+    self.last_event_time = event.time
+    return
+
+  # Subroutine to add an event to the event database.
+  def add_database_event (self, event):
+    match event:
+      case event_bus.ElementEvent ():
+        self.database_file.add_element_event (event.time,
+                                              event.traffic_element,
+                                              event.tag)
+      case event_bus.LampChange ():
+        self.database_file.add_lamp_change (event.time,
+                                            event.signal_face_name,
+                                            event.lamp_name)
+      case event_bus.ToggleChange ():
+        self.database_file.add_toggle_change (event.time,
+                                              event.signal_face_name,
+                                              event.toggle_name, event.value,
+                                              event.source)
+      case event_bus.TimerEvent ():
+        self.database_file.add_timer_event (event.time,
+                                            event.signal_face_name,
+                                            event.timer_name, event.event,
+                                            event.duration, event.reason)
+    return
+
+  # Subroutine to write a line in the trips file.
+  def write_trip (self, traffic_element, outcome, blocker_name=""):
+    free_flow_time = traffic_element.segments.free_flow_time ()
+    spawn_time = float(traffic_element.start_time)
+    exit_time = ""
+    travel_time = ""
+    delay = ""
+    if (outcome == "exited"):
+      exit_time = float(self.current_time)
+      travel_time = f'{exit_time - spawn_time:.3f}'
+      delay = f'{max(exit_time - spawn_time - free_flow_time, 0.0):.3f}'
+      exit_time = f'{exit_time:.3f}'
+    self.trips_file.write (traffic_element.name + "," +
+                           traffic_element.type + "," +
+                           traffic_element.travel_path_name + "," +
+                           outcome + "," +
+                           f'{spawn_time:.3f}' + "," +
+                           exit_time + "," +
+                           travel_time + "," +
+                           f'{free_flow_time:.3f}' + "," +
+                           delay + "," +
+                           f'{traffic_element.wait_time:.3f}' + "," +
+                           str(traffic_element.stop_count) + "," +
+                           blocker_name + "\n")
+    return
+
+  # Return the value of a named toggle in a specified signal face.
+  def toggle_value (self, signal_face, toggle_name):
+    toggles = signal_face["toggles"]
+    for the_toggle in toggles:
+      if (the_toggle["name"] == toggle_name):
+        if (self.verbosity_level >= 6):
+          print (format_time(self.current_time) + " toggle " +
+                 signal_face["name"] +
+                 "/" + toggle_name + " is " + str(the_toggle["value"]) + ",")
+        return (the_toggle["value"])
+
+    self.error_counter = self.error_counter + 1
+    if (self.verbosity_level >= 1):
+      print (format_time(self.current_time) + "signal face " +
+             signal_face["name"] +
+             " testing unknown toggle " + toggle_name + ".")
+    return None
+
+  # Set the value of a named toggle in a specified signal face.
+  def set_toggle_value (self, signal_face, toggle_name, new_value, source):
+    toggles = signal_face["toggles"]
+    for the_toggle in toggles:
+      if (the_toggle["name"] == toggle_name):
+        if (the_toggle["value"] != new_value):
+          if (new_value):
+            operator = "Set toggle "
+          else:
+            operator = "Clear toggle "
+          if (source != ""):
+            byline = " by " + source
+          else:
+            byline = ""
+
+          if (self.verbosity_level >= 4):
+            print (format_time(self.current_time) + " signal face " +
+                   signal_face["name"] + " " + operator + toggle_name +
+                   byline +
+                   ".")
+
+          if (self.table_wanted (4)):
+            self.table_row (4, signal_face["name"],
+                            " " + operator + toggle_name + byline + ". ",
+                            important=the_toggle["important"])
+          self.no_activity = False
+          the_toggle["value"] = new_value
+          if (self.bus.wants (event_bus.ToggleChange)):
+            self.bus.emit (event_bus.ToggleChange (self.current_time,
+                                                   signal_face["name"],
+                                                   toggle_name, new_value,
+                                                   source))
+
+          # Compute the maximum time a traffic element must wait at this
+          # signal face.  The wait time starts when a sensor triggers a
+          # toggle and ends when traffic is flowing through that signal face.
+          if ((toggle_name == "Traffic Flowing") and
+              ("waiting" in signal_face)):
+            if (signal_face["waiting"]):
+              signal_face["waiting"] = False
+              wait_time = self.current_time - signal_face["wait start"]
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " signal face " +
+                       signal_face["name"] + " finishes waiting: " +
+                       format_time(wait_time) + ".")
+              if (self.table_wanted (5)):
+                self.table_row (5, signal_face["name"],
+                                " finishes waiting for " +
+                                format_time(wait_time) + ".")
+              if ("max wait time" not in signal_face):
+                signal_face ["max wait time"] = wait_time
+                signal_face ["max wait start"] = signal_face["wait start"]
+                signal_face ["total wait time"] = wait_time
+                signal_face ["wait count"] = 1
+              else:
+                if (wait_time > signal_face["max wait time"]):
+                  signal_face["max wait time"] = wait_time
+                  signal_face["max wait start"] = signal_face["wait start"]
+                signal_face["total wait time"] = (
+                  signal_face["total wait time"] + wait_time)
+                signal_face["wait count"] = signal_face["wait count"] + 1
+              if (signal_face["name"] not in self.wait_sketches):
+                self.wait_sketches[signal_face["name"]] = QuantileSketch ()
+              self.wait_sketches[signal_face["name"]].add (wait_time)
+
+        return
+
+    if (self.verbosity_level >= 1):
+      print (format_time(self.current_time) + " setting unknown toggle " +
+             signal_face["name"] + "/" + toggle_name + ".")
+    self.error_counter = self.error_counter + 1
+    return
+
+  # Return True if traffic can not be permitted to flow through the specified
+  # signal face if traffic is already allowed to flow through the specified
+  # conflicting signal face.
+  def does_conflict (self, signal_face, conflicting_signal_face):
+    conflict_set = signal_face["conflicts"]
+    if (conflicting_signal_face ["name"] in conflict_set):
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " lane " +
+               signal_face["name"] + " conflicts with " +
+               conflicting_signal_face ["name"] + ".")
+      if (self.do_trace):
+        self.trace ("conflicts", signal_face["name"],
+                    "Lane " + signal_face ["name"] + " conflicts with lane " +
+                    conflicting_signal_face["name"] + ".\n",
+                    items=(conflict_set,), ending="\n",
+                    fields={"conflicting signal face":
+                            conflicting_signal_face["name"],
+                            "conflicts": conflict_set})
+
+      return True
+
+    if (self.verbosity_level >= 5):
+      print (format_time(self.current_time) + " signal face " +
+             signal_face["name"] +
+             " does not conflict with " + conflicting_signal_face ["name"] +
+             ".")
+    if (self.do_trace):
+      self.trace ("does not conflict", signal_face["name"],
+                  "Lane " + signal_face ["name"] +
+                  " does not conflct with lane " +
+                  conflicting_signal_face["name"] + ".\n",
+                  items=(conflict_set,), ending="\n",
+                  fields={"conflicting signal face":
+                          conflicting_signal_face["name"],
+                          "conflicts": conflict_set})
+
+    return False
+
+  # The names of the signal faces in each of the above lists.
+  def green_lists (self):
+    return ([[signal_face["name"] for signal_face in the_list]
+             for the_list in (self.requesting_green, self.allowed_green,
+                              self.had_its_chance)])
+
+  # Format the above lists for display, if requested.
+  def format_lists (self):
+    return (render_table.format_lists (self.green_lists (),
+                                       self.show_green_lists))
+
+  def green_request_granted(self):
+    if (self.do_trace):
+      self.trace ("start green request granted", None,
+                  "Starting Green Request Granted system program.\n")
+
+    # If a signal face is on the requesting green list, but is no longer
+    # requesting green, remove it from the list.  This usually happens
+    # because the signal face has turned green, but can also happen
+    # if a vehicle makes a permissive right turn so the signal face
+    # no longer needs to turn green.
+
+    to_remove = list()
+    for signal_face in self.requesting_green:
+      if (not self.toggle_value(signal_face, "Request Green")):
+        if (self.verbosity_level >= 4):
+          print (format_time(self.current_time) + " signal face " +
+                 signal_face["name"] + " is no longer requesting green.")
         to_remove.append(signal_face)
-  for signal_face in to_remove:
-    allowed_green.remove(signal_face)
-    signal_face_name = signal_face["name"]
-    if (table_OK (4)):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          signal_face["name"] + " & " +
-                          "This lane is no longer requesting clearance.  " +
-                          format_lists() + "\\\\\n")
-      
-      if (flush_table_file):
-        table_file.flush()
-
-    # Remove the clearance request from the signal faces we sent it to.
-    for conflicting_face in signal_faces_list:
-      if (signal_face_name in conflicting_face["clearance requested by"]):
-        if (verbosity_level >= 5):
-          print (format_time(current_time) + " signal face " +
-                 signal_face_name + " no longer requesting clearance from " +
-                 conflicting_face["name"] + ".")
-        conflicting_face["clearance requested by"].remove(signal_face_name)
-        if (len(conflicting_face["clearance requested by"]) == 0):
-          set_toggle_value (conflicting_face, "Clearance Requested", False,
-                            "system program Green Request Granted" +
-                            " because lane " + signal_face_name +
-                            " (and perhaps others) " +
-                            " is no longer requesting clearance.")
-              
-  # If a signal face is requesting green, place it on the list of
-  # signal faces requesting green unless it is already on the list
-  # or is on the list of signal faces allowed to turn green.
-  for signal_face in signal_faces_list:
-    if ((toggle_value(signal_face, "Request Green")) and
-         (signal_face not in requesting_green) and
-         (signal_face not in allowed_green)):
-      if (verbosity_level >= 4):
-        print (format_time(current_time) + " signal face " +
-               signal_face["name"] + " requesting green.")
-      requesting_green.append(signal_face)
-      if (table_OK (4)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          signal_face ["name"] + " & Requesting green.  " +
-                          format_lists () + "\\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-
-      # Start the waiting clock.  It will end when traffic flows
-      # at this signal face.              
-      if ("waiting" not in signal_face):
-        signal_face["waiting"] = False
-      if (not signal_face["waiting"]):
-        signal_face["wait start"] = current_time
-        signal_face["waiting"] = True
-        if (verbosity_level >= 5):
-          print (format_time(current_time) + " signal face " +
-                 signal_face["name"] + " starts waiting.")
-        if (table_OK (5)):
-          table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                            signal_face ["name"] + " & Start waiting. \\\\\n")
-          if (flush_table_file):
-            table_file.flush()
-
-  # If the list of signal faces allowed to turn green is empty,
-  # allow the oldest signal face on the list of signal faces
-  # requesting to turn green to turn green and empty the list
-  # of signal faces that have turned green out of turn.
-  if ((len(allowed_green) == 0) and (len(requesting_green) > 0)):
-    next_green = requesting_green.pop(0)  
-    allowed_green.append(next_green)
-    had_its_chance = list()
-    no_activity = False
-    if (verbosity_level >= 4):
-      print (format_time(current_time) + " signal face " + next_green["name"] +
-             " Allowed to request clearance because no other lane is" +
-             " allowed to request clearance.")
-    if (table_OK (4)):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        next_green ["name"] + " &" +
+    for signal_face in to_remove:
+      self.requesting_green.remove(signal_face)
+      if (self.table_wanted (4)):
+        self.table_row (4, signal_face["name"],
+                        " is no longer requesting green.  ",
+                        green_lists=self.green_lists ())
+
+
+    # Likewise, if a signal face is on the allowed green list, but is no
+    # longer interested in turning green, remove it from the list.
+    to_remove = list()
+    for signal_face in self.allowed_green:
+      if (not self.toggle_value(signal_face, "Request Green")):
+        if (not ((self.toggle_value(signal_face, "Request Clearance")) or
+                 self.toggle_value(signal_face, "Request Partial Clearance"))):
+          if (self.verbosity_level >= 4):
+            print (format_time(self.current_time) + " signal face " +
+                   signal_face["name"] + " no longer requesting clearance.")
+          to_remove.append(signal_face)
+    for signal_face in to_remove:
+      self.allowed_green.remove(signal_face)
+      signal_face_name = signal_face["name"]
+      if (self.table_wanted (4)):
+        self.table_row (4, signal_face["name"],
+                        " This lane is no longer requesting clearance.  ",
+                        green_lists=self.green_lists ())
+
+
+      # Remove the clearance request from the signal faces we sent it to.
+      for conflicting_face in self.signal_faces_list:
+        if (signal_face_name in conflicting_face["clearance requested by"]):
+          if (self.verbosity_level >= 5):
+            print (format_time(self.current_time) + " signal face " +
+                   signal_face_name + " no longer requesting clearance from " +
+                   conflicting_face["name"] + ".")
+          conflicting_face["clearance requested by"].remove(signal_face_name)
+          if (len(conflicting_face["clearance requested by"]) == 0):
+            self.set_toggle_value (conflicting_face, "Clearance Requested",
+                                   False,
+                                   "system program Green Request Granted" +
+                                   " because lane " + signal_face_name +
+                                   " (and perhaps others) " +
+                                   " is no longer requesting clearance.")
+
+    # If a signal face is requesting green, place it on the list of
+    # signal faces requesting green unless it is already on the list
+    # or is on the list of signal faces allowed to turn green.
+    for signal_face in self.signal_faces_list:
+      if ((self.toggle_value(signal_face, "Request Green")) and
+           (signal_face not in self.requesting_green) and
+           (signal_face not in self.allowed_green)):
+        if (self.verbosity_level >= 4):
+          print (format_time(self.current_time) + " signal face " +
+                 signal_face["name"] + " requesting green.")
+        self.requesting_green.append(signal_face)
+        if (self.table_wanted (4)):
+          self.table_row (4, signal_face["name"], " Requesting green.  ",
+                          green_lists=self.green_lists ())
+
+        # Start the waiting clock.  It will end when traffic flows
+        # at this signal face.              
+        if ("waiting" not in signal_face):
+          signal_face["waiting"] = False
+        if (not signal_face["waiting"]):
+          signal_face["wait start"] = self.current_time
+          signal_face["waiting"] = True
+          if (self.verbosity_level >= 5):
+            print (format_time(self.current_time) + " signal face " +
+                   signal_face["name"] + " starts waiting.")
+          if (self.table_wanted (5)):
+            self.table_row (5, signal_face["name"], " Start waiting. ")
+
+    # If the list of signal faces allowed to turn green is empty,
+    # allow the oldest signal face on the list of signal faces
+    # requesting to turn green to turn green and empty the list
+    # of signal faces that have turned green out of turn.
+    if ((len(self.allowed_green) == 0) and (len(self.requesting_green) > 0)):
+      next_green = self.requesting_green.pop(0)  
+      self.allowed_green.append(next_green)
+      self.had_its_chance = list()
+      self.no_activity = False
+      if (self.verbosity_level >= 4):
+        print (format_time(self.current_time) + " signal face " +
+               next_green["name"] +
+               " Allowed to request clearance because no other lane is" +
+               " allowed to request clearance.")
+      if (self.table_wanted (4)):
+        self.table_row (4, next_green["name"],
                         " This lane is allowed to request clearance because" +
-                        " no other lane is allowed to request clearance.  " +
-                        format_lists () + "\\\\\n")
-      if (flush_table_file):
-        table_file.flush()
-
-      if (do_trace):
-        trace_file.write ("Lane " + signal_face["name"] +
-                          " may request clearance: first in line.\n")
-        trace_file.write (format_lists () + "\n\n")
-
-  # If the oldest signal face on the list of signal faces requesting
-  # to turn green does not conflict with any of the signal faces already
-  # allowed to turn green, also allow it to turn green.  Keep doing this
-  # until either there are no signal faces requesting to turn green
-  # or the oldest signal face has a conflict.
-  keep_greening = True
-  while (keep_greening):
-    if (len(requesting_green) == 0):
-      keep_greening = False
-      continue
-    signal_face = requesting_green[0]
-    no_conflicts = True
-    keep_greening= False
-    for conflicting_signal_face in allowed_green:
-      if (does_conflict (signal_face, conflicting_signal_face)):
-        no_conflicts = False
-        
-    # Add "or True" to the conditional test below to test safety_check.
-    # Doing that will cause any complex script, including the multiple script
-    # used to build the documentation, to switch to flashing.
-    
-    if (no_conflicts): 
-      requesting_green.remove(signal_face)
-      allowed_green.append(signal_face)
-      had_its_chance.append(signal_face)
-
-      if (do_trace):
-        trace_file.write ("Lane " + signal_face["name"] +
-                          " may request clearance: in order.\n")
-        trace_file.write (format_lists () + "\n\n")
-
-        
-      if (verbosity_level >= 4):
-        print (format_time(current_time) + " lane " + signal_face["name"] +
-               " is allowed to request clearance because it does not" +
-               " conflict with any lane that is already allowed to" +
-               " request clearance.")
-      if (table_OK (4)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          signal_face ["name"] + " &" +
+                        " no other lane is allowed to request clearance.  ",
+                        green_lists=self.green_lists ())
+
+      if (self.table_OK (4) and self.do_trace):
+        self.trace ("may request clearance", signal_face["name"],
+                    "Lane " + signal_face["name"] +
+                    " may request clearance: first in line.\n" +
+                    self.format_lists () + "\n\n",
+                    fields={"reason": "first in line",
+                            "green lists": self.green_lists ()})
+
+    # If the oldest signal face on the list of signal faces requesting
+    # to turn green does not conflict with any of the signal faces already
+    # allowed to turn green, also allow it to turn green.  Keep doing this
+    # until either there are no signal faces requesting to turn green
+    # or the oldest signal face has a conflict.
+    keep_greening = True
+    while (keep_greening):
+      if (len(self.requesting_green) == 0):
+        keep_greening = False
+        continue
+      signal_face = self.requesting_green[0]
+      no_conflicts = True
+      keep_greening= False
+      for conflicting_signal_face in self.allowed_green:
+        if (self.does_conflict (signal_face, conflicting_signal_face)):
+          no_conflicts = False
+
+      # Add "or True" to the conditional test below to test safety_check.
+      # Doing that will cause any complex script, including the multiple script
+      # used to build the documentation, to switch to flashing.
+
+      if (no_conflicts): 
+        self.requesting_green.remove(signal_face)
+        self.allowed_green.append(signal_face)
+        self.had_its_chance.append(signal_face)
+
+        if (self.do_trace):
+          self.trace ("may request clearance", signal_face["name"],
+                      "Lane " + signal_face["name"] +
+                      " may request clearance: in order.\n" +
+                      self.format_lists () + "\n\n",
+                      fields={"reason": "in order",
+                              "green lists": self.green_lists ()})
+
+        if (self.verbosity_level >= 4):
+          print (format_time(self.current_time) + " lane " +
+                 signal_face["name"] +
+                 " is allowed to request clearance because it does not" +
+                 " conflict with any lane that is already allowed to" +
+                 " request clearance.")
+        if (self.table_wanted (4)):
+          self.table_row (4, signal_face["name"],
                           " This lane is allowed to request clearance " +
                           " because it does not conflict with any lanes " +
                           " that are already allowed to request"
-                          " clearance.  " + format_lists() + "\\\\\n")
-          
-                            
-        if (flush_table_file):
-          table_file.flush()
-          
-      keep_greening = True
-      no_activity = False
-    
-  # Allow a signal face to turn green even if it is not its turn
-  # provided it does not conflict with any signal face already
-  # allowed to turn green and has not already been allowed to turn
-  # green out of turn since the oldest waiting signal face was allowed
-  # to turn green.  However, if the oldest signal face has
-  # been waiting a long time, don't allow any other signal face
-  # to go ahead of it.
-  if (len(requesting_green) > 0):
-    signal_face = requesting_green[0]
-    oldest_signal_face = signal_face
-    waiting_time = current_time - signal_face["wait start"]
-    if (waiting_time > signal_face["waiting limit"]):
-      if (verbosity_level >= 4):
-        print (format_time(current_time) + " signal face " +
-               signal_face["name"] +
-               " is given preference because it has been waiting for " +
-               format_time(waiting_time) + ".")
-      if (table_OK (4)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        signal_face ["name"] + " & This lane is given" +
-                        " preference for requesting clearance" +
-                        " because it has been waiting" +
-                        " for " + format_time(waiting_time) + ".  " +
-                        format_lists() + "\\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-    else:
-      to_remove = list()
-      for signal_face in requesting_green:
-        no_conflicts = True
-        for conflicting_signal_face in allowed_green:
-          if (does_conflict (signal_face, conflicting_signal_face)):
-            no_conflicts = False
-        for conflicting_signal_face in to_remove:
-          if (does_conflict (signal_face, conflicting_signal_face)):
-            no_conflicts = False
-        if (no_conflicts and (signal_face not in had_its_chance)):
-          to_remove.append(signal_face)
-          no_activity = False
-          
-          if (verbosity_level >= 4):
-            print (format_time(current_time) + " signal face " +
-                   signal_face["name"] +
-                   " is allowed to turn green because it does not conflict" +
-                   " with any other face that is already allowed to turn" +
-                   " green and has not already turned green while the oldest" +
-                   " signal face has been waiting for its turn.")
-            
-      for signal_face in to_remove:
-        requesting_green.remove(signal_face)
-        allowed_green.append(signal_face)
-        had_its_chance.append(signal_face)
-
-        if (do_trace):
-          trace_file.write ("Lane " + signal_face["name"] +
-                            " may request clearance: jump the line.\n")
-          trace_file.write (format_lists () + "\n\n")
-
-          
-        if (table_OK (4)):
-          table_file.write ("\\hline " + format_time_N(current_time) +
-                            " & " + signal_face ["name"] + " &" +
+                          " clearance.  ", green_lists=self.green_lists ())
+
+
+        keep_greening = True
+        self.no_activity = False
+
+    # Allow a signal face to turn green even if it is not its turn
+    # provided it does not conflict with any signal face already
+    # allowed to turn green and has not already been allowed to turn
+    # green out of turn since the oldest waiting signal face was allowed
+    # to turn green.  However, if the oldest signal face has
+    # been waiting a long time, don't allow any other signal face
+    # to go ahead of it.
+    if (len(self.requesting_green) > 0):
+      signal_face = self.requesting_green[0]
+      oldest_signal_face = signal_face
+      waiting_time = self.current_time - signal_face["wait start"]
+      if (waiting_time > signal_face["waiting limit"]):
+        if (self.verbosity_level >= 4):
+          print (format_time(self.current_time) + " signal face " +
+                 signal_face["name"] +
+                 " is given preference because it has been waiting for " +
+                 format_time(waiting_time) + ".")
+        if (self.table_wanted (4)):
+          self.table_row (4, signal_face["name"],
+                          " This lane is given" +
+                          " preference for requesting clearance" +
+                          " because it has been waiting" +
+                          " for " + format_time(waiting_time) + ".  ",
+                          green_lists=self.green_lists ())
+      else:
+        to_remove = list()
+        for signal_face in self.requesting_green:
+          no_conflicts = True
+          for conflicting_signal_face in self.allowed_green:
+            if (self.does_conflict (signal_face, conflicting_signal_face)):
+              no_conflicts = False
+          for conflicting_signal_face in to_remove:
+            if (self.does_conflict (signal_face, conflicting_signal_face)):
+              no_conflicts = False
+          if (no_conflicts and (signal_face not in self.had_its_chance)):
+            to_remove.append(signal_face)
+            self.no_activity = False
+
+            if (self.verbosity_level >= 4):
+              print (
+                format_time(self.current_time) + " signal face " +
+                signal_face["name"] +
+                " is allowed to turn green because it does not conflict" +
+                " with any other face that is already allowed to turn" +
+                " green and has not already turned green while the oldest" +
+                " signal face has been waiting for its turn.")
+
+        for signal_face in to_remove:
+          self.requesting_green.remove(signal_face)
+          self.allowed_green.append(signal_face)
+          self.had_its_chance.append(signal_face)
+
+          if (self.do_trace):
+            self.trace ("may request clearance", signal_face["name"],
+                        "Lane " + signal_face["name"] +
+                        " may request clearance: jump the line.\n" +
+                        self.format_lists () + "\n\n",
+                        fields={"reason": "jump the line",
+                                "green lists": self.green_lists ()})
+
+          if (self.table_wanted (4)):
+            self.table_row (4, signal_face["name"],
                             " This lane is allowed to request clearance" +
                             " because it does not conflict with any other" +
                             " lane that is already allowed to request" +
                             " clearance and it has not already been" +
                             " allowed to request clearance while the" +
                             " lane that has been waiting longest " +
-                            " has been waiting for its turn.  " +
-                            format_lists() + "\\\\\n")
-          if (flush_table_file):
-            table_file.flush()
-            
-  # Remove a signal face from the allowed green list if it has its
-  # traffic flowing.  This will allow the next signal face in the
-  # requesting green list, if there is one, to be allowed to turn green.
-  # That signal face will conflict with a signal face that is already green,
-  # thus causing it to turn red.
-  to_remove = list()
-  for signal_face in allowed_green:
-    if (toggle_value(signal_face, "Traffic Flowing")):
-      no_activity = False
-      to_remove.append(signal_face)
-      set_toggle_value (signal_face, "Green Request Granted", False,
-                        "system program Green Request Granted" +
-                        " because its traffic is flowing")
-      signal_face["clearance requested by"] = set()
-      if (verbosity_level >= 5):
-        print (format_time(current_time) + " signal face " +
-               signal_face["name"] + " traffic is now flowing.")
-      
-  for signal_face in to_remove:
-    allowed_green.remove(signal_face)
-    
-  for signal_face in allowed_green:
-    set_toggle_value (signal_face, "Green Request Granted", True,
-                      "system program Green Request Granted")
-  if (do_trace):
-    trace_file.write ("End of Green Request Granted system program.\n")
-    
-  return
+                            " has been waiting for its turn.  ",
+                            green_lists=self.green_lists ())
+
+    # Remove a signal face from the allowed green list if it has its
+    # traffic flowing.  This will allow the next signal face in the
+    # requesting green list, if there is one, to be allowed to turn green.
+    # That signal face will conflict with a signal face that is already green,
+    # thus causing it to turn red.
+    to_remove = list()
+    for signal_face in self.allowed_green:
+      if (self.toggle_value(signal_face, "Traffic Flowing")):
+        self.no_activity = False
+        to_remove.append(signal_face)
+        self.set_toggle_value (signal_face, "Green Request Granted", False,
+                               "system program Green Request Granted" +
+                               " because its traffic is flowing")
+        signal_face["clearance requested by"] = set()
+        if (self.verbosity_level >= 5):
+          print (format_time(self.current_time) + " signal face " +
+                 signal_face["name"] + " traffic is now flowing.")
+
+    for signal_face in to_remove:
+      self.allowed_green.remove(signal_face)
+
+    for signal_face in self.allowed_green:
+      self.set_toggle_value (signal_face, "Green Request Granted", True,
+                             "system program Green Request Granted")
+    if (self.do_trace):
+      self.trace ("end green request granted", None,
+                  "End of Green Request Granted system program.\n")
 
-def clearance_requested():
-  for signal_face in signal_faces_list:
-    if (toggle_value (signal_face, "Request Clearance")):
-      conflicting_face_names = signal_face ["conflicts"]
-      for conflicting_face_name in conflicting_face_names:
-        conflicting_face = signal_faces_dict[conflicting_face_name]
-        if (not toggle_value (conflicting_face, "Cleared")):
-          set_toggle_value (conflicting_face, "Clearance Requested", True,
-                            "system program Clearance Requested")
-          conflicting_face["clearance requested by"].add(signal_face["name"])
-  return
-        
-def partial_clearance_requested():
-  for signal_face in signal_faces_list:
-    if (toggle_value (signal_face, "Request Partial Clearance")):
-      conflicting_face_names = signal_face ["partial conflicts"]
-      for conflicting_face_name in conflicting_face_names:
-        conflicting_face = signal_faces_dict[conflicting_face_name]
-        if (not toggle_value (conflicting_face, "Cleared")):
-          set_toggle_value (conflicting_face, "Clearance Requested", True,
-                            "system program Partial Clearance Requested")
-          conflicting_face["clearance requested by"].add(signal_face["name"])
-  return
+    return
 
-# Maintain the Conflicting Paths are Clear toggle.  It is false
-# unless the signal face is requesting clearance and all conflicting
-# paths are clear.
-def conflicting_paths_are_clear():
-  for signal_face in signal_faces_list:
-    all_paths_clear = False
-    if (toggle_value (signal_face, "Request Clearance") or
-        toggle_value (signal_face, "Request Partial Clearance")):
-      all_paths_clear = True
-      conflicting_face_names = signal_face ["conflicts"]
-      for conflicting_face_name in conflicting_face_names:
-        conflicting_face = signal_faces_dict[conflicting_face_name]
-        if (not toggle_value (conflicting_face, "Cleared")):
-          all_paths_clear = False
-    set_toggle_value (signal_face, "Conflicting Paths are Clear",
-                      all_paths_clear,
-                      "system program Conflicting Paths are Clear")
-  return
+  def clearance_requested(self):
+    for signal_face in self.signal_faces_list:
+      if (self.toggle_value (signal_face, "Request Clearance")):
+        conflicting_face_names = signal_face ["conflicts"]
+        for conflicting_face_name in conflicting_face_names:
+          conflicting_face = self.signal_faces_dict[conflicting_face_name]
+          if (not self.toggle_value (conflicting_face, "Cleared")):
+            self.set_toggle_value (conflicting_face, "Clearance Requested",
+                                   True,
+                                   "system program Clearance Requested")
+            conflicting_face["clearance requested by"].add(signal_face["name"])
+    return
 
-# Do the same for partial conflicting paths.
-
-def partial_conflicting_paths_are_clear():
-  for signal_face in signal_faces_list:
-    all_paths_clear = False
-    if (toggle_value (signal_face, "Request Partial Clearance")):
-      all_paths_clear = True
-      conflicting_face_names = signal_face ["partial conflicts"]
-      for conflicting_face_name in conflicting_face_names:
-        conflicting_face = signal_faces_dict[conflicting_face_name]
-        if (not toggle_value (conflicting_face, "Cleared")):
-          all_paths_clear = False
-    set_toggle_value (signal_face, "Partial Conflicting Paths are Clear",
-                      all_paths_clear,
-                      "system program Partial Conflicting Paths are Clear")
-  return
+  def partial_clearance_requested(self):
+    for signal_face in self.signal_faces_list:
+      if (self.toggle_value (signal_face, "Request Partial Clearance")):
+        conflicting_face_names = signal_face ["partial conflicts"]
+        for conflicting_face_name in conflicting_face_names:
+          conflicting_face = self.signal_faces_dict[conflicting_face_name]
+          if (not self.toggle_value (conflicting_face, "Cleared")):
+            self.set_toggle_value (conflicting_face, "Clearance Requested",
+                                   True,
+                                   "system program Partial Clearance " +
+                                   "Requested")
+            conflicting_face["clearance requested by"].add(signal_face["name"])
+    return
 
-# Check for conflicting greens, since this is a safety issue.
-def safety_check ():
-  global error_counter
-
-  conflict_detected = False
-  conflict_list = list()
-  if (verbosity_level >= 5):
-    print (format_time(current_time) + " start safety check.")
-    
-  for signal_face in signal_faces_list:
-    if (signal_face["state"] == "Green"):
-      for conflicting_signal_face in signal_faces_list:
-        if ((conflicting_signal_face != signal_face) and
-            (conflicting_signal_face["state"] == "Green")):
-          if (does_conflict (signal_face, conflicting_signal_face)):
-            if (verbosity_level >= 1):
-              print (format_time(current_time) + " signal faces " +
-               signal_face["name"] + " and " +
-               conflicting_signal_face["name"] + " are both green.")
-            if (do_trace):
-              trace_file.write ("Safety Check detected a failure.\n")
-              pprint.pprint (signal_face, trace_file)
-              pprint.pprint (conflicting_signal_face, trace_file)
-            conflict_detected = True
-            conflict_list.append((signal_face, conflicting_signal_face))
-
-  # If there is a conflict set all signal faces to flashing.
-  if (conflict_detected):
-    for signal_face in signal_faces_list:
-      sensors = signal_face["sensors"]
-      sensor = sensors["Flash"]
-      sensor ["value"] = True
-
-      if (verbosity_level >= 2):
-        print (format_time(current_time)  + " sensor " +
-               signal_face["name"] + "/" + "Flash" + " set to " +
-                   str(sensor["value"]) + " by system program safety check.")
-      if (table_OK (2)):
-        table_file.write ("\\hline " + format_time_N(current_time) +
-                          " & " + signal_face ["name"] + " & Sensor " +
-                          "Flash" + " set to " + str(sensor["value"]) +
-                          " by system program safety check. " +
-                          "\\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-
-  if (table_OK (2)):
-    for signal_face_pair in conflict_list:
-      signal_face = signal_face_pair[0]
-      conflicting_signal_face = signal_face_pair[1]
-      table_file.write ("\\hline " + format_time_N(current_time) +
-                        " & " + signal_face ["name"] + " & conflicts with " +
-                        conflicting_signal_face["name"] +
-                        " and both are green. \\\\\n")
-      if (flush_table_file):
-        table_file.flush()
-      
-  if (verbosity_level >= 5):
-    print (format_time(current_time) + " end safety check.")
+  # Maintain the Conflicting Paths are Clear toggle.  It is false
+  # unless the signal face is requesting clearance and all conflicting
+  # paths are clear.
+  def conflicting_paths_are_clear(self):
+    for signal_face in self.signal_faces_list:
+      all_paths_clear = False
+      if (self.toggle_value (signal_face, "Request Clearance") or
+          self.toggle_value (signal_face, "Request Partial Clearance")):
+        all_paths_clear = True
+        conflicting_face_names = signal_face ["conflicts"]
+        for conflicting_face_name in conflicting_face_names:
+          conflicting_face = self.signal_faces_dict[conflicting_face_name]
+          if (not self.toggle_value (conflicting_face, "Cleared")):
+            all_paths_clear = False
+      self.set_toggle_value (signal_face, "Conflicting Paths are Clear",
+                             all_paths_clear,
+                             "system program Conflicting Paths are Clear")
+    return
 
-  return
+  def partial_conflicting_paths_are_clear(self):
+    for signal_face in self.signal_faces_list:
+      all_paths_clear = False
+      if (self.toggle_value (signal_face, "Request Partial Clearance")):
+        all_paths_clear = True
+        conflicting_face_names = signal_face ["partial conflicts"]
+        for conflicting_face_name in conflicting_face_names:
+          conflicting_face = self.signal_faces_dict[conflicting_face_name]
+          if (not self.toggle_value (conflicting_face, "Cleared")):
+            all_paths_clear = False
+      self.set_toggle_value (signal_face,
+                             "Partial Conflicting Paths are Clear",
+                             all_paths_clear,
+                             "system program Partial Conflicting " +
+                             "Paths are Clear")
+    return
 
-# the traffic signal simulator: run the finite state machines
+  # Check for conflicting greens, since this is a safety issue.
+  def safety_check (self):
+    conflict_detected = False
+    conflict_list = list()
+    if (self.verbosity_level >= 5):
+      print (format_time(self.current_time) + " start safety check.")
+
+    for signal_face in self.signal_faces_list:
+      if (signal_face["state"] == "Green"):
+        for conflicting_signal_face in self.signal_faces_list:
+          if ((conflicting_signal_face != signal_face) and
+              (conflicting_signal_face["state"] == "Green")):
+            if (self.does_conflict (signal_face, conflicting_signal_face)):
+              if (self.verbosity_level >= 1):
+                print (format_time(self.current_time) + " signal faces " +
+                 signal_face["name"] + " and " +
+                 conflicting_signal_face["name"] + " are both green.")
+              if (self.do_trace):
+                self.trace ("safety check failure", signal_face["name"],
+                            "Safety Check detected a failure.\n",
+                            state=signal_face,
+                            items=(conflicting_signal_face,),
+                            fields={"conflicting signal face":
+                                    conflicting_signal_face})
+              conflict_detected = True
+              conflict_list.append((signal_face, conflicting_signal_face))
+
+    # If there is a conflict set all signal faces to flashing.
+    if (conflict_detected):
+      for signal_face in self.signal_faces_list:
+        sensors = signal_face["sensors"]
+        sensor = sensors["Flash"]
+        sensor ["value"] = True
+
+        if (self.verbosity_level >= 2):
+          print (format_time(self.current_time)  + " sensor " +
+                 signal_face["name"] + "/" + "Flash" + " set to " +
+                     str(sensor["value"]) + " by system program safety check.")
+        if (self.table_wanted (2)):
+          self.table_row (2, signal_face["name"],
+                          " Sensor " + "Flash" + " set to " +
+                          str(sensor["value"]) +
+                          " by system program safety check. ")
+
+    if (self.table_wanted (2)):
+      for signal_face_pair in conflict_list:
+        signal_face = signal_face_pair[0]
+        conflicting_signal_face = signal_face_pair[1]
+        self.table_row (2, signal_face["name"],
+                        " conflicts with " + conflicting_signal_face["name"] +
+                        " and both are green. ")
+
+    if (conflict_detected):
+      if (self.bus.wants (event_bus.ConflictingGreens)):
+        for signal_face, conflicting_signal_face in conflict_list:
+          self.bus.emit (event_bus.ConflictingGreens (
+            self.current_time, signal_face["name"],
+            conflicting_signal_face["name"]))
+      self.dump_flight_recorder ("a safety check failure")
+
+    if (self.verbosity_level >= 5):
+      print (format_time(self.current_time) + " end safety check.")
 
-# subroutine to convert a fraction to a decimal
-def convert_fraction_to_decimal (the_fraction):
-  the_numerator = the_fraction.numerator
-  the_denominator = the_fraction.denominator
-  result = decimal.Decimal(the_numerator) / decimal.Decimal(the_denominator)
-  return (result)
+    return
 
-# Subroutine to compute the duration of a timer.
-def compute_duration (signal_face, timer):
-  global error_counter
-
-  timer_duration_list = timer["duration"]
-  if (timer_duration_list[0] == "inf"):
-    # If a timer's duration is unlimited it cannot be variable.
-    return ("timer is umlimited", decimal.Decimal("inf"))
-
-  if (len(timer_duration_list) < 2):
-    # duration is finite and not variable
-    return ("", decimal.Decimal(timer_duration_list[0]))
-  
-  duration_max = decimal.Decimal(timer_duration_list[0])
-  duration_variable = timer_duration_list[1]
-  duration_min = decimal.Decimal(duration_variable[0])
-  duration_name = duration_variable[1]
-  variable_start = decimal.Decimal(duration_variable[2])
-  variable_end = decimal.Decimal(duration_variable[3])
-  timer_name = timer["name"]
-
-  target_found = False
-  timers_list = signal_face["timers"]
-  for target_timer in timers_list:
-    if (target_timer["name"] == duration_name):
-      target_found = True
-      break
-  
-  if (not target_found):
-    print ("No target for variable timer: " + duration_name)
-    error_counter = error_counter + 1
-    return ("farget timer " + duration_name + " not found", duration_max)
-
-  if (target_timer["state"] != "running"):
-    return ("timer " + duration_name + " is not running", duration_max)
-  remaining_time = convert_fraction_to_decimal(target_timer["remaining time"])
-  if (remaining_time > variable_start):
-    return ("timer " + duration_name + " has remaining time " +
-            format_duration(remaining_time) +
-            " which is greater than " +
-            format_duration(variable_start), duration_max)
-  if (remaining_time < variable_end):
+  # Subroutine to compute the duration of a timer.
+  def compute_duration (self, signal_face, timer):
+    timer_duration_list = timer["duration"]
+    if (timer_duration_list[0] == "inf"):
+      # If a timer's duration is unlimited it cannot be variable.
+      return ("timer is umlimited", decimal.Decimal("inf"))
+
+    if (len(timer_duration_list) < 2):
+      # duration is finite and not variable
+      return ("", decimal.Decimal(timer_duration_list[0]))
+
+    duration_max = decimal.Decimal(timer_duration_list[0])
+    duration_variable = timer_duration_list[1]
+    duration_min = decimal.Decimal(duration_variable[0])
+    duration_name = duration_variable[1]
+    variable_start = decimal.Decimal(duration_variable[2])
+    variable_end = decimal.Decimal(duration_variable[3])
+    timer_name = timer["name"]
+
+    target_found = False
+    timers_list = signal_face["timers"]
+    for target_timer in timers_list:
+      if (target_timer["name"] == duration_name):
+        target_found = True
+        break
+
+    if (not target_found):
+      print ("No target for variable timer: " + duration_name)
+      self.error_counter = self.error_counter + 1
+      return ("farget timer " + duration_name + " not found", duration_max)
+
+    if (target_timer["state"] != "running"):
+      return ("timer " + duration_name + " is not running", duration_max)
+    remaining_time = convert_fraction_to_decimal(
+      target_timer["remaining time"])
+    if (remaining_time > variable_start):
+      return ("timer " + duration_name + " has remaining time " +
+              format_duration(remaining_time) +
+              " which is greater than " +
+              format_duration(variable_start), duration_max)
+    if (remaining_time < variable_end):
+      return ("timer " + duration_name + " has remaining time " +
+              format_duration(remaining_time) +
+              " which is less than " +
+              format_duration(variable_end), duration_min)
+    remaining_span = variable_start - variable_end
+    variable_span = duration_max - duration_min
+    span_ratio = variable_span / remaining_span
+    current_progress = variable_start - remaining_time
+    variable_progress = current_progress * span_ratio
+    duration_result = duration_max - variable_progress
     return ("timer " + duration_name + " has remaining time " +
             format_duration(remaining_time) +
-            " which is less than " +
-            format_duration(variable_end), duration_min)
-  remaining_span = variable_start - variable_end
-  variable_span = duration_max - duration_min
-  span_ratio = variable_span / remaining_span
-  current_progress = variable_start - remaining_time
-  variable_progress = current_progress * span_ratio
-  duration_result = duration_max - variable_progress
-  return ("timer " + duration_name + " has remaining time " +
-          format_duration(remaining_time) +
-          " which is between " +
-          format_duration(variable_start) +
-          " and " + format_duration(variable_end), duration_result)
-
-running_timers = list()
-
-def perform_actions (signal_face, substate):
-  global running_timers
-  global error_counter
-  global last_event_time
-  
-  for action in substate["actions"]:
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " signal face " +
-             signal_face["name"] + " action " + action[0] + " : " + action[1] +
-             ".")
-    match action[0]:
-      case "set lamp":
-        internal_lamp_name = action[1]
-        lamp_names_map = signal_face["lamp names map"]
-        if (internal_lamp_name in lamp_names_map):
-          external_lamp_name = lamp_names_map[internal_lamp_name]
-        else:
-          external_lamp_name = internal_lamp_name
+            " which is between " +
+            format_duration(variable_start) +
+            " and " + format_duration(variable_end), duration_result)
+
+  def perform_actions (self, signal_face, substate):
+    for action in substate["actions"]:
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " signal face " +
+               signal_face["name"] + " action " + action[0] + " : " +
+               action[1] +
+               ".")
+      match action[0]:
+        case "set lamp":
+          internal_lamp_name = action[1]
+          lamp_names_map = signal_face["lamp names map"]
+          if (internal_lamp_name in lamp_names_map):
+            external_lamp_name = lamp_names_map[internal_lamp_name]
+          else:
+            external_lamp_name = internal_lamp_name
 
-        if (signal_face["iluminated lamp name"] == external_lamp_name):
-          if (verbosity_level >= 5):
-            print (format_time(current_time) + " signal face " +
-                   signal_face["name"] + " lamp already set to " +
-                   external_lamp_name + ",")
-        else:
-          signal_face["iluminated lamp name"] = external_lamp_name
-          if (verbosity_level >= 2):
-            print (format_time(current_time) + " signal face " +
-                   signal_face["name"] + " lamp set to " + external_lamp_name +
-                   ".")
-          if (table_OK (2)):
-            table_file.write ("\\hline " + format_time_N(current_time) +
-                              " & " + signal_face["name"] +
-                              " & Set lamp to " + external_lamp_name +
-                              ". \\\\\n")
-            if (flush_table_file):
-              table_file.flush()
-          if (do_events_output):
-            events_file.write (str(current_time) + "," + signal_face["name"] +
-                               ",lamp," + external_lamp_name + "\n")
-            last_event_time = current_time
-          
-      case "set toggle":
-        set_toggle_value (signal_face, action[1], True, "")
-        
-      case "clear toggle":
-        # Don't clear a toggle if a sensor which sets it is still active.
-        new_toggle_value = False
-        signal_face_name = signal_face["name"]
-        toggle_name = action[1]
-        full_toggle_name = signal_face_name + "/" + toggle_name
-        # Check all of the signal faces to see if any have a sensor
-        # which triggers this toggle.
-        for test_signal_face in signal_faces_list:
-          test_signal_face_name = test_signal_face["name"]
-          test_sensors = test_signal_face["sensors"]
-          for test_sensor_name in test_sensors:
-            full_test_sensor_name = (test_signal_face_name + "/" +
-                                     test_sensor_name)
-            test_sensor = test_sensors[test_sensor_name]
-            test_toggle_names = test_sensor["toggles"]
-            for test_toggle_name in test_toggle_names:
-              exploded_test_toggle_name = test_toggle_name.partition("/")
-              if (exploded_test_toggle_name[1] == ""):
-                referenced_signal_face_name = test_signal_face_name
-                referenced_toggle_name_root = test_toggle_name
-              else:
-                referenced_signal_face_name = exploded_test_toggle_name[0]
-                referenced_toggle_name_root = exploded_test_toggle_name[2]
-              full_referenced_toggle_name = (referenced_signal_face_name +
-                                             "/" + referenced_toggle_name_root)
-              if (full_referenced_toggle_name == full_toggle_name):
-                # This sensor triggers the toggle we are trying to clear.
-                # If it is active we cannot clear this toggle.
-                if (test_sensor["value"]):
-                    new_toggle_value = True
-                    if (verbosity_level >= 5):
-                      print (format_time(current_time) + " signal face " +
-                             signal_face_name +
-                             " Unable to clear toggle " + toggle_name +
-                             " because sensor " + full_test_sensor_name +
-                             " is still active.")
-                    if (table_OK (5)):
-                      table_file.write ("\\hline " +
-                                        format_time_N(current_time) +
-                                        " & " + signal_face_name +
-                                        " & Unable to clear toggle " +
+          if (signal_face["iluminated lamp name"] == external_lamp_name):
+            if (self.verbosity_level >= 5):
+              print (format_time(self.current_time) + " signal face " +
+                     signal_face["name"] + " lamp already set to " +
+                     external_lamp_name + ",")
+          else:
+            signal_face["iluminated lamp name"] = external_lamp_name
+            if (self.verbosity_level >= 2):
+              print (format_time(self.current_time) + " signal face " +
+                     signal_face["name"] + " lamp set to " +
+                     external_lamp_name +
+                     ".")
+            if (self.table_wanted (2)):
+              self.table_row (2, signal_face["name"],
+                              " Set lamp to " + external_lamp_name + ". ")
+            if (self.bus.wants (event_bus.LampChange)):
+              self.bus.emit (event_bus.LampChange (self.current_time,
+                                                   signal_face["name"],
+                                                   external_lamp_name))
+
+        case "set toggle":
+          self.set_toggle_value (signal_face, action[1], True, "")
+
+        case "clear toggle":
+          # Don't clear a toggle if a sensor which sets it is still active.
+          new_toggle_value = False
+          signal_face_name = signal_face["name"]
+          toggle_name = action[1]
+          full_toggle_name = signal_face_name + "/" + toggle_name
+          # Check all of the signal faces to see if any have a sensor
+          # which triggers this toggle.
+          for test_signal_face in self.signal_faces_list:
+            test_signal_face_name = test_signal_face["name"]
+            test_sensors = test_signal_face["sensors"]
+            for test_sensor_name in test_sensors:
+              full_test_sensor_name = (test_signal_face_name + "/" +
+                                       test_sensor_name)
+              test_sensor = test_sensors[test_sensor_name]
+              test_toggle_names = test_sensor["toggles"]
+              for test_toggle_name in test_toggle_names:
+                exploded_test_toggle_name = test_toggle_name.partition("/")
+                if (exploded_test_toggle_name[1] == ""):
+                  referenced_signal_face_name = test_signal_face_name
+                  referenced_toggle_name_root = test_toggle_name
+                else:
+                  referenced_signal_face_name = exploded_test_toggle_name[0]
+                  referenced_toggle_name_root = exploded_test_toggle_name[2]
+                full_referenced_toggle_name = (referenced_signal_face_name +
+                                               "/" +
+                                               referenced_toggle_name_root)
+                if (full_referenced_toggle_name == full_toggle_name):
+                  # This sensor triggers the toggle we are trying to clear.
+                  # If it is active we cannot clear this toggle.
+                  if (test_sensor["value"]):
+                      new_toggle_value = True
+                      if (self.verbosity_level >= 5):
+                        print (format_time(self.current_time) +
+                               " signal face " +
+                               signal_face_name +
+                               " Unable to clear toggle " + toggle_name +
+                               " because sensor " + full_test_sensor_name +
+                               " is still active.")
+                      if (self.table_wanted (5)):
+                        self.table_row (5, signal_face_name,
+                                        " Unable to clear toggle " +
                                         toggle_name + " because sensor " +
                                         full_test_sensor_name +
-                                        " is still active." + "\\\\\n")
-                      if (flush_table_file):
-                        table_file.flush()
-              
-        if (not new_toggle_value):
-          set_toggle_value (signal_face, toggle_name, new_toggle_value, "")
-          
-      case "start timer":
-        timer_name = action[1]
+                                        " is still active.")
+
+          if (not new_toggle_value):
+            self.set_toggle_value (signal_face, toggle_name, new_toggle_value,
+                                   "")
+
+        case "start timer":
+          timer_name = action[1]
+          timers_list = signal_face["timers"]
+          for the_timer in timers_list:
+            if (the_timer["name"] == timer_name):
+              reason, timer_duration = self.compute_duration (signal_face,
+                                                              the_timer)
+              if (timer_duration != decimal.Decimal("inf")):
+                the_timer["state"] = "running"
+                the_timer["remaining time"] = timer_duration
+                remaining_time = fractions.Fraction(
+                  the_timer["remaining time"])
+                the_timer["completion time"] = (self.current_time +
+                                                remaining_time)
+                if (the_timer not in self.running_timers):
+                  self.running_timers.append(the_timer)
+                if (self.bus.wants (event_bus.TimerEvent)):
+                  self.bus.emit (event_bus.TimerEvent (
+                    self.current_time, signal_face["name"], timer_name,
+                    "started", timer_duration, reason))
+
+                if (reason != ""):
+                  explanation = " because " + reason
+                else:
+                  explanation = ""
+
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + " signal face " +
+                         signal_face["name"] + " start timer " +
+                         timer_name + " duration " +
+                         format_duration(the_timer["remaining time"]) +
+                         " will complete at " +
+                         format_time(the_timer["completion time"]) +
+                         explanation + ".")
+                if (self.table_wanted (4)):
+                  remaining_time = format_duration(the_timer["remaining time"])
+                  self.table_row (4, signal_face["name"],
+                                  " Start timer " + timer_name + " duration " +
+                                  remaining_time + explanation + ". ",
+                                  important=the_timer["important"])
+        case _:
+          if (self.verbosity_level >= 1):
+            print (format_time(self.current_time) + " signal face " +
+                   signal_face["name"] + " unknown action " + action[0] + ".")
+            self.error_counter = self.error_counter + 1
+
+    return    
+
+  # Subroutine to test a conditional to see if we should log it.
+  def conditional_is_important (self, signal_face, the_conditional):
+    if (not self.only_important):
+      return True
+
+    match the_conditional[0]:    
+      case "toggle is true" | "toggle is false":
+        toggle_name = the_conditional[1]
+        toggles_list = signal_face["toggles"]
+        for the_toggle in toggles_list:
+          if (the_toggle["name"] == toggle_name):
+            return (the_toggle["important"])
+        print ("toggle name invalid: " + toggle_name + ".")
+        self.error_counter = self.error_counter + 1
+
+      case "timer is completed" | "timer not complete":
+        timer_name = the_conditional[1]
         timers_list = signal_face["timers"]
         for the_timer in timers_list:
           if (the_timer["name"] == timer_name):
-            reason, timer_duration = compute_duration (signal_face, the_timer)
-            if (timer_duration != decimal.Decimal("inf")):
-              the_timer["state"] = "running"
-              the_timer["remaining time"] = timer_duration
-              remaining_time = fractions.Fraction(the_timer["remaining time"])
-              the_timer["completion time"] = current_time + remaining_time
-              if (the_timer not in running_timers):
-                running_timers.append(the_timer)
-                
-              if (reason != ""):
-                explanation = " because " + reason
-              else:
-                explanation = ""
-                
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + " signal face " +
-                       signal_face["name"] + " start timer " +
-                       timer_name + " duration " +
-                       format_duration(the_timer["remaining time"]) +
-                       " will complete at " +
-                       format_time(the_timer["completion time"]) +
-                       explanation + ".")
-              if (table_OK (4) and ((not only_important) or
-                                    the_timer["important"])):
-                remaining_time = format_duration(the_timer["remaining time"])
-                table_file.write ("\\hline " + format_time_N(current_time) +
-                                  " & " + signal_face ["name"] +
-                                  " & Start timer " + timer_name +
-                                  " duration " + remaining_time +
-                                  explanation + ". \\\\\n")
-                if (flush_table_file):
-                  table_file.flush()
+            return (the_timer["important"])
+        print ("timer name invalid: " + timer_name + ".")
+        self.error_counter = self.error_counter + 1
+
       case _:
-        if (verbosity_level >= 1):
-          print (format_time(current_time) + " signal face " +
-                 signal_face["name"] + " unknown action " + action[0] + ".")
-          error_counter = error_counter + 1
-          
-  return    
-
-# Subroutine to test a conditional to see if we should log it.
-def conditional_is_important (signal_face, the_conditional):
-  global error_counter
-  
-  if (not only_important):
-    return True
-  
-  match the_conditional[0]:    
-    case "toggle is true" | "toggle is false":
-      toggle_name = the_conditional[1]
-      toggles_list = signal_face["toggles"]
-      for the_toggle in toggles_list:
-        if (the_toggle["name"] == toggle_name):
-          return (the_toggle["important"])
-      print ("toggle name invalid: " + toggle_name + ".")
-      error_counter = error_counter + 1
-      
-    case "timer is completed" | "timer not complete":
-      timer_name = the_conditional[1]
-      timers_list = signal_face["timers"]
-      for the_timer in timers_list:
-        if (the_timer["name"] == timer_name):
-          return (the_timer["important"])
-      print ("timer name invalid: " + timer_name + ".")
-      error_counter = error_counter + 1
+        print ("condition is invalid: " + the_conditional[0] + ".")
+        self.error_counter = self.error_counter + 1
 
-    case _:
-      print ("condition is invalid: " + the_conditional[0] + ".")
-      error_counter = error_counter + 1
+    return False
 
-  return False
+  # Subroutine to find whether a condition tests an important toggle or
+  # timer, for the table log.
+  def condition_importance (self, signal_face, the_conditional):
+    match the_conditional[0]:
+      case "toggle is true" | "toggle is false":
+        the_items = signal_face["toggles"]
+      case "timer is completed" | "timer not complete":
+        the_items = signal_face["timers"]
+      case _:
+        return (False)
+    for the_item in the_items:
+      if (the_item["name"] == the_conditional[1]):
+        return (the_item["important"])
+    return (False)
 
-# Subroutine to describe a state transition.  If no description is needed
-# return the empty string.
-def describe_transition (signal_face, old_state_name, old_substate_name,
-                         state_name, substate_name, the_exit):
-  global error_counter
+  # Subroutine to record a state transition for the table log: the old
+  # and new states and substates, and the conditions of the exit taken.
+  def transition_record (self, signal_face, old_state_name,
+                         old_substate_name, state_name, substate_name,
+                         the_exit):
+    if (the_exit == None):
+      conditions = None
+    else:
+      conditions = [[the_conditional[0], the_conditional[1],
+                     self.condition_importance (signal_face,
+                                                the_conditional)]
+                    for the_conditional in the_exit[0]]
+    return ({"old state": old_state_name, "old substate": old_substate_name,
+             "state": state_name, "substate": substate_name,
+             "conditions": conditions})
+
+  # Subroutine to describe a state transition.  If no description is needed
+  # return the empty string.
+  def describe_transition (self, signal_face, old_state_name,
+                           old_substate_name, state_name, substate_name,
+                           the_exit):
+    description = render_table.describe_transition (
+      self.transition_record (signal_face, old_state_name,
+                              old_substate_name, state_name, substate_name,
+                              the_exit),
+      self.show_substates, self.explain_state_transitions,
+      self.only_important)
+    self.check_transition_conditions (signal_face, old_state_name,
+                                      old_substate_name, state_name,
+                                      substate_name, the_exit)
+    return (description)
 
-  if (show_substates):
+  # Subroutine to check the conditions of the exit which caused a state
+  # transition, when the transition is explained.  Each important
+  # condition must be one that can be displayed, and at least one must
+  # be important.  Count an error if not.
+  def check_transition_conditions (self, signal_face, old_state_name,
+                                   old_substate_name, state_name,
+                                   substate_name, the_exit):
+    if ((not self.explain_state_transitions) or (the_exit == None)):
+      return
+
+    # A transition is not shown, so not explained, unless its state
+    # changes, or its substate if substates are shown.
     if ((old_state_name == state_name) and
-        (old_substate_name == substate_name)):
-      return ("")
-  else:
-    if (old_state_name == state_name):
-      return ("")
-    
-  if (len(old_state_name) == 0):
-    description = "enter state " + state_name
-    if (show_substates):
-      description = description + " substate " + substate_name
-  else:
-    description = "transition from state " + old_state_name
-    if (show_substates):
-      description = description + " substate " + old_substate_name
-    description = description + " to state " + state_name
-    if (show_substates):
-      description = description + " substate " + substate_name
-      
-  if ((not explain_state_transitions) or (the_exit == None)):
-    return (description)
-  
-  description = description + " because"
-  conditionals = the_exit [0]
-  first_condition = True
-  condition_displayed = False
-  
-  for the_conditional in conditionals:
-    if (conditional_is_important (signal_face, the_conditional)):
-    
-      if (first_condition):
-        first_condition = False
-      else:
-        description = description + " and"
-      
-      match the_conditional[0]:    
-        case "toggle is true":
-          toggle_name = the_conditional[1]
-          description = (description + " toggle " + toggle_name + " is true")
-          condition_displayed = True
-
-        case "toggle is false":
-          toggle_name = the_conditional[1]
-          description = (description + " toggle " + toggle_name + " is false")
-          condition_displayed = True
-                
-        case "timer is completed":
-          timer_name = the_conditional[1]
-          description = (description + " timer " + timer_name +
-                         " has completed")
-          condition_displayed = True
-                
-        case "timer not complete":
-          timer_name = the_conditional[1]
-          description = (description + " timer " + timer_name +
-                         " has not completed")
-          condition_displayed = True
+        ((not self.show_substates) or
+         (old_substate_name == substate_name))):
+      return
+
+    conditionals = the_exit [0]
+    condition_displayed = False
 
-        case _:
-          print ("Invalid condition.")
-          pprint.pprint ((signal_face, old_state_name, old_substate_name,
-                          the_exit))
-          error_counter = error_counter + 1
-          
-  if (not condition_displayed):
-    print ("No condition displayed.")
-    pprint.pprint ((description, signal_face, old_state_name,
-                    old_substate_name, the_exit))
     for the_conditional in conditionals:
-      pprint.pprint (the_conditional)
-      importance = conditional_is_important (signal_face, the_conditional)
-      print (the_conditional[0] + ", " + the_conditional[1] + ", " +
-             str(importance) + ".")
-    error_counter = error_counter + 1
-      
-  return (description)
-
-# Subroutine to enter the signal face into the named state and substate.
-def enter_state (signal_face, state_name, substate_name, the_exit):
-  global no_activity
-
-  if ("state" in signal_face):
-    old_state_name = signal_face["state"]
-  else:
-    old_state_name = ""
-    
-  if ("substate" in signal_face):
-    old_substate_name = signal_face["substate"]
-  else:
-    old_substate_name = ""
+      if (self.conditional_is_important (signal_face, the_conditional)):
+        match the_conditional[0]:
+          case ("toggle is true" | "toggle is false" | "timer is completed" |
+                "timer not complete"):
+            condition_displayed = True
 
-  # Entering a state is only a significant event if the state is different.
-  significant_event = False
-  if ((state_name != old_state_name) or (substate_name != old_substate_name)):
-    no_activity = False
-    significant_event = True
-  else:
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " signal face " +
-             signal_face["name"] + " not a significant state change.")
-      
-  signal_face["state"] = state_name
-  signal_face["substate"] = substate_name
-
-  transition_reason = None
-  
-  if (((verbosity_level >= 3) and significant_event) or
-      (verbosity_level >= 5)):
-    transition_reason = describe_transition (signal_face, old_state_name,
-                                             old_substate_name,
-                                             state_name, substate_name,
-                                             the_exit)
-    if (len(transition_reason) > 0):
-      print (format_time(current_time) + " signal face " +
-             signal_face["name"] + " " + transition_reason + ".")
-  if ((table_OK (3) and significant_event) or (table_OK (5))):
-    if (transition_reason == None):
-      transition_reason = describe_transition (signal_face, old_state_name,
-                                               old_substate_name, state_name,
-                                               substate_name, the_exit)
-    if (len(transition_reason) > 0):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        signal_face["name"] + " & " +
-                        cap_first_letter (transition_reason) + ". \\\\\n")
-      if (flush_table_file):
-        table_file.flush()
-  states = finite_state_machine["states"]
-  state = states[state_name]
-  for substate in state:
-    if (substate["name"] == substate_name):
-      perform_actions (signal_face, substate)
-          
-  return
+          case _:
+            print ("Invalid condition.")
+            pprint.pprint ((signal_face, old_state_name, old_substate_name,
+                            the_exit))
+            self.error_counter = self.error_counter + 1
+
+    if (not condition_displayed):
+      print ("No condition displayed.")
+      pprint.pprint ((signal_face, old_state_name, old_substate_name,
+                      state_name, substate_name, the_exit))
+      for the_conditional in conditionals:
+        pprint.pprint (the_conditional)
+        importance = self.conditional_is_important (signal_face,
+                                                    the_conditional)
+        print (the_conditional[0] + ", " + the_conditional[1] + ", " +
+               str(importance) + ".")
+      self.error_counter = self.error_counter + 1
 
-# The traffic element dictionary holds information about each car, truck
-# and pedestrian who is close to the intersection.
-traffic_elements = dict()
-
-# Subroutine to return the speed limit for a traffic element
-# in a particular lane following a particular traffic path.
-# If the vehicle is in the intersection and is not just passing
-# through it is limited to the intersection speed.
-def speed_limit (lane_name, travel_path_name, was_stopped):
-  if ((lane_name == "intersection") and was_stopped):
-    return (intersection_info["intersection speed limit"])
-  else:
-    speed_limit_ident = travel_path_name + " / " + lane_name
-    return (speed_limits[speed_limit_ident])
-  
-# Rebuild the shape and clearance spaces of a traffic element
-# after it has moved.
-def rebuild_shapes (traffic_element):
-  global vehicle_clearance
-
-  if (do_trace):
-    trace_file.write ("Rebuild shapes:\n")
-    pprint.pprint (traffic_element, trace_file)
-    
-  # If the shape of a traffic element overlaps the shape of
-  # a sensor, the sensor is triggered by the traffic element.
-  start_x = traffic_element["position x"]
-  start_y = traffic_element["position y"]
-  min_x = start_x - (traffic_element["width"] / 2.0)
-  min_y = start_y
-  max_x = start_x + (traffic_element["width"] / 2.0)
-  max_y = start_y + traffic_element["length"]
-  box = shapely.geometry.box(min_x, min_y, max_x, max_y)
-  box = shapely.affinity.rotate (box, traffic_element["angle"],
-                                 origin=(start_x, start_y), use_radians=True)
-  traffic_element["shape"] = box
-
-  # If the shape of a traffic element overlaps the clearance space of a second
-  # traffic element, the second is blocked by the first.
-  # The clearance space of a traffic element is a box the width of the
-  # traffic element, stop_clearance feet long, positioned just in front
-  # of the traffic element
-
-  stop_clearance = traffic_element["length"] / 3
-  box = shapely.geometry.box(min_x, min_y, max_x, min_y - stop_clearance)
-  box = shapely.affinity.rotate (box, traffic_element["angle"],
-                                 origin=(start_x, start_y), use_radians=True)
-  traffic_element["stop shape"] = box
-
-  # However, the blocked vehicle cannot start moving until the blocking
-  # vehicle has moved some distance beyond the clearance space.
-  go_clearance = stop_clearance * 1.5
-  box = shapely.geometry.box(min_x, min_y, max_x, min_y - go_clearance)
-  box = shapely.affinity.rotate (box, traffic_element["angle"],
-                                 origin=(start_x, start_y), use_radians=True)
-  traffic_element["go shape"] = box
-  
-  return
+    return
 
-# The traffic element has reached the next milestone.  Make it the current
-# milestone.
-def new_milestone (traffic_element):
-
-  if (do_trace):
-    trace_file.write ("New milestone top:\n")
-    pprint.pprint (traffic_element, trace_file)
-    
-  this_milestone_index = traffic_element["milestone index"]
-  milestones_list = traffic_element["milestones"]
-  next_milestone_index = this_milestone_index + 1
-  next_milestone = milestones_list[next_milestone_index]
-  traffic_element["current lane"] = next_milestone[0]
-  start_x = next_milestone[1]
-  start_y = next_milestone[2]
-  traffic_element["start x"] = start_x
-  traffic_element["start y"] = start_y
-  following_milestone_index = next_milestone_index + 1
-  following_milestone = milestones_list[following_milestone_index]
-  target_x = following_milestone[1]
-  target_y = following_milestone[2]
-  traffic_element["target x"] = target_x
-  traffic_element["target y"] = target_y
-  traffic_element["next lane"] = following_milestone[0]
-  distance_between_milestones = math.sqrt(((start_x-target_x)**2) +
-                                          ((start_y-target_y)**2))
-  traffic_element["distance between milestones"] = distance_between_milestones
-  traffic_element["speed"] = speed_limit(traffic_element["current lane"],
-                                         traffic_element["travel path name"],
-                                         traffic_element["was stopped"])
-  # If the distance to the next milestone is zero the angle is indeterminate,
-  # so don't change it.
-  if (distance_between_milestones > 0):
-    traffic_element["angle"] = math.atan2 (target_x - start_x,
-                                           start_y - target_y)
-  traffic_element["position x"] = start_x
-  traffic_element["position y"] = start_y
-  traffic_element["distance remaining"] = distance_between_milestones
-  rebuild_shapes (traffic_element)
-  traffic_element["milestone index"] = next_milestone_index
-
-  if (do_trace):
-    trace_file.write ("New milestone bottom:\n")
-    pprint.pprint (traffic_element, trace_file)
-    
-  return
+  # Subroutine to enter the signal face into the named state and substate.
+  def enter_state (self, signal_face, state_name, substate_name, the_exit):
+    if ("state" in signal_face):
+      old_state_name = signal_face["state"]
+    else:
+      old_state_name = ""
+
+    if ("substate" in signal_face):
+      old_substate_name = signal_face["substate"]
+    else:
+      old_substate_name = ""
+
+    # Entering a state is only a significant event if the state is different.
+    significant_event = False
+    if ((state_name != old_state_name) or
+        (substate_name != old_substate_name)):
+      self.no_activity = False
+      significant_event = True
+    else:
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " signal face " +
+               signal_face["name"] + " not a significant state change.")
+
+    signal_face["state"] = state_name
+    signal_face["substate"] = substate_name
+    if (significant_event and self.bus.wants (event_bus.StateChange)):
+      self.bus.emit (event_bus.StateChange (self.current_time,
+                                            signal_face["name"],
+                                            old_state_name, old_substate_name,
+                                            state_name, substate_name))
+
+    transition_reason = None
+
+    if (((self.verbosity_level >= 3) and significant_event) or
+        (self.verbosity_level >= 5)):
+      transition_reason = self.describe_transition (signal_face,
+                                                    old_state_name,
+                                                    old_substate_name,
+                                                    state_name, substate_name,
+                                                    the_exit)
+      if (len(transition_reason) > 0):
+        print (format_time(self.current_time) + " signal face " +
+               signal_face["name"] + " " + transition_reason + ".")
+    if (significant_event):
+      the_level = 3
+    else:
+      the_level = 5
+    if (self.table_wanted (the_level)):
+      if ((transition_reason == None) and self.table_OK (the_level)):
+        self.check_transition_conditions (signal_face, old_state_name,
+                                          old_substate_name, state_name,
+                                          substate_name, the_exit)
+      self.table_row (the_level, signal_face["name"], "",
+                      transition=self.transition_record (
+                        signal_face, old_state_name, old_substate_name,
+                        state_name, substate_name, the_exit))
+    states = self.finite_state_machine["states"]
+    state = states[state_name]
+    for substate in state:
+      if (substate["name"] == substate_name):
+        self.perform_actions (signal_face, substate)
 
-# Subroutine to add a traffic element to the traffic elements dictionary.
-# A traffic element starts at its first milestone.
-next_traffic_element_number = 0
+    return
 
-def add_traffic_element (type, travel_path_name, permissive_delay):
-  global travel_paths
-  global traffic_elements
-  global next_traffic_element_number
-  global current_time
-  global error_counter
+  # Subroutine to return the speed limit for a traffic element
+  # in a particular lane following a particular traffic path.
+  # If the vehicle is in the intersection and is not just passing
+  # through it is limited to the intersection speed.
+  def speed_limit (self, lane_name, travel_path_name, was_stopped):
+    if ((lane_name == "intersection") and was_stopped):
+      return (self.intersection_info["intersection speed limit"])
+    else:
+      speed_limit_ident = travel_path_name + " / " + lane_name
+      return (self.speed_limits[speed_limit_ident])
+
+  # Rebuild the shape and clearance spaces of a traffic element
+  # after it has moved.
+  def rebuild_shapes (self, traffic_element):
+    if (self.do_trace):
+      self.trace ("rebuild shapes", traffic_element.name,
+                  "Rebuild shapes:\n", state=traffic_element.as_dict())
+
+    # If the shape of a traffic element overlaps the shape of
+    # a sensor, the sensor is triggered by the traffic element.
+    start_x = traffic_element.position_x
+    start_y = traffic_element.position_y
+    min_x = start_x - (traffic_element.width / 2.0)
+    min_y = start_y
+    max_x = start_x + (traffic_element.width / 2.0)
+    max_y = start_y + traffic_element.length
+    box = shapely.geometry.box(min_x, min_y, max_x, max_y)
+    box = shapely.affinity.rotate (box, traffic_element.angle,
+                                   origin=(start_x, start_y), use_radians=True)
+    traffic_element.shape = box
+
+    # If the shape of a traffic element overlaps the clearance space of a
+    # second traffic element, the second is blocked by the first.
+    # The clearance space of a traffic element is a box the width of the
+    # traffic element, stop_clearance feet long, positioned just in front
+    # of the traffic element
+
+    stop_clearance = traffic_element.length / 3
+    box = shapely.geometry.box(min_x, min_y, max_x, min_y - stop_clearance)
+    box = shapely.affinity.rotate (box, traffic_element.angle,
+                                   origin=(start_x, start_y), use_radians=True)
+    traffic_element.stop_shape = box
+
+    # However, the blocked vehicle cannot start moving until the blocking
+    # vehicle has moved some distance beyond the clearance space.
+    go_clearance = stop_clearance * 1.5
+    box = shapely.geometry.box(min_x, min_y, max_x, min_y - go_clearance)
+    box = shapely.affinity.rotate (box, traffic_element.angle,
+                                   origin=(start_x, start_y), use_radians=True)
+    traffic_element.go_shape = box
+    traffic_element.shapes_distance_remaining = (
+      traffic_element.distance_remaining)
 
-  if (travel_path_name not in travel_paths):
-    print ("Travel path name " + travel_path_name + " is invalid.")
-    error_counter = error_counter + 1
     return
-  
-  traffic_element = dict()
-
-  this_name = f'{type} {next_traffic_element_number:04d}'
-  next_traffic_element_number = next_traffic_element_number + 1
-  traffic_element["name"] = this_name
-  
-  traffic_element["type"] = type
-  traffic_element["travel path name"] = travel_path_name
-  traffic_element["permissive delay"] = permissive_delay
-  travel_path = travel_paths[travel_path_name]
-  milestone_list = travel_path["milestones"]
-  traffic_element["milestones"] = milestone_list
-  milestone_index = 0
-  traffic_element["milestone index"] = -1
-  traffic_element["was stopped"] = False
-
-  match type:
-    case "car":
-      traffic_element["length"] = car_length
-      traffic_element["width"] = car_width
-    case "truck":
-      traffic_element["length"] = truck_length
-      traffic_element["width"] = truck_width
-    case "pedestrian":
-      traffic_element["length"] = 2
-      traffic_element["width"] = (crosswalk_width / 3.0)
-
-  traffic_element["current time"] = current_time
-  traffic_element["present"] = True
-  traffic_element["blocker name"] = None
-  traffic_element["stopped time"] = current_time
-  new_milestone (traffic_element)
-
-  # If this traffic element would be born blocked, don't spawn it.
-  blocker_name = check_still_blocked (traffic_element)
-  
-  if (blocker_name != None):
-    # This traffic element does not get spawned.
-    traffic_element["present"] = False
-  
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " " + this_name +
-             " is blocked from spawning by " + blocker_name + ".")
-    if (table_OK (5)):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        traffic_element["current lane"] + " & " +
-                        cap_first_letter(this_name) +
-                        " is blocked from spawning by " + blocker_name +
-                        ". \\\\\n")
-      if (flush_table_file):
-        table_file.flush()
-    if (do_trace):
-      trace_file.write ("New traffic element not created:\n")
-      pprint.pprint (traffic_element, trace_file)
-      trace_file.write (" because it is blocked by:\n")
-      pprint.pprint (traffic_elements[blocker_name], trace_file)
 
-  else:
-    if (verbosity_level >= 2):
-      print (format_time(current_time) + " " + this_name +
-             " starts on travel path " + travel_path_name +
-             " in lane " + traffic_element["current lane"] +
-             " at position (" +
-             format_location(traffic_element["position x"]) +
-             ", " + format_location(traffic_element["position y"]) +
-             ") distance to next milestone " +
-             format_distance(traffic_element["distance remaining"]) +
-             " speed " + format_speed(traffic_element["speed"]) +
-             " angle " + format_angle(traffic_element["angle"]) + ".")
-    if (table_OK (2)):
-      table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                        traffic_element["current lane"] + " & " +
-                        cap_first_letter(this_name) +
-                        " starts on travel path " +
-                        travel_path_name + " speed " +
-                        format_speed(abs(traffic_element["speed"])) +
-                        ". \\\\\n")
-      if (flush_table_file):
-        table_file.flush()
-    if (do_events_output):
-      write_event (traffic_element, "new")
-                       
-    traffic_elements[this_name] = traffic_element
-
-    if (do_trace):
-      trace_file.write ("New traffic element:\n")
-      pprint.pprint (traffic_element, trace_file)
-    
-  return
+  # Measure the distance into each lane queue from the same place for
+  # every travel path in it.  Travel paths can enter a lane at different
+  # places, where one merges into it, so the distance each has travelled
+  # since it entered the lane does not order traffic elements on
+  # different paths.  The longest run of a travel path through the lane
+  # is the lane's line, and each run's distance is measured from the
+  # start of that line.  Runs which go the other way along the lane form
+  # a queue of their own.
+  def align_lane_queues (self):
+    lane_runs = dict()
+    for travel_path_name in self.travel_path_segments:
+      segments = self.travel_path_segments[travel_path_name]
+      segment_indexes = None
+      for segment_index in range(0, len(segments.lengths)):
+        lane_name = segments.lane_names[segment_index]
+        if ((segment_index == 0) or
+            (lane_name != segments.lane_names[segment_index-1])):
+          segment_indexes = list()
+          if (is_queue_lane (lane_name)):
+            lane_runs.setdefault (lane_name, list()).append (
+              (segments, segment_indexes))
+        segment_indexes.append (segment_index)
+
+    for lane_name in lane_runs:
+      # Each run is its length, the points it passes through, its
+      # segment table and the indexes of its segments.
+      runs = list()
+      for segments, segment_indexes in lane_runs[lane_name]:
+        points = [(segments.start_x[segment_indexes[0]],
+                   segments.start_y[segment_indexes[0]])]
+        for segment_index in segment_indexes:
+          if (segments.lengths[segment_index] > 0):
+            points.append ((segments.end_x[segment_index],
+                            segments.end_y[segment_index]))
+        if (len(points) > 1):
+          run_length = sum (segments.lengths[segment_index]
+                            for segment_index in segment_indexes)
+          runs.append ((run_length, points, segments, segment_indexes))
+      if (len(runs) == 0):
+        continue
 
-# Check if a traffic element is triggering a sensor
-def check_overlap_sensor (traffic_element, sensor):
-  # If either the traffic elements or the sensor does not have a shape,
-  # there cannot be any overlap between them.
-  if ("shape" not in traffic_element):
-    return (False)
-  if ("shape" not in sensor):
-    return (False)
+      longest_points = max (runs, key=lambda the_run: the_run[0])[1]
+      lane_x = longest_points[-1][0] - longest_points[0][0]
+      lane_y = longest_points[-1][1] - longest_points[0][1]
+      forward_runs = list()
+      reverse_runs = list()
+      for the_run in runs:
+        points = the_run[1]
+        if ((((points[-1][0] - points[0][0]) * lane_x) +
+             ((points[-1][1] - points[0][1]) * lane_y)) >= 0):
+          forward_runs.append (the_run)
+        else:
+          reverse_runs.append (the_run)
 
-  shape_A = traffic_element["shape"]
+      for queue_name, queue_runs in ((lane_name, forward_runs),
+                                     (lane_name + " reversed",
+                                      reverse_runs)):
+        if (len(queue_runs) == 0):
+          continue
+        lane_line = shapely.geometry.LineString (
+          max (queue_runs, key=lambda the_run: the_run[0])[1])
+        for run_length, points, segments, segment_indexes in queue_runs:
+          lane_start_distance = (
+            segments.cumulative_distances[segment_indexes[0]] -
+            lane_position (lane_line, points[0][0], points[0][1]))
+          for segment_index in segment_indexes:
+            segments.lane_start_distances[segment_index] = (
+              lane_start_distance)
+            segments.queue_names[segment_index] = queue_name
+    return
 
-  # If the traffic element has left the simulation it has no shape.
-  if (shape_A == None):
-    return (False)
-  
-  shape_B_list = sensor["shape"]
-  shape_B = shapely.geometry.box (shape_B_list[0], shape_B_list[1],
-                                  shape_B_list[2], shape_B_list[3])
-  
-  if (shape_A.intersects(shape_B)):
-    if (do_trace):
-      trace_file.write ("These objects intersect at " +
-                        format_time(current_time) + ":\n")
-      pprint.pprint (traffic_element, trace_file)
-      pprint.pprint (shape_B, trace_file)
-      pprint.pprint (sensor, trace_file)
-      trace_file.write ("\n")
-      
-    return (True)
-  else:
-    return (False)
+  # Decide where along the travel paths a traffic element needs a
+  # geometric check.  A traffic element sweeps out the convex hull of its
+  # shapes at the two ends of a segment, and its go space does likewise.
+  # Where the go space swept along a segment in a queue lane touches the
+  # shape swept along a segment in a different lane, the traffic element
+  # may be blocked by something other than its leader.  Project the
+  # contact onto the segment: from the length of the go space, which
+  # reaches ahead of the traffic element, before the near end of the
+  # contact to its far end, check geometrically.  Elsewhere only the
+  # leader can block it.  The largest traffic element is used, so the
+  # test is conservative.
+  def find_lane_interactions (self):
+    largest_width = max (self.car_width, self.truck_width,
+                         self.crosswalk_width / 3.0)
+    largest_length = max (self.car_length, self.truck_length, 2)
+    go_clearance = (largest_length / 3) * 1.5
+    segment_list = list()
+    ends_x = list()
+    ends_y = list()
+    angles = list()
+    for travel_path_name in self.travel_path_segments:
+      segments = self.travel_path_segments[travel_path_name]
+      the_angle = 0.0
+      for segment_index in range(0, len(segments.lengths)):
+        if (segments.angles[segment_index] != None):
+          the_angle = segments.angles[segment_index]
+        segment_list.append ((segments, segment_index))
+        ends_x.append ((segments.start_x[segment_index],
+                        segments.end_x[segment_index]))
+        ends_y.append ((segments.start_y[segment_index],
+                        segments.end_y[segment_index]))
+        angles.append (the_angle)
+    if (len(segment_list) == 0):
+      return
 
-# Subroutine to test for overlap of a traffic element's stop space
-# with another traffic element.  Return None if there is no blockage;
-# otherwise return the name of the blocking traffic element.
-def check_stopped_by(traffic_element_A, traffic_element_B):
+    ends_x = np.array (ends_x, dtype=float)
+    ends_y = np.array (ends_y, dtype=float)
+    widths = np.full (len(segment_list), largest_width, dtype=float)
+    lengths = np.full (len(segment_list), largest_length, dtype=float)
+    start_shapes = build_shapes (ends_x[:, 0], ends_y[:, 0], widths, lengths,
+                                 angles)
+    end_shapes = build_shapes (ends_x[:, 1], ends_y[:, 1], widths, lengths,
+                               angles)
+    shape_sweeps = list()
+    go_sweeps = list()
+    for start_shape, end_shape in zip (start_shapes, end_shapes):
+      shape_sweeps.append (shapely.convex_hull (
+        shapely.union (start_shape[0], end_shape[0])))
+      go_sweeps.append (shapely.convex_hull (
+        shapely.union (start_shape[2], end_shape[2])))
+
+    # Start with no geometric checks in the queue lanes and checks
+    # everywhere else.
+    for segments, segment_index in segment_list:
+      if ((not is_queue_lane (segments.lane_names[segment_index])) or
+          (segments.lengths[segment_index] == 0)):
+        segments.geometric_check_starts[segment_index] = 0
+        segments.geometric_check_ends[segment_index] = math.inf
+      else:
+        segments.geometric_check_starts[segment_index] = math.inf
+        segments.geometric_check_ends[segment_index] = -math.inf
+
+    shape_tree = shapely.STRtree (shape_sweeps)
+    go_indexes, shape_indexes = shape_tree.query (go_sweeps,
+                                                  predicate="intersects")
+    for go_index, shape_index in zip (go_indexes.tolist(),
+                                      shape_indexes.tolist()):
+      segments, segment_index = segment_list[go_index]
+      other_segments, other_segment_index = segment_list[shape_index]
+      if (segments.queue_names[segment_index] ==
+          other_segments.queue_names[other_segment_index]):
+        continue
+      if (segments.geometric_check_ends[segment_index] == math.inf):
+        continue
 
-  # If either of the traffic elements does not have a shape,
-  # there cannot be any overlap between them.
-  
-  if ("shape" not in traffic_element_A):
-    return (None)
-  if ("shape" not in traffic_element_B):
-    return (None)
+      # Project the contact area onto the direction of travel.
+      contact = shapely.intersection (go_sweeps[go_index],
+                                      shape_sweeps[shape_index])
+      contact_points = shapely.get_coordinates (contact)
+      if (len(contact_points) == 0):
+        contact_points = shapely.get_coordinates (go_sweeps[go_index])
+      start_x = segments.start_x[segment_index]
+      start_y = segments.start_y[segment_index]
+      segment_length = segments.lengths[segment_index]
+      direction_x = (segments.end_x[segment_index] - start_x) / segment_length
+      direction_y = (segments.end_y[segment_index] - start_y) / segment_length
+      contact_distances = (((contact_points[:, 0] - start_x) * direction_x) +
+                           ((contact_points[:, 1] - start_y) * direction_y))
+      check_start = float(np.min (contact_distances)) - go_clearance - 1
+      check_end = float(np.max (contact_distances)) + 1
+      if (check_start < segments.geometric_check_starts[segment_index]):
+        segments.geometric_check_starts[segment_index] = check_start
+      if (check_end > segments.geometric_check_ends[segment_index]):
+        segments.geometric_check_ends[segment_index] = check_end
+    return
 
-  shape_A = traffic_element_A["stop shape"]
-  shape_B = traffic_element_B["shape"]
-  
-  # An object will have no shape if it has left the simulation.
-  if ((shape_A == None) or (shape_B == None)):
-    return (None)
-  
-  if (shape_A.intersects(shape_B)):
-    if (do_trace):
-      trace_file.write ("These objects intersect at " +
-                        format_time(current_time) + ":\n")
-      pprint.pprint (traffic_element_A, trace_file)
-      pprint.pprint (traffic_element_B, trace_file)
-      trace_file.write ("\n")
-      
-    return (traffic_element_B["name"])
-  else:
-    return (None)
+  # For each travel path that allows permissive turns, compile its
+  # permissive turn info into a list of permissive areas.  Each area
+  # is the movement type, the corners from the intersection file,
+  # the box they make, and the names of the travel paths whose traffic
+  # elements might ever have their stop shape in the box.  A stop shape
+  # reaches no further from its traffic element's position than its
+  # far corners, so widening each travel path by that much covers every
+  # place a stop shape can be.
+  def compile_permissive_areas (self):
+    largest_width = max (self.car_width, self.truck_width,
+                         self.crosswalk_width / 3.0)
+    largest_length = max (self.car_length, self.truck_length, 2)
+    stop_reach = math.hypot (largest_width / 2.0, largest_length / 3.0) + 1
+    path_names = list()
+    path_areas = list()
+    for travel_path_name in self.travel_path_segments:
+      segments = self.travel_path_segments[travel_path_name]
+      if (len(segments.lengths) == 0):
+        continue
+      points = [(segments.start_x[0], segments.start_y[0])]
+      for segment_index in range(0, len(segments.lengths)):
+        points.append ((segments.end_x[segment_index],
+                        segments.end_y[segment_index]))
+      if (len(set(points)) == 1):
+        path_area = shapely.geometry.Point(points[0]).buffer(stop_reach)
+      else:
+        path_area = shapely.geometry.LineString(points).buffer(stop_reach)
+      path_names.append (travel_path_name)
+      path_areas.append (path_area)
+    path_tree = shapely.STRtree (path_areas)
+
+    for travel_path_name in self.travel_paths:
+      travel_path = self.travel_paths[travel_path_name]
+      permissive_info = travel_path ["permissive turn info"]
+      if (permissive_info == None):
+        continue
+      area_list = list()
+      for permissive_item in permissive_info:
+        movement_type = permissive_item[0]
+        permissive_shape_list = permissive_item[1]
+        permissive_shape = shapely.geometry.box (permissive_shape_list[0],
+                                                 permissive_shape_list[1],
+                                                 permissive_shape_list[2],
+                                                 permissive_shape_list[3])
+        path_indexes = path_tree.query (permissive_shape,
+                                        predicate="intersects")
+        passing_path_names = tuple(path_names[path_index]
+                                   for path_index in sorted(path_indexes))
+        area_list.append ((movement_type, permissive_shape_list,
+                           permissive_shape, passing_path_names))
+      self.permissive_areas[travel_path_name] = area_list
+    return
 
-# Subroutine to test for overlap of a traffic element's go space
-# with another traffic element.  Return None if there is no blockage;
-# otherwise return the name of the blocking traffic element.
-def check_still_stopped_by(traffic_element_A, traffic_element_B):
+  # Return the traffic elements, other than this one, which are on any
+  # of the given travel paths, in the order they were spawned.
+  def elements_on_travel_paths (self, traffic_element, path_names):
+    element_list = list()
+    for travel_path_name in path_names:
+      element_list.extend (
+        self.travel_path_elements[travel_path_name].values())
+    if (len(path_names) > 1):
+      element_list.sort (key=lambda other_element: other_element.number)
+    return ([other_element for other_element in element_list
+             if (other_element is not traffic_element)])
+
+  # Remove a traffic element from the queue of the lane it was in.
+  def leave_lane_queue (self, traffic_element):
+    if (traffic_element.queue_lane == None):
+      return
+    lane_queue = self.lane_queues[traffic_element.queue_lane]
+    lane_queue.remove (traffic_element)
+    leader = traffic_element.leader
+    follower = traffic_element.follower
+    if (leader != None):
+      leader.follower = follower
+    if (follower != None):
+      follower.leader = leader
+    traffic_element.leader = None
+    traffic_element.follower = None
+    traffic_element.queue_lane = None
+    return
 
-  # If either of the traffic elements does not have a shape,
-  # there cannot be any overlap between them.
-  
-  if ("shape" not in traffic_element_A):
-    return (None)
-  if ("shape" not in traffic_element_B):
-    return (None)
+  # Place a traffic element in the queue for its current lane, if it
+  # has moved into a different lane.  The front of the queue is the
+  # traffic element that has travelled furthest into the lane.
+  def update_lane_queue (self, traffic_element):
+    lane_name = traffic_element.segments.queue_names[
+      traffic_element.milestone_index]
+    if (traffic_element.queue_lane == lane_name):
+      return
+    self.leave_lane_queue (traffic_element)
+    if (not is_queue_lane (lane_name)):
+      return
 
-  shape_A = traffic_element_A["go shape"]
-  shape_B = traffic_element_B["shape"]
-  
-  # An object will have no shape if it has left the simulation.
-  if ((shape_A == None) or (shape_B == None)):
-    return (None)
-  
-  if (shape_A.intersects(shape_B)):
-    if (do_trace):
-      trace_file.write ("These objects intersect at " +
-                        format_time(current_time) + ":\n")
-      pprint.pprint (traffic_element_A, trace_file)
-      pprint.pprint (traffic_element_B, trace_file)
-      trace_file.write ("\n")
-      
-    return (traffic_element_B["name"])
-  else:
-    return (None)
+    if (lane_name not in self.lane_queues):
+      self.lane_queues[lane_name] = list()
+    lane_queue = self.lane_queues[lane_name]
+    our_distance = distance_into_lane (traffic_element)
+    queue_position = len(lane_queue)
+    while ((queue_position > 0) and
+           (distance_into_lane (lane_queue[queue_position-1]) < our_distance)):
+      queue_position = queue_position - 1
+    lane_queue.insert (queue_position, traffic_element)
+    traffic_element.queue_lane = lane_name
+    if (queue_position > 0):
+      traffic_element.leader = lane_queue[queue_position-1]
+      traffic_element.leader.follower = traffic_element
+    if (queue_position + 1 < len(lane_queue)):
+      traffic_element.follower = lane_queue[queue_position+1]
+      traffic_element.follower.leader = traffic_element
+    return
 
-# Subroutine to check a traffic element to see if the last move
-# caused it to overlap another traffic element.
-# If so, return that blocking traffic element's name.
-# Otherwise, return None.
-def check_blocked(traffic_element):
-  for other_traffic_element_name in traffic_elements:
+  # The traffic element has reached the next milestone.  Make it the current
+  # milestone.
+  def new_milestone (self, traffic_element):
+
+    if (self.do_trace):
+      self.trace ("new milestone top", traffic_element.name,
+                  "New milestone top:\n", state=traffic_element.as_dict())
+
+    segments = traffic_element.segments
+    segment_index = traffic_element.milestone_index + 1
+    traffic_element.current_lane = segments.lane_names[segment_index]
+    start_x = segments.start_x[segment_index]
+    start_y = segments.start_y[segment_index]
+    traffic_element.start_x = start_x
+    traffic_element.start_y = start_y
+    traffic_element.target_x = segments.end_x[segment_index]
+    traffic_element.target_y = segments.end_y[segment_index]
+    traffic_element.next_lane = segments.next_lane_names[segment_index]
+    distance_between_milestones = segments.lengths[segment_index]
+    traffic_element.distance_between_milestones = distance_between_milestones
+    if (traffic_element.was_stopped):
+      traffic_element.speed = segments.stopped_speed_limits[segment_index]
+    else:
+      traffic_element.speed = segments.speed_limits[segment_index]
+    # If the distance to the next milestone is zero the angle is indeterminate,
+    # so don't change it.
+    if (distance_between_milestones > 0):
+      traffic_element.angle = segments.angles[segment_index]
+    traffic_element.position_x = start_x
+    traffic_element.position_y = start_y
+    traffic_element.distance_remaining = distance_between_milestones
+    self.rebuild_shapes (traffic_element)
+    traffic_element.milestone_index = segment_index
+
+    if (self.do_trace):
+      self.trace ("new milestone bottom", traffic_element.name,
+                  "New milestone bottom:\n",
+                  state=traffic_element.as_dict())
 
-    # Only check other traffic elements
-    if (other_traffic_element_name == traffic_element["name"]):
-      continue
+    return
 
-    other_traffic_element = traffic_elements[other_traffic_element_name]
-    blocking_name = check_stopped_by (traffic_element, other_traffic_element)
-    if (blocking_name != None):
-      return blocking_name
+  # Subroutine to add a traffic element to the traffic elements dictionary.
+  # A traffic element starts at its first milestone.
+  def add_traffic_element (self, type, travel_path_name, permissive_delay):
+    if (travel_path_name not in self.travel_paths):
+      print ("Travel path name " + travel_path_name + " is invalid.")
+      self.error_counter = self.error_counter + 1
+      return
 
-  return (None)
+    traffic_element = TrafficElement()
+
+    this_name = f'{type} {self.next_traffic_element_number:04d}'
+    traffic_element.name = this_name
+    traffic_element.number = self.next_traffic_element_number
+    self.next_traffic_element_number = self.next_traffic_element_number + 1
+
+    traffic_element.type = type
+    traffic_element.travel_path_name = travel_path_name
+    traffic_element.permissive_delay = permissive_delay
+    travel_path = self.travel_paths[travel_path_name]
+    milestone_list = travel_path["milestones"]
+    traffic_element.milestones = milestone_list
+    traffic_element.segments = self.travel_path_segments[travel_path_name]
+    milestone_index = 0
+    traffic_element.milestone_index = -1
+    traffic_element.was_stopped = False
+
+    match type:
+      case "car":
+        traffic_element.length = self.car_length
+        traffic_element.width = self.car_width
+      case "truck":
+        traffic_element.length = self.truck_length
+        traffic_element.width = self.truck_width
+      case "pedestrian":
+        traffic_element.length = 2
+        traffic_element.width = (self.crosswalk_width / 3.0)
+
+    traffic_element.current_time = self.current_time
+    traffic_element.start_time = self.current_time
+    traffic_element.present = True
+    traffic_element.blocker_name = None
+    traffic_element.stopped_time = self.current_time
+    self.new_milestone (traffic_element)
+
+    # If this traffic element would be born blocked, don't spawn it.
+    blocker_name = self.check_still_blocked (traffic_element)
+
+    if (blocker_name != None):
+      # This traffic element does not get spawned.
+      traffic_element.present = False
+
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " " + this_name +
+               " is blocked from spawning by " + blocker_name + ".")
+      if (self.table_wanted (5)):
+        self.table_row (5, traffic_element.current_lane,
+                        " " + cap_first_letter(this_name) +
+                        " is blocked from spawning by " + blocker_name + ". ")
+      if (self.do_trace):
+        self.trace ("new traffic element blocked", traffic_element.name,
+                    "New traffic element not created:\n",
+                    state=traffic_element.as_dict(),
+                    fields={"blocker": blocker_name})
+        if (self.trace_format == "text"):
+          self.trace_file.write (" because it is blocked by:\n")
+          pprint.pprint (self.traffic_elements[blocker_name].as_dict(),
+                         self.trace_file)
+      if (self.do_trips_output):
+        self.write_trip (traffic_element, "blocked", blocker_name)
 
-# Check a traffic element to see if is still blocked.
-# If so, return that blocking traffic element's name.
-# If not, return None.
-def check_still_blocked(traffic_element):
-  for other_traffic_element_name in traffic_elements:
+    else:
+      if (self.verbosity_level >= 2):
+        print (format_time(self.current_time) + " " + this_name +
+               " starts on travel path " + travel_path_name +
+               " in lane " + traffic_element.current_lane +
+               " at position (" +
+               format_location(traffic_element.position_x) +
+               ", " + format_location(traffic_element.position_y) +
+               ") distance to next milestone " +
+               format_distance(traffic_element.distance_remaining) +
+               " speed " + format_speed(traffic_element.speed) +
+               " angle " + format_angle(traffic_element.angle) + ".")
+      if (self.table_wanted (2)):
+        self.table_row (2, traffic_element.current_lane,
+                        " " + cap_first_letter(this_name) +
+                        " starts on travel path " + travel_path_name +
+                        " speed " +
+                        format_speed(abs(traffic_element.speed)) + ". ")
+      if (self.bus.wants (event_bus.ElementEvent)):
+        self.bus.emit (event_bus.ElementEvent (
+          self.current_time, traffic_element, "new"))
+
+      self.traffic_elements[this_name] = traffic_element
+      self.traffic_element_count = self.traffic_element_count + 1
+      self.travel_path_elements[travel_path_name][this_name] = traffic_element
+      self.update_lane_queue (traffic_element)
+
+      if (self.do_trace):
+        self.trace ("new traffic element", traffic_element.name,
+                    "New traffic element:\n",
+                    state=traffic_element.as_dict())
 
-    # Only check other traffic elements
-    if (other_traffic_element_name == traffic_element["name"]):
-      continue
+    return
 
-    other_traffic_element = traffic_elements[other_traffic_element_name]
-    blocking_name = check_still_stopped_by (traffic_element,
-                                            other_traffic_element)
-    if (blocking_name != None):
-      return blocking_name
-    
-  return (None)
+  # Check if a traffic element is triggering a sensor
+  def check_overlap_sensor (self, traffic_element, sensor):
+    # If the sensor does not have a shape, nothing can overlap it.
+    if ("shape" not in sensor):
+      return (False)
 
-# Subroutine to check an area for the presence of a traffic element that
-# makes moving into the area unsafe.
-def check_conflicting_traffic (traffic_element, permissive_info):
-  global error_counter
-  
-  # We can enter the intersection if it is safe.  First, stop for
-  # a second.  A real driver will be checking for oncoming traffic.
-
-  if (do_trace):
-    trace_file.write ("Check for conflicting traffic with " +
-                      traffic_element["name"] + ".\n")
-    pprint.pprint (traffic_element, trace_file)
-
-  # If there is nothing to check we do not need to wait.
-  if (permissive_info == None):
-    return True
-  
-  if (traffic_element["speed"] > 0):
-    if (do_trace):
-      trace_file.write (" Still moving.\n\n")
-    return False
+    shape_A = traffic_element.shape
 
-  stopped_duration = current_time - traffic_element["stopped time"]
-  if (do_trace):
-    trace_file.write (" Stopped for " + format_time(stopped_duration)
-                      + ".\n")
-  if (stopped_duration < traffic_element["permissive delay"]):
-    if (do_trace):
-      trace_file.write (" Not stopped long enough.\n\n")
-    return False
-        
-  # Check for a vehicle present or approaching.
-  for permissive_item in permissive_info:
-    movement_type = permissive_item[0]
-    permissive_shape_list = permissive_item[1]
-    permissive_shape = shapely.geometry.box (permissive_shape_list[0],
-                                             permissive_shape_list[1],
-                                             permissive_shape_list[2],
-                                             permissive_shape_list[3])
-    for other_traffic_element_name in traffic_elements:
+    # If the traffic element has left the simulation it has no shape.
+    if (shape_A == None):
+      return (False)
+
+    shape_B_list = sensor["shape"]
+    shape_B = shapely.geometry.box (shape_B_list[0], shape_B_list[1],
+                                    shape_B_list[2], shape_B_list[3])
+
+    if (shape_A.intersects(shape_B)):
+      if (self.do_trace):
+        self.trace ("overlaps sensor", traffic_element.name,
+                    "These objects intersect at " +
+                    format_time(self.current_time) + ":\n",
+                    state=traffic_element.as_dict(), items=(shape_B, sensor),
+                    ending="\n",
+                    fields={"sensor shape": shape_B, "sensor": sensor})
+
+      return (True)
+    else:
+      return (False)
+
+  # Subroutine to test for overlap of a traffic element's stop space
+  # with another traffic element.  Return None if there is no blockage;
+  # otherwise return the name of the blocking traffic element.
+  def check_stopped_by(self, traffic_element_A, traffic_element_B):
+
+    shape_A = traffic_element_A.stop_shape
+    shape_B = traffic_element_B.shape
+
+    # An object will have no shape if it has left the simulation.
+    if ((shape_A == None) or (shape_B == None)):
+      return (None)
+
+    if (shape_A.intersects(shape_B)):
+      if (self.do_trace):
+        self.trace ("stopped by", traffic_element_A.name,
+                    "These objects intersect at " +
+                    format_time(self.current_time) + ":\n",
+                    state=traffic_element_A.as_dict(),
+                    items=(traffic_element_B.as_dict(),), ending="\n",
+                    fields={"blocker": traffic_element_B.name})
+
+      return (traffic_element_B.name)
+    else:
+      return (None)
+
+  # Subroutine to test for overlap of a traffic element's go space
+  # with another traffic element.  Return None if there is no blockage;
+  # otherwise return the name of the blocking traffic element.
+  def check_still_stopped_by(self, traffic_element_A, traffic_element_B):
+
+    shape_A = traffic_element_A.go_shape
+    shape_B = traffic_element_B.shape
+
+    # An object will have no shape if it has left the simulation.
+    if ((shape_A == None) or (shape_B == None)):
+      return (None)
+
+    if (shape_A.intersects(shape_B)):
+      if (self.do_trace):
+        self.trace ("stopped by", traffic_element_A.name,
+                    "These objects intersect at " +
+                    format_time(self.current_time) + ":\n",
+                    state=traffic_element_A.as_dict(),
+                    items=(traffic_element_B.as_dict(),), ending="\n",
+                    fields={"blocker": traffic_element_B.name})
+
+      return (traffic_element_B.name)
+    else:
+      return (None)
+
+  # Subroutine to check a traffic element to see if the last move
+  # caused it to overlap another traffic element.
+  # If so, return that blocking traffic element's name.
+  # Otherwise, return None.
+  def check_blocked(self, traffic_element):
+    leader = single_possible_blocker (traffic_element)
+    if (leader != None):
+      return (self.check_stopped_by (traffic_element, leader))
+
+    for other_traffic_element_name in self.traffic_elements:
 
       # Only check other traffic elements
-      if (other_traffic_element_name == traffic_element["name"]):
+      if (other_traffic_element_name == traffic_element.name):
         continue
 
-      other_traffic_element = traffic_elements[other_traffic_element_name]
-      if (not other_traffic_element["present"]):
+      other_traffic_element = self.traffic_elements[other_traffic_element_name]
+      blocking_name = self.check_stopped_by (traffic_element,
+                                             other_traffic_element)
+      if (blocking_name != None):
+        return blocking_name
+
+    return (None)
+
+  # Check a traffic element to see if is still blocked.
+  # If so, return that blocking traffic element's name.
+  # If not, return None.
+  def check_still_blocked(self, traffic_element):
+    leader = single_possible_blocker (traffic_element)
+    if (leader != None):
+      return (self.check_still_stopped_by (traffic_element, leader))
+
+    for other_traffic_element_name in self.traffic_elements:
+
+      # Only check other traffic elements
+      if (other_traffic_element_name == traffic_element.name):
         continue
-          
-      stop_shape = other_traffic_element["stop shape"]
-      if (stop_shape.intersects(permissive_shape)):
-        if (do_trace):
-          trace_file.write ("Possible conflict with " +
-                            other_traffic_element_name + ":\n")
-          pprint.pprint (stop_shape, trace_file)
-          pprint.pprint (permissive_shape_list, trace_file)
-          pprint.pprint (permissive_shape, trace_file)
-          
-        if (movement_type == "present"):
-          if (do_trace):
-            trace_file.write (" Permissive turn is blocked by presence:\n")
-            pprint.pprint (other_traffic_element, trace_file)
-            trace_file.write ("\n")
-          return False
-
-        # The other traffic element most be moving towards us
-        # to make entering unsafe.
-        if (other_traffic_element["speed"] == 0):
-          continue
 
-        # Check the direction of movement.
-        movement_angle = other_traffic_element["angle"]
-        
-        if (do_trace):
-          trace_file.write ("Movement angle: " + str(movement_angle) + ".\n")
-      
-        match movement_type:
-
-          case "moving North":
-            if (abs(movement_angle) < math.radians(90)):
-              if (do_trace):
-                trace_file.write ("Permissive turn is blocked " +
-                                  "by North movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-                trace_file.write ("\n")
-              return False
-            else:
-              if (do_trace):
-                trace_file.write ("Permissive turn is not blocked " +
-                                  "by North movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)           
-
-          case "moving South":
-            if (abs(movement_angle) > math.radians(90)):
-              if (do_trace):
-                trace_file.write ("Permissive turn is blocked " +
-                                  "by South movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-                trace_file.write ("\n")
-              return False
-            else:
-              if (do_trace):
-                trace_file.write ("Permissive turn is not blocked " +
-                                  "by South movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-            
-          case "moving East":
-            if ((movement_angle > math.radians(0)) and
-                (movement_angle < math.radians(180))):
-              if (do_trace):
-                trace_file.write ("Permissive turn is blocked " +
-                                  "by East movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-                trace_file.write ("\n")
-              return False
-            else:
-              if (do_trace):
-                trace_file.write ("Permissive turn is not blocked " +
-                                  " by East movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-
-          case "moving West":
-            if ((movement_angle < math.radians(0)) and
-                (movement_angle > math.radians(-180))):
-              if (do_trace):
-                trace_file.write ("Permissive turn is blocked " +
-                                  "by West movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-                trace_file.write ("\n")
-              return False
-            else:
-              if (do_trace):
-                trace_file.write ("Permissive turn is not blocked " +
-                                  "by West movement.\n")
-                pprint.pprint (other_traffic_element, trace_file)
-            
-          case _:
-            print ("Invalid conflicting movement: " + movement_type + ".")
-            error_counter = error_counter + 1
-
-  # If all the tests pass, we can proceed.
-  if (do_trace):
-    trace_file.write ("No conflicts.\n\n")
-  return True
-
-# Subroutine to see if a traffic element may change lanes.
-# If we are trying to enter the intersection or crosswalk
-# the light must either be green or the movement must be
-# permitted even though the light is not green.
-
-def can_change_lanes (traffic_element):
-  global current_time
-  
-  this_milestone_index = traffic_element["milestone index"]
-  next_milestone_index = this_milestone_index + 1
-  previous_milestone_index = this_milestone_index - 1
-  milestone_list = traffic_element["milestones"]
-  next_milestone = milestone_list[next_milestone_index]
-  previous_milestone = milestone_list[previous_milestone_index]
-  
-  current_lane = traffic_element["current lane"]
-
-  # If the current lane does not have a signal face,
-  # we can proceed.
-  if (current_lane not in signal_faces_dict):
-    return True
-  
-  signal_face = signal_faces_dict[current_lane]
-
-  travel_path_name = traffic_element["travel path name"]
-  travel_path = travel_paths[travel_path_name]
-  
-  match next_milestone[0]:
-    case "intersection" | "crosswalk":
-      
-      if (do_trace):
-        trace_file.write ("Considering entering " + next_milestone[0] + ":\n")
-        pprint.pprint (traffic_element, trace_file)
-        pprint.pprint (signal_face, trace_file)
-        pprint.pprint (travel_path, trace_file)
-
-      iluminated_lamp_name = signal_face ["iluminated lamp name"]
-
-      # If the signal face is showing a green light, we can proceed
-      # without regard to any permissife turn rules.
-      green_colors = travel_path ["green colors"]
-      if (iluminated_lamp_name in green_colors):
-        if (do_trace):
-          trace_file.write (" Lamp is " + iluminated_lamp_name +
-                            " so we can proceed.\n")
-        return True
-      
-      # If the signal face allows permissive turns when its lights
-      # are a certain color, allow entering the intersection if
-      # the lights are right and the path is clear.
-      permissive_info = travel_path ["permissive turn info"]
-      if (permissive_info != None):
-        permissive_colors = travel_path ["permissive colors"]
-        if (iluminated_lamp_name in permissive_colors):
-          if (check_conflicting_traffic (traffic_element, permissive_info)):
-            if (do_trace):
-              trace_file.write (" Lamp is " + iluminated_lamp_name +
-                                " and no conflicting traffic.\n")
-            return True
-          
-      # Otherwise we cannot enter the intersection or crosswalk.
-      if (do_trace):
-        trace_file.write (" Lamp is " + iluminated_lamp_name +
-                          " so we cannot proceed.\n")
+      other_traffic_element = self.traffic_elements[other_traffic_element_name]
+      blocking_name = self.check_still_stopped_by (traffic_element,
+                                                   other_traffic_element)
+      if (blocking_name != None):
+        return blocking_name
+
+    return (None)
+
+  # Subroutine to check an area for the presence of a traffic element that
+  # makes moving into the area unsafe.
+  def check_conflicting_traffic (self, traffic_element, area_list):
+    # We can enter the intersection if it is safe.  First, stop for
+    # a second.  A real driver will be checking for oncoming traffic.
+
+    if (self.do_trace):
+      self.trace ("check for conflicting traffic", traffic_element.name,
+                  "Check for conflicting traffic with " +
+                  traffic_element.name + ".\n",
+                  state=traffic_element.as_dict())
+
+    # If there is nothing to check we do not need to wait.
+    if (area_list == None):
+      return True
+
+    if (traffic_element.speed > 0):
+      if (self.do_trace):
+        self.trace ("still moving", traffic_element.name,
+                    " Still moving.\n\n")
       return False
-      
-    case _:
-      # The milestone is neither the entrance to the intersection nor
-      # the entrance to the crosswalk.  Always allow it.
+
+    stopped_duration = self.current_time - traffic_element.stopped_time
+    if (self.do_trace):
+      self.trace ("stopped", traffic_element.name,
+                  " Stopped for " + format_time(stopped_duration) + ".\n",
+                  fields={"duration": stopped_duration})
+    if (stopped_duration < traffic_element.permissive_delay):
+      if (self.do_trace):
+        self.trace ("not stopped long enough", traffic_element.name,
+                    " Not stopped long enough.\n\n")
+      return False
+
+    # Check for a vehicle present or approaching.  Only traffic elements
+    # on travel paths that pass through the area can be in it.
+    for (movement_type, permissive_shape_list, permissive_shape,
+         passing_path_names) in area_list:
+      for other_traffic_element in self.elements_on_travel_paths (
+          traffic_element, passing_path_names):
+        other_traffic_element_name = other_traffic_element.name
+        stop_shape = other_traffic_element.stop_shape
+        if (stop_shape.intersects(permissive_shape)):
+          if (self.do_trace):
+            self.trace ("possible conflict", traffic_element.name,
+                        "Possible conflict with " +
+                        other_traffic_element_name + ":\n",
+                        items=(stop_shape, permissive_shape_list,
+                               permissive_shape),
+                        fields={"other traffic element":
+                                other_traffic_element_name,
+                                "stop shape": stop_shape,
+                                "permissive shapes": permissive_shape_list,
+                                "permissive shape": permissive_shape})
+
+          if (movement_type == "present"):
+            if (self.do_trace):
+              self.trace ("permissive turn blocked", traffic_element.name,
+                          " Permissive turn is blocked by presence:\n",
+                          items=(other_traffic_element.as_dict(),),
+                          ending="\n",
+                          fields={"movement": movement_type,
+                                  "other traffic element":
+                                  other_traffic_element_name})
+            return False
+
+          # The other traffic element most be moving towards us
+          # to make entering unsafe.
+          if (other_traffic_element.speed == 0):
+            continue
+
+          # Check the direction of movement.
+          movement_angle = other_traffic_element.angle
+
+          if (self.do_trace):
+            self.trace ("movement angle", traffic_element.name,
+                        "Movement angle: " + str(movement_angle) + ".\n",
+                        fields={"other traffic element":
+                                other_traffic_element_name,
+                                "angle": movement_angle})
+
+          match movement_type:
+
+            case "moving North":
+              if (abs(movement_angle) < math.radians(90)):
+                if (self.do_trace):
+                  self.trace ("permissive turn blocked", traffic_element.name,
+                              "Permissive turn is blocked " +
+                              "by North movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              ending="\n",
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+                return False
+              else:
+                if (self.do_trace):
+                  self.trace ("permissive turn not blocked",
+                              traffic_element.name,
+                              "Permissive turn is not blocked " +
+                              "by North movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+
+            case "moving South":
+              if (abs(movement_angle) > math.radians(90)):
+                if (self.do_trace):
+                  self.trace ("permissive turn blocked", traffic_element.name,
+                              "Permissive turn is blocked " +
+                              "by South movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              ending="\n",
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+                return False
+              else:
+                if (self.do_trace):
+                  self.trace ("permissive turn not blocked",
+                              traffic_element.name,
+                              "Permissive turn is not blocked " +
+                              "by South movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+
+            case "moving East":
+              if ((movement_angle > math.radians(0)) and
+                  (movement_angle < math.radians(180))):
+                if (self.do_trace):
+                  self.trace ("permissive turn blocked", traffic_element.name,
+                              "Permissive turn is blocked " +
+                              "by East movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              ending="\n",
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+                return False
+              else:
+                if (self.do_trace):
+                  self.trace ("permissive turn not blocked",
+                              traffic_element.name,
+                              "Permissive turn is not blocked " +
+                              " by East movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+
+            case "moving West":
+              if ((movement_angle < math.radians(0)) and
+                  (movement_angle > math.radians(-180))):
+                if (self.do_trace):
+                  self.trace ("permissive turn blocked", traffic_element.name,
+                              "Permissive turn is blocked " +
+                              "by West movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              ending="\n",
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+                return False
+              else:
+                if (self.do_trace):
+                  self.trace ("permissive turn not blocked",
+                              traffic_element.name,
+                              "Permissive turn is not blocked " +
+                              "by West movement.\n",
+                              items=(other_traffic_element.as_dict(),),
+                              fields={"movement": movement_type,
+                                      "other traffic element":
+                                      other_traffic_element_name})
+
+            case _:
+              print ("Invalid conflicting movement: " + movement_type + ".")
+              self.error_counter = self.error_counter + 1
+
+    # If all the tests pass, we can proceed.
+    if (self.do_trace):
+      self.trace ("no conflicts", traffic_element.name, "No conflicts.\n\n")
+    return True
+
+  def can_change_lanes (self, traffic_element):
+    this_milestone_index = traffic_element.milestone_index
+    next_milestone_index = this_milestone_index + 1
+    previous_milestone_index = this_milestone_index - 1
+    milestone_list = traffic_element.milestones
+    next_milestone = milestone_list[next_milestone_index]
+    previous_milestone = milestone_list[previous_milestone_index]
+
+    current_lane = traffic_element.current_lane
+
+    # If the current lane does not have a signal face,
+    # we can proceed.
+    if (current_lane not in self.signal_faces_dict):
       return True
-    
-  
-# Subroutine to move a traffic element.
-def move_traffic_element (traffic_element):
-  global current_time
-  global no_activity
-
-  if (do_trace):
-    trace_file.write ("Move traffic element top at " +
-                      format_time(current_time) + ":\n")
-    pprint.pprint (traffic_element, trace_file)
-    
-  # See if our blocker has moved out of the way.
-  if (traffic_element["blocker name"] != None):
-    blocker_name = check_still_blocked (traffic_element)
-    if (blocker_name == None):
-      # The blocker has left.
-      old_speed = traffic_element["old speed"]
-      blocker_name = traffic_element["blocker name"]
-      blocker = traffic_elements[blocker_name]
-      blocker_speed = blocker["speed"]
-      if ((blocker_speed > 0) and (blocker_speed < old_speed)):
-        old_speed = blocker_speed
-      traffic_element["speed"] = old_speed
-      traffic_element["blocker name"] = None
-
-      if (table_OK (5)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          traffic_element["current lane"] + " & " +
-                          cap_first_letter(traffic_element["name"]) +
-                          " is unblocked. \\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-        
-      if (verbosity_level >= 5):  
-        print (format_time(current_time) + " " + traffic_element["name"] +
-               " in " + place_name(traffic_element) + " is unblocked.")
-      
-      if (do_trace):
-        trace_file.write (" Blocker has departed.\n")
-
-      if (do_events_output):
-        write_event(traffic_element, "unblocked")
-        
-  old_time = traffic_element["current time"]
-  delta_time = current_time - old_time
-  current_position_x = traffic_element["position x"]
-  current_position_y = traffic_element["position y"]
-  target_x = traffic_element["target x"]
-  target_y = traffic_element["target y"]
-  delta_x = current_position_x - target_x
-  delta_y = current_position_y - target_y
-  distance_remaining = traffic_element["distance remaining"]
-  total_distance = traffic_element["distance between milestones"]
-  traffic_element["current time"] = current_time
-  
-  if ((delta_time > 0) and (total_distance > 0)):
-    current_speed = traffic_element["speed"]
-    distance_moved = delta_time * current_speed
-    old_position_x = current_position_x
-    old_position_y = current_position_y
-    old_distance_remaining = distance_remaining
-    distance_remaining = distance_remaining - distance_moved
-    if (distance_remaining <= 0):
-      distance_remaining = 0
-    traffic_element["distance remaining"] = distance_remaining
-    fraction_moved = 1.0 - (distance_remaining / total_distance)
-    start_x = traffic_element["start x"]
-    start_y = traffic_element["start y"]
-    target_x = traffic_element["target x"]
-    target_y = traffic_element["target y"]
-    position_x = start_x + (fraction_moved * (target_x - start_x))
-    position_y = start_y + (fraction_moved * (target_y - start_y))
-    traffic_element["position x"] = position_x
-    traffic_element["position y"] = position_y
-    rebuild_shapes (traffic_element)
-      
-    if (verbosity_level >= 5):  
-      print (format_time(current_time) + " " + traffic_element["name"] +
-             " in " + place_name(traffic_element) + " from position (" +
-             format_location(old_position_x) + ", " +
-             format_location(old_position_y) + ") to position (" +
-             format_location(traffic_element["position x"]) + ", " +
-             format_location(traffic_element["position y"]) + 
-             ") distance to next milestone " +
-             format_distance(traffic_element["distance remaining"]) +
-             " speed " + format_speed(traffic_element["speed"]) +
-             " moved " + format_distance(distance_moved) + ".")
-    if (do_trace):
-      trace_file.write ("Moved from (" + format_location(old_position_x) +
-                        ", " + format_location(old_position_y) + ") to (" +
-                        format_location(position_x) + ", " +
-                        format_location(position_y) + ") in " +
-                        format_time(delta_time) + ".\n")
-      pprint.pprint (traffic_element, trace_file)
-      
-    # Undo the move if we are blocked.
-    blocking_traffic_element_name = check_blocked(traffic_element)
-    if (blocking_traffic_element_name != None):
-      # We are blocked.
-      traffic_element["position x"] = old_position_x
-      traffic_element["position y"] = old_position_y
-      traffic_element["distance remaining"] = old_distance_remaining
-      traffic_element["blocker name"] = blocking_traffic_element_name
-      if (traffic_element["speed"] > 0):
-        traffic_element["old speed"] = traffic_element["speed"]
-      traffic_element["speed"] = 0
-      if (verbosity_level >= 5):  
-        print (format_time(current_time) + " " + traffic_element["name"] +
-               " in " + place_name(traffic_element) + " at position (" +
-               format_location(traffic_element["position x"]) + ", " +
-               format_location(traffic_element["position y"]) +
-               " ) distance to next milestone  " +
-               format_distance(traffic_element["distance remaining"]) +
-               " is blocked by " + blocking_traffic_element_name + ".")
-      if (table_OK (5)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          traffic_element["current lane"] + " & " +
-                          cap_first_letter(traffic_element["name"]) +
+
+    signal_face = self.signal_faces_dict[current_lane]
+
+    travel_path_name = traffic_element.travel_path_name
+    travel_path = self.travel_paths[travel_path_name]
+
+    match next_milestone[0]:
+      case "intersection" | "crosswalk":
+
+        if (self.do_trace):
+          self.trace ("considering entering", traffic_element.name,
+                      "Considering entering " + next_milestone[0] + ":\n",
+                      state=traffic_element.as_dict(),
+                      items=(signal_face, travel_path),
+                      fields={"milestone": next_milestone[0],
+                              "signal face": signal_face["name"],
+                              "lamp": signal_face["iluminated lamp name"]})
+
+        iluminated_lamp_name = signal_face ["iluminated lamp name"]
+
+        # If the signal face is showing a green light, we can proceed
+        # without regard to any permissife turn rules.
+        green_colors = travel_path ["green colors"]
+        if (iluminated_lamp_name in green_colors):
+          if (self.do_trace):
+            self.trace ("may enter", traffic_element.name,
+                        " Lamp is " + iluminated_lamp_name +
+                        " so we can proceed.\n",
+                        fields={"lamp": iluminated_lamp_name})
+          return True
+
+        # If the signal face allows permissive turns when its lights
+        # are a certain color, allow entering the intersection if
+        # the lights are right and the path is clear.
+        if (travel_path_name in self.permissive_areas):
+          permissive_colors = travel_path ["permissive colors"]
+          if (iluminated_lamp_name in permissive_colors):
+            if (self.check_conflicting_traffic (
+                traffic_element, self.permissive_areas[travel_path_name])):
+              if (self.do_trace):
+                self.trace ("may enter", traffic_element.name,
+                            " Lamp is " + iluminated_lamp_name +
+                            " and no conflicting traffic.\n",
+                            fields={"lamp": iluminated_lamp_name,
+                                    "permissive": True})
+              return True
+
+        # Otherwise we cannot enter the intersection or crosswalk.
+        if (self.do_trace):
+          self.trace ("may not enter", traffic_element.name,
+                      " Lamp is " + iluminated_lamp_name +
+                      " so we cannot proceed.\n",
+                      fields={"lamp": iluminated_lamp_name})
+        return False
+
+      case _:
+        # The milestone is neither the entrance to the intersection nor
+        # the entrance to the crosswalk.  Always allow it.
+        return True
+
+  # Subroutine to move a traffic element.
+  # If precomputed_move is not None it holds the results of the batched
+  # kinematics step: the distance moved, the new distance remaining,
+  # the new position and the new shapes.
+  def move_traffic_element (self, traffic_element, precomputed_move):
+    if (self.do_trace):
+      self.trace ("move traffic element", traffic_element.name,
+                  "Move traffic element top at " +
+                  format_time(self.current_time) + ":\n",
+                  state=traffic_element.as_dict())
+
+    # See if our blocker has moved out of the way.
+    if (traffic_element.blocker_name != None):
+      blocker_name = self.check_still_blocked (traffic_element)
+      if (blocker_name == None):
+        # The blocker has left.  It may have left the simulation, and
+        # so the traffic elements dictionary, so it is found through
+        # the traffic element it blocked.
+        old_speed = traffic_element.old_speed
+        blocker_name = traffic_element.blocker_name
+        blocker_speed = traffic_element.blocker.speed
+        if ((blocker_speed > 0) and (blocker_speed < old_speed)):
+          old_speed = blocker_speed
+        traffic_element.speed = old_speed
+        traffic_element.blocker_name = None
+        traffic_element.blocker = None
+
+        if (self.table_wanted (5)):
+          self.table_row (5, traffic_element.current_lane,
+                          " " + cap_first_letter(traffic_element.name) +
+                          " is unblocked. ")
+
+        if (self.verbosity_level >= 5):  
+          print (format_time(self.current_time) + " " + traffic_element.name +
+                 " in " + place_name(traffic_element) + " is unblocked.")
+
+        if (self.do_trace):
+          self.trace ("blocker departed", traffic_element.name,
+                      " Blocker has departed.\n")
+
+        if (self.bus.wants (event_bus.ElementEvent)):
+          self.bus.emit (event_bus.ElementEvent (
+            self.current_time, traffic_element, "unblocked"))
+
+    old_time = traffic_element.current_time
+    delta_time = self.current_time - old_time
+    current_position_x = traffic_element.position_x
+    current_position_y = traffic_element.position_y
+    target_x = traffic_element.target_x
+    target_y = traffic_element.target_y
+    delta_x = current_position_x - target_x
+    delta_y = current_position_y - target_y
+    distance_remaining = traffic_element.distance_remaining
+    total_distance = traffic_element.distance_between_milestones
+    traffic_element.current_time = self.current_time
+    if (traffic_element.speed == 0):
+      self.note_wait (traffic_element, delta_time)
+
+    if ((delta_time > 0) and (total_distance > 0)):
+      old_position_x = current_position_x
+      old_position_y = current_position_y
+      old_distance_remaining = distance_remaining
+      if (precomputed_move != None):
+        (distance_moved, distance_remaining, position_x, position_y,
+         shapes) = precomputed_move
+        if (distance_remaining <= 0):
+          distance_remaining = 0
+        traffic_element.distance_remaining = distance_remaining
+        traffic_element.position_x = position_x
+        traffic_element.position_y = position_y
+        (traffic_element.shape, traffic_element.stop_shape,
+         traffic_element.go_shape) = shapes
+        traffic_element.shapes_distance_remaining = distance_remaining
+      else:
+        current_speed = traffic_element.speed
+        distance_moved = delta_time * current_speed
+        distance_remaining = distance_remaining - distance_moved
+        if (distance_remaining <= 0):
+          distance_remaining = 0
+        traffic_element.distance_remaining = distance_remaining
+        fraction_moved = 1.0 - (distance_remaining / total_distance)
+        start_x = traffic_element.start_x
+        start_y = traffic_element.start_y
+        target_x = traffic_element.target_x
+        target_y = traffic_element.target_y
+        position_x = start_x + (fraction_moved * (target_x - start_x))
+        position_y = start_y + (fraction_moved * (target_y - start_y))
+        traffic_element.position_x = position_x
+        traffic_element.position_y = position_y
+        self.rebuild_shapes (traffic_element)
+
+      if (self.verbosity_level >= 5):  
+        print (format_time(self.current_time) + " " + traffic_element.name +
+               " in " + place_name(traffic_element) + " from position (" +
+               format_location(old_position_x) + ", " +
+               format_location(old_position_y) + ") to position (" +
+               format_location(traffic_element.position_x) + ", " +
+               format_location(traffic_element.position_y) + 
+               ") distance to next milestone " +
+               format_distance(traffic_element.distance_remaining) +
+               " speed " + format_speed(traffic_element.speed) +
+               " moved " + format_distance(distance_moved) + ".")
+      if (self.do_trace):
+        self.trace ("moved", traffic_element.name,
+                    "Moved from (" + format_location(old_position_x) + ", " +
+                    format_location(old_position_y) + ") to (" +
+                    format_location(position_x) + ", " +
+                    format_location(position_y) + ") in " +
+                    format_time(delta_time) + ".\n",
+                    state=traffic_element.as_dict(),
+                    fields={"old position x": old_position_x,
+                            "old position y": old_position_y,
+                            "duration": delta_time})
+
+      # Undo the move if we are blocked.
+      blocking_traffic_element_name = self.check_blocked(traffic_element)
+      if (blocking_traffic_element_name != None):
+        # We are blocked.
+        traffic_element.position_x = old_position_x
+        traffic_element.position_y = old_position_y
+        traffic_element.distance_remaining = old_distance_remaining
+        traffic_element.blocker_name = blocking_traffic_element_name
+        traffic_element.blocker = self.traffic_elements[
+          blocking_traffic_element_name]
+        if (traffic_element.speed > 0):
+          traffic_element.old_speed = traffic_element.speed
+          self.note_wait (traffic_element, delta_time)
+        traffic_element.speed = 0
+        if (self.verbosity_level >= 5):  
+          print (format_time(self.current_time) + " " + traffic_element.name +
+                 " in " + place_name(traffic_element) + " at position (" +
+                 format_location(traffic_element.position_x) + ", " +
+                 format_location(traffic_element.position_y) +
+                 " ) distance to next milestone  " +
+                 format_distance(traffic_element.distance_remaining) +
+                 " is blocked by " + blocking_traffic_element_name + ".")
+        if (self.table_wanted (5)):
+          self.table_row (5, traffic_element.current_lane,
+                          " " + cap_first_letter(traffic_element.name) +
                           " is blocked by " +
-                          blocking_traffic_element_name + ". \\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-        
-      if (do_events_output):
-        write_event(traffic_element, "blocked")
-                           
-      return
-    
-    no_activity = False
-  if (distance_remaining == 0):
-    # We have reached the next milestone.
-    this_milestone_index = traffic_element["milestone index"]
-    next_milestone_index = this_milestone_index + 1
-    following_milestone_index = next_milestone_index + 1
-    milestone_list = traffic_element["milestones"]
-    if ((verbosity_level >= 5) and (traffic_element["speed"] != 0)):        
-      print (format_time(current_time) + " " + traffic_element["name"] +
-             " in " + place_name(traffic_element) + " at position (" +
-             format_location(traffic_element["position x"]) + ", " +
-             format_location(traffic_element["position y"]) +
-             ") (milestone " + str(next_milestone_index) + " of " +
-             str(len(milestone_list)) + ") speed " +
-             format_speed(traffic_element["speed"]) + ".")
-    if (following_milestone_index >= len(milestone_list)):
-      # We have reached the last milestone.
-      traffic_element["present"] = False
-      traffic_element["shape"] = None
-      if (verbosity_level >= 2):
-        print (format_time(current_time) + " " +
-               traffic_element["name"] +
-               " in " + place_name(traffic_element) +
-               " exits the simulation at position (" +
-               format_location(traffic_element["position x"]) + ", " +
-               format_location(traffic_element["position y"]) + ").")
-      if (table_OK (2)):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          traffic_element["current lane"] + " & " +
-                          cap_first_letter(traffic_element["name"]) +
-                          " exits the simulation. \\\\\n")
-        if (flush_table_file):
-          table_file.flush()
-      if (do_events_output):
-        write_event (traffic_element, "exiting")
-      
-      no_activity = False
-    else:
-      # There is a milestone after the next one.
-      this_milestone = milestone_list[this_milestone_index]
-      next_milestone = milestone_list[next_milestone_index]
-      following_milestone = milestone_list[following_milestone_index]
-      
-      # Check for changing lanes
-      current_lane = traffic_element["current lane"]
-      if (next_milestone[0] != current_lane):
-        # We cannot enter the intersection or crosswalk if the light is red.
-        if (not can_change_lanes (traffic_element)):
-          if (traffic_element["speed"] != 0):
-            traffic_element["speed"] = 0
-            traffic_element["was stopped"] = True
-            traffic_element["stopped time"] = current_time
-
-            if (verbosity_level >= 2):
-              print (format_time(current_time) + " " +
-                     traffic_element["name"] +
-                     " in " + place_name(traffic_element) +
-                     " at position (" +
-                     format_location(traffic_element["position x"]) +
-                     ", " +
-                     format_location(traffic_element["position y"]) +
-                     ") distance to next milestone " +
-                     format_distance(
-                       traffic_element["distance remaining"]) +
-                     " stopped.")
-            if (table_OK (2)):
-              table_file.write ("\\hline " + format_time_N(current_time) +
-                                " & " + traffic_element["current lane"] +
-                                " & " +
-                                cap_first_letter(traffic_element["name"]) +
-                                " stopped. \\\\\n")
-              if (flush_table_file):
-                table_file.flush()
-            if (do_events_output):
-              write_event (traffic_element, "stopped")
-              
-            no_activity = False
-        else:
-          # We are allowed to enter this lane.
-          match next_milestone[0]:
-            case "crosswalk" | "intersection":
-              if (verbosity_level >= 2):
-                print (format_time(current_time) + " " +
-                       traffic_element["name"] +
-                       " in " + place_name(traffic_element) +
-                       " enters the " + next_milestone[0] +
-                       " at position (" +
-                       format_location(traffic_element["position x"]) + ", " +
-                       format_location(traffic_element["position y"]) + ").")
-            
-              if (table_OK (2)):
-                table_file.write ("\\hline " + format_time_N(current_time) +
-                                  " & " + traffic_element["current lane"] +
-                                  " & " +
-                                  cap_first_letter(traffic_element["name"]) +
-                                  " enters the " + next_milestone[0] +
-                                  ". \\\\\n")
-                if (flush_table_file):
-                  table_file.flush()
-              
-              new_milestone (traffic_element)
-
-              if (do_trace):
-                trace_file.write ("Entering " + next_milestone[0] + ":\n")
-                pprint.pprint (traffic_element, trace_file)
-                
-              if (do_events_output):
-                write_event (traffic_element, "entering")
-                
-              no_activity = False
-              
-            case _:
-              # Changing lanes but not into the intersection or crosswalk
-              old_lane = traffic_element["current lane"]
-              new_milestone (traffic_element)
-          
-              match old_lane:
-                case "intersection" | "crosswalk":
-                  tail_text = " leaves the " + old_lane
-                case _:
-                  tail_text = " leaves lane " + old_lane
-              
-              if (verbosity_level >= 2):
-                print (format_time(current_time) + " " +
-                       traffic_element["name"] +
+                          blocking_traffic_element_name + ". ")
+
+        if (self.bus.wants (event_bus.ElementEvent)):
+          self.bus.emit (event_bus.ElementEvent (
+            self.current_time, traffic_element, "blocked"))
+
+        return
+
+      self.no_activity = False
+    if (distance_remaining == 0):
+      # We have reached the next milestone.
+      this_milestone_index = traffic_element.milestone_index
+      next_milestone_index = this_milestone_index + 1
+      following_milestone_index = next_milestone_index + 1
+      milestone_list = traffic_element.milestones
+      if ((self.verbosity_level >= 5) and
+          (traffic_element.speed != 0)):        
+        print (format_time(self.current_time) + " " + traffic_element.name +
+               " in " + place_name(traffic_element) + " at position (" +
+               format_location(traffic_element.position_x) + ", " +
+               format_location(traffic_element.position_y) +
+               ") (milestone " + str(next_milestone_index) + " of " +
+               str(len(milestone_list)) + ") speed " +
+               format_speed(traffic_element.speed) + ".")
+      if (following_milestone_index >= len(milestone_list)):
+        # We have reached the last milestone.
+        traffic_element.present = False
+        traffic_element.shape = None
+        self.leave_lane_queue (traffic_element)
+        del self.travel_path_elements[traffic_element.travel_path_name][
+          traffic_element.name]
+        del self.traffic_elements[traffic_element.name]
+        self.record_exit (traffic_element)
+        if (self.verbosity_level >= 2):
+          print (format_time(self.current_time) + " " +
+                 traffic_element.name +
+                 " in " + place_name(traffic_element) +
+                 " exits the simulation at position (" +
+                 format_location(traffic_element.position_x) + ", " +
+                 format_location(traffic_element.position_y) + ").")
+        if (self.table_wanted (2)):
+          self.table_row (2, traffic_element.current_lane,
+                          " " + cap_first_letter(traffic_element.name) +
+                          " exits the simulation. ")
+        if (self.bus.wants (event_bus.ElementEvent)):
+          self.bus.emit (event_bus.ElementEvent (
+            self.current_time, traffic_element, "exiting"))
+
+        self.no_activity = False
+      else:
+        # There is a milestone after the next one.
+        this_milestone = milestone_list[this_milestone_index]
+        next_milestone = milestone_list[next_milestone_index]
+        following_milestone = milestone_list[following_milestone_index]
+
+        # Check for changing lanes
+        current_lane = traffic_element.current_lane
+        if (next_milestone[0] != current_lane):
+          # We cannot enter the intersection or crosswalk if the light is red.
+          if (not self.can_change_lanes (traffic_element)):
+            if (traffic_element.speed != 0):
+              traffic_element.speed = 0
+              traffic_element.was_stopped = True
+              traffic_element.stopped_time = self.current_time
+
+              if (self.verbosity_level >= 2):
+                print (format_time(self.current_time) + " " +
+                       traffic_element.name +
                        " in " + place_name(traffic_element) +
                        " at position (" +
-                       format_location(traffic_element["position x"]) + ", " +
-                       format_location(traffic_element["position y"]) + 
+                       format_location(traffic_element.position_x) +
+                       ", " +
+                       format_location(traffic_element.position_y) +
                        ") distance to next milestone " +
-                       format_distance(traffic_element["distance remaining"]) +
-                       " speed " + format_speed(traffic_element["speed"]) +
-                       tail_text + ".")
-              if (table_OK (2)):
-                table_file.write ("\\hline " + format_time_N(current_time) +
-                                  " & " + traffic_element["current lane"] +
-                                  " & " +
-                                  cap_first_letter(traffic_element["name"]) +
-                                  tail_text + ". \\\\\n")
-                if (flush_table_file):
-                  table_file.flush()
-              if (do_trace):
-                trace_file.write ("Changing lane from " + old_lane + ":\n")
-                pprint.pprint (traffic_element, trace_file)
-            
-              if (do_events_output):
-                write_event (traffic_element, "changing lane")
-
-              no_activity = False
-      else:
-        # Not changing lanes
-        new_milestone (traffic_element)
-
-        if (verbosity_level >= 5):
-          print (format_time(current_time) + " " +
-                 traffic_element["name"] +
-                 " in " + place_name(traffic_element) + " at position (" +
-                 format_location(traffic_element["position x"]) + ", " +
-                 format_location(traffic_element["position y"]) +
-                 ") speed " + format_speed(traffic_element["speed"]) +
-                 " at a milestone.")
-        if (table_OK (5)):
-          table_file.write ("\\hline " + format_time_N(current_time) +
-                            " & " + traffic_element["current lane"] +
-                            " & " +
-                            cap_first_letter(traffic_element["name"]) +
+                       format_distance(
+                         traffic_element.distance_remaining) +
+                       " stopped.")
+              if (self.table_wanted (2)):
+                self.table_row (2, traffic_element.current_lane,
+                                " " + cap_first_letter(traffic_element.name) +
+                                " stopped. ")
+              if (self.bus.wants (event_bus.ElementEvent)):
+                self.bus.emit (event_bus.ElementEvent (
+                  self.current_time, traffic_element, "stopped"))
+
+              self.no_activity = False
+          else:
+            # We are allowed to enter this lane.
+            match next_milestone[0]:
+              case "crosswalk" | "intersection":
+                if (self.verbosity_level >= 2):
+                  print (format_time(self.current_time) + " " +
+                         traffic_element.name +
+                         " in " + place_name(traffic_element) +
+                         " enters the " + next_milestone[0] +
+                         " at position (" +
+                         format_location(traffic_element.position_x) + ", " +
+                         format_location(traffic_element.position_y) + ").")
+
+                if (self.table_wanted (2)):
+                  self.table_row (2, traffic_element.current_lane,
+                                  " " +
+                                  cap_first_letter(traffic_element.name) +
+                                  " enters the " + next_milestone[0] + ". ")
+
+
+                self.new_milestone (traffic_element)
+                self.update_lane_queue (traffic_element)
+
+                if (self.do_trace):
+                  self.trace ("entering", traffic_element.name,
+                              "Entering " + next_milestone[0] + ":\n",
+                              state=traffic_element.as_dict(),
+                              fields={"milestone": next_milestone[0]})
+
+                if (self.bus.wants (event_bus.ElementEvent)):
+                  self.bus.emit (event_bus.ElementEvent (
+                    self.current_time, traffic_element, "entering"))
+
+                self.no_activity = False
+
+              case _:
+                # Changing lanes but not into the intersection or crosswalk
+                old_lane = traffic_element.current_lane
+                self.new_milestone (traffic_element)
+                self.update_lane_queue (traffic_element)
+
+                match old_lane:
+                  case "intersection" | "crosswalk":
+                    tail_text = " leaves the " + old_lane
+                  case _:
+                    tail_text = " leaves lane " + old_lane
+
+                if (self.verbosity_level >= 2):
+                  print (format_time(self.current_time) + " " +
+                         traffic_element.name +
+                         " in " + place_name(traffic_element) +
+                         " at position (" +
+                         format_location(traffic_element.position_x) + ", " +
+                         format_location(traffic_element.position_y) + 
+                         ") distance to next milestone " +
+                         format_distance(traffic_element.distance_remaining) +
+                         " speed " + format_speed(traffic_element.speed) +
+                         tail_text + ".")
+                if (self.table_wanted (2)):
+                  self.table_row (2, traffic_element.current_lane,
+                                  " " +
+                                  cap_first_letter(traffic_element.name) +
+                                  tail_text + ". ")
+                if (self.do_trace):
+                  self.trace ("changing lane", traffic_element.name,
+                              "Changing lane from " + old_lane + ":\n",
+                              state=traffic_element.as_dict(),
+                              fields={"old lane": old_lane})
+
+                if (self.bus.wants (event_bus.ElementEvent)):
+                  self.bus.emit (event_bus.ElementEvent (
+                    self.current_time, traffic_element, "changing lane"))
+
+                self.no_activity = False
+        else:
+          # Not changing lanes
+          self.new_milestone (traffic_element)
+
+          if (self.verbosity_level >= 5):
+            print (format_time(self.current_time) + " " +
+                   traffic_element.name +
+                   " in " + place_name(traffic_element) + " at position (" +
+                   format_location(traffic_element.position_x) + ", " +
+                   format_location(traffic_element.position_y) +
+                   ") speed " + format_speed(traffic_element.speed) +
+                   " at a milestone.")
+          if (self.table_wanted (5)):
+            self.table_row (5, traffic_element.current_lane,
+                            " " + cap_first_letter(traffic_element.name) +
                             " at position (" +
-                            format_location(traffic_element["position x"]) +
+                            format_location(traffic_element.position_x) +
                             ", " +
-                            format_location(traffic_element["position y"]) +
-                            ") at a milestone. \\\\\n")
-          if (flush_table_file):
-            table_file.flush()
-        no_activity = False
-
-        if (do_trace):
-          trace_file.write ("Reached milestone:\n")
-          pprint.pprint (traffic_element, trace_file)
-
-        if (do_events_output):
-            write_event (traffic_element, "reaching milestone")
-            
-  return
+                            format_location(traffic_element.position_y) +
+                            ") at a milestone. ")
+          self.no_activity = False
 
-# Subroutine to activate any sensors that detect a traffic element
-# and deactivate them when the traffic element has left.
-def check_sensors():
-  global no_activity
-  
-  for signal_face in signal_faces_list:
-    signal_face_name = signal_face["name"]
-    sensors = signal_face["sensors"]
-    for sensor_name in sensors:
-      sensor = sensors[sensor_name]
-      if ("shape" in sensor):
-        triggered = False
-        for traffic_element_name in traffic_elements:
-          traffic_element = traffic_elements[traffic_element_name]
-          if (check_overlap_sensor (traffic_element, sensor)):
-            triggered = True
-            sensor["triggered by"] = traffic_element["name"]
-        if (not sensor["controlled by script"]):
-          if (sensor["value"] != triggered):
-            sensor["value"] = triggered
-            no_activity = False
-            if (verbosity_level >= 2):
-              print (format_time(current_time)  + " sensor " +
-                     signal_face["name"] + "/" + sensor_name + " set to " +
-                     str(sensor["value"]) + " by " + sensor["triggered by"] +
-                     ".")
-            if (table_OK (2)):
-              table_file.write ("\\hline " + format_time_N(current_time) +
-                                " & " + signal_face ["name"] + " & Sensor " +
-                                sensor_name + " set to " +
+          if (self.do_trace):
+            self.trace ("reached milestone", traffic_element.name,
+                        "Reached milestone:\n",
+                        state=traffic_element.as_dict())
+
+          if (self.bus.wants (event_bus.ElementEvent)):
+            self.bus.emit (event_bus.ElementEvent (
+              self.current_time, traffic_element, "reaching milestone"))
+
+    return
+
+  # Advance all of the traffic elements that are moving freely in one
+  # batched step.  An element moves freely if it is present, is not
+  # blocked, and has somewhere to go.  The result is a dictionary, indexed
+  # by traffic element name, of the values move_traffic_element would
+  # compute for itself.  Blocking, reaching a milestone and entering the
+  # intersection are still handled one traffic element at a time by
+  # move_traffic_element.
+  def compute_free_moves(self):
+    precomputed_moves = dict()
+
+    # The trace shows each traffic element as its shapes are rebuilt,
+    # so when tracing let move_traffic_element do all the work.
+    if (self.do_trace):
+      return (precomputed_moves)
+
+    moving_elements = list()
+    for traffic_element in self.traffic_elements.values():
+      if (traffic_element.present and
+          (traffic_element.blocker_name == None) and
+          (traffic_element.current_time < self.current_time) and
+          (traffic_element.distance_between_milestones > 0)):
+        moving_elements.append (traffic_element)
+    if (len(moving_elements) == 0):
+      return (precomputed_moves)
+
+    delta_times = np.array ([float(self.current_time -
+                                   traffic_element.current_time)
+                             for traffic_element in moving_elements])
+    speeds = np.array ([traffic_element.speed
+                        for traffic_element in moving_elements], dtype=float)
+    distances_remaining = np.array ([traffic_element.distance_remaining
+                                     for traffic_element in moving_elements],
+                                    dtype=float)
+    total_distances = np.array ([traffic_element.distance_between_milestones
+                                 for traffic_element in moving_elements],
+                                dtype=float)
+    start_x = np.array ([traffic_element.start_x
+                         for traffic_element in moving_elements], dtype=float)
+    start_y = np.array ([traffic_element.start_y
+                         for traffic_element in moving_elements], dtype=float)
+    target_x = np.array ([traffic_element.target_x
+                          for traffic_element in moving_elements], dtype=float)
+    target_y = np.array ([traffic_element.target_y
+                          for traffic_element in moving_elements], dtype=float)
+
+    distances_moved = delta_times * speeds
+    distances_remaining = distances_remaining - distances_moved
+    distances_remaining[distances_remaining <= 0] = 0.0
+    fractions_moved = 1.0 - (distances_remaining / total_distances)
+    position_x = start_x + (fractions_moved * (target_x - start_x))
+    position_y = start_y + (fractions_moved * (target_y - start_y))
+
+    widths = np.array ([traffic_element.width
+                        for traffic_element in moving_elements], dtype=float)
+    lengths = np.array ([traffic_element.length
+                         for traffic_element in moving_elements], dtype=float)
+    angles = [traffic_element.angle for traffic_element in moving_elements]
+    shapes = build_shapes (position_x, position_y, widths, lengths, angles)
+
+    for (traffic_element, distance_moved, distance_remaining, new_x, new_y,
+         new_shapes) in zip (moving_elements, distances_moved.tolist(),
+                             distances_remaining.tolist(), position_x.tolist(),
+                             position_y.tolist(), shapes):
+      precomputed_moves[traffic_element.name] = (distance_moved,
+                                                 distance_remaining,
+                                                 new_x, new_y, new_shapes)
+    return (precomputed_moves)
+
+  # Subroutine to activate any sensors that detect a traffic element
+  # and deactivate them when the traffic element has left.
+  def check_sensors(self):
+    for signal_face in self.signal_faces_list:
+      signal_face_name = signal_face["name"]
+      sensors = signal_face["sensors"]
+      for sensor_name in sensors:
+        sensor = sensors[sensor_name]
+        if ("shape" in sensor):
+          triggered = False
+          for traffic_element_name in self.traffic_elements:
+            traffic_element = self.traffic_elements[traffic_element_name]
+            if (self.check_overlap_sensor (traffic_element, sensor)):
+              triggered = True
+              sensor["triggered by"] = traffic_element.name
+          if (not sensor["controlled by script"]):
+            if (sensor["value"] != triggered):
+              sensor["value"] = triggered
+              self.no_activity = False
+              if (self.verbosity_level >= 2):
+                print (format_time(self.current_time)  + " sensor " +
+                       signal_face["name"] + "/" + sensor_name + " set to " +
+                       str(sensor["value"]) + " by " + sensor["triggered by"] +
+                       ".")
+              if (self.table_wanted (2)):
+                self.table_row (2, signal_face["name"],
+                                " Sensor " + sensor_name + " set to " +
                                 str(sensor["value"]) + " by " +
-                                sensor["triggered by"] + ". \\\\\n")
-              if (flush_table_file):
-                table_file.flush()
-            
-  return
-            
-  
-def timer_state (signal_face, timer_name):
-  timers_list = signal_face["timers"]
-  for the_timer in timers_list:
-    if (the_timer["name"] == timer_name):
-      return the_timer["state"]
+                                sensor["triggered by"] + ". ")
 
-# Execute an action from the script.
-def perform_script_action (the_operator, signal_face_name, the_operand,
-                           permissive_delay):
-  for signal_face in signal_faces_list:
-    if ((signal_face["name"] == signal_face_name) or
-        (signal_face_name == "all")):
-      match the_operator:
-        case "set toggle":
-          set_toggle_value (signal_face, the_operand, True, "script")
-        case "sensor on" | "sensor off":
-          sensor_name = the_operand
-          sensors = signal_face["sensors"]
-          sensor = sensors[sensor_name]
-          sensor["controlled by script"] = True
-
-          if (the_operator == "sensor on"):
-            sensor ["value"] = True
-          else:
-            sensor ["value"] = False
-            
-          if (verbosity_level >= 2):
-            print (format_time(current_time)  + " sensor " +
-                   signal_face["name"] + "/" + sensor_name + " set to " +
-                   str(sensor["value"]) + " by script.")
-          if (table_OK (2)):
-            table_file.write ("\\hline " + format_time_N(current_time) +
-                              " & " + signal_face ["name"] + " & Sensor " +
-                              sensor_name + " set to " + str(sensor["value"]) +
-                              " by script. \\\\\n")
-            if (flush_table_file):
-              table_file.flush()
-            
-        case "car" | "truck" | "pedestrian":
-          add_traffic_element (the_operator, the_operand, permissive_delay)
-          
-  return
+    return
 
-# Update the timers to the current time.
-def update_timers():
-  global no_activity
-  
-  remove_timers = list()
-  if (verbosity_level >= 5):
-    active_timer_list = ""
-    for the_timer in running_timers:
-      active_timer_list = (active_timer_list + " " +
-                           the_timer["signal face name"] + "/" +
-                           the_timer["name"])
-    print (format_time(current_time) + " Active timers: " + active_timer_list +
-           ".")
-    
-  for the_timer in running_timers:
-    the_timer["remaining time"] = the_timer["completion time"] - current_time
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " timer " +
-             the_timer ["signal face name"] + "/" + the_timer["name"] +
-             " has " + format_time(the_timer["remaining time"]) +
-             " remaining.")
-    if ((the_timer ["state"] == "running") and
-        (the_timer["remaining time"] <= 0)):
-      the_timer["state"] = "completed"
-      remove_timers.append(the_timer)
-      no_activity = False
-      if (verbosity_level >= 5):
-        print (format_time(current_time) + " timer " +
-               the_timer ["signal face name"] + "/" + the_timer["name"] +
-               " completed.")
-      if (table_OK (4) and ((not only_important) or the_timer["important"])):
-        table_file.write ("\\hline " + format_time_N(current_time) + " & " +
-                          the_timer ["signal face name"] + " & Timer " +
-                          the_timer ["name"] + " completed. \\\\\n")
-        if (flush_table_file):
-          table_file.flush()
+  # Execute an action from the script.
+  def perform_script_action (self, the_operator, signal_face_name, the_operand,
+                                   permissive_delay):
+    for signal_face in self.signal_faces_list:
+      if ((signal_face["name"] == signal_face_name) or
+          (signal_face_name == "all")):
+        match the_operator:
+          case "set toggle":
+            self.set_toggle_value (signal_face, the_operand, True, "script")
+          case "sensor on" | "sensor off":
+            sensor_name = the_operand
+            sensors = signal_face["sensors"]
+            sensor = sensors[sensor_name]
+            sensor["controlled by script"] = True
+
+            if (the_operator == "sensor on"):
+              sensor ["value"] = True
+            else:
+              sensor ["value"] = False
+
+            if (self.verbosity_level >= 2):
+              print (format_time(self.current_time)  + " sensor " +
+                     signal_face["name"] + "/" + sensor_name + " set to " +
+                     str(sensor["value"]) + " by script.")
+            if (self.table_wanted (2)):
+              self.table_row (2, signal_face["name"],
+                              " Sensor " + sensor_name + " set to " +
+                              str(sensor["value"]) + " by script. ")
+
+          case "car" | "truck" | "pedestrian":
+            self.add_traffic_element (the_operator, the_operand,
+                                      permissive_delay)
+
+    return
+
+  # Note that a traffic element did not move for the last delta_time
+  # seconds.  Waits separated by less than a second of movement, as a
+  # traffic element creeps forward in a queue, count as a single stop.
+  def note_wait (self, traffic_element, delta_time):
+    wait_start = float(self.current_time) - float(delta_time)
+    if ((traffic_element.last_wait_time == None) or
+        (wait_start - traffic_element.last_wait_time >= 1.0)):
+      traffic_element.stop_count = traffic_element.stop_count + 1
+    traffic_element.wait_time = traffic_element.wait_time + float(delta_time)
+    traffic_element.last_wait_time = float(self.current_time)
+    return
+
+  # Note the delay of a traffic element which is leaving the simulation.
+  def record_exit (self, traffic_element):
+    free_flow_time = traffic_element.segments.free_flow_time ()
+    # The clock can be a Decimal after it advances to an end time.
+    trip_time = (float(self.current_time) -
+                 float(traffic_element.start_time))
+    delay = max(trip_time - free_flow_time, 0.0)
+    self.exit_count = self.exit_count + 1
+    self.total_delay = self.total_delay + delay
+    travel_path_name = traffic_element.travel_path_name
+    if (travel_path_name not in self.travel_path_sketches):
+      self.travel_path_sketches[travel_path_name] = {
+        measurement: QuantileSketch ()
+        for measurement in travel_path_measurements}
+    sketches = self.travel_path_sketches[travel_path_name]
+    sketches["wait"].add (traffic_element.wait_time)
+    sketches["stops"].add (traffic_element.stop_count)
+    sketches["travel time"].add (trip_time)
+    sketches["delay"].add (delay)
+    if (self.do_trips_output):
+      self.write_trip (traffic_element, "exited")
+    return
+
+  # Update the timers to the current time.
+  def update_timers(self):
+    remove_timers = list()
+    if (self.verbosity_level >= 5):
+      active_timer_list = ""
+      for the_timer in self.running_timers:
+        active_timer_list = (active_timer_list + " " +
+                             the_timer["signal face name"] + "/" +
+                             the_timer["name"])
+      print (format_time(self.current_time) + " Active timers: " +
+             active_timer_list +
+             ".")
 
-  if ((verbosity_level >= 5) and (len(remove_timers) > 0)):
-    remove_timers_list = ""
+    for the_timer in self.running_timers:
+      the_timer["remaining time"] = (the_timer["completion time"] -
+                                     self.current_time)
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " timer " +
+               the_timer ["signal face name"] + "/" + the_timer["name"] +
+               " has " + format_time(the_timer["remaining time"]) +
+               " remaining.")
+      if ((the_timer ["state"] == "running") and
+          (the_timer["remaining time"] <= 0)):
+        the_timer["state"] = "completed"
+        remove_timers.append(the_timer)
+        self.no_activity = False
+        if (self.bus.wants (event_bus.TimerEvent)):
+          self.bus.emit (event_bus.TimerEvent (
+            self.current_time, the_timer["signal face name"],
+            the_timer["name"], "completed"))
+        if (self.verbosity_level >= 5):
+          print (format_time(self.current_time) + " timer " +
+                 the_timer ["signal face name"] + "/" + the_timer["name"] +
+                 " completed.")
+        if (self.table_wanted (4)):
+          self.table_row (4, the_timer["signal face name"],
+                          " Timer " + the_timer["name"] + " completed. ",
+                          important=the_timer["important"])
+
+    if ((self.verbosity_level >= 5) and (len(remove_timers) > 0)):
+      remove_timers_list = ""
+
+      for the_timer in remove_timers:
+        remove_timers_list = (remove_timers_list + " " +
+                              the_timer["signal face name"] + "/" +
+                              the_timer["name"])
+      print (format_time(self.current_time) + " Timers being removed: " +
+             remove_timers_list + ".")
 
     for the_timer in remove_timers:
-      remove_timers_list = (remove_timers_list + " " +
-                            the_timer["signal face name"] + "/" +
-                            the_timer["name"])
-    print (format_time(current_time) + " Timers being removed: " +
-           remove_timers_list + ".")
-    
-  for the_timer in remove_timers:
-    running_timers.remove(the_timer)
-
-  if ((verbosity_level >= 5) and (len(remove_timers) > 0)):
-    active_timer_list = ""
-    for the_timer in running_timers:
-      active_timer_list = (active_timer_list + " " +
-                           the_timer["signal face name"] + "/" +
-                           the_timer["name"])
-    print (format_time(current_time) + " Remaining active timers: " +
-           active_timer_list + "(" + str(len(running_timers)) + ").")
-    
-  return
+      self.running_timers.remove(the_timer)
 
-# Find the next timer completion time.
-def find_next_timer_completion_time():
-  next_timer_completion_time = None
-  for the_timer in running_timers:
-    if (next_timer_completion_time == None):
-      next_timer_completion_time = the_timer["completion time"]
-    else:
-      if (the_timer["completion time"] < next_timer_completion_time):
+    if ((self.verbosity_level >= 5) and (len(remove_timers) > 0)):
+      active_timer_list = ""
+      for the_timer in self.running_timers:
+        active_timer_list = (active_timer_list + " " +
+                             the_timer["signal face name"] + "/" +
+                             the_timer["name"])
+      print (format_time(self.current_time) + " Remaining active timers: " +
+             active_timer_list + "(" + str(len(self.running_timers)) + ").")
+
+    return
+
+  # Find the next timer completion time.
+  def find_next_timer_completion_time(self):
+    next_timer_completion_time = None
+    for the_timer in self.running_timers:
+      if (next_timer_completion_time == None):
         next_timer_completion_time = the_timer["completion time"]
-  return (next_timer_completion_time)
-
-# Find the time of the next action in the script.
-def find_next_script_action_time():
-  next_script_action_time = None
-  for the_action in script_set:
-    the_time = the_action[0]
-    if (next_script_action_time == None):
-      next_script_action_time = the_time
-    else:
-      if (the_time < next_script_action_time):
-        next_script_action_time = the_time
-  return (next_script_action_time)
-
-# Find the next traffic element time.
-# Someday compute the time until the next reaching of a milestone or
-# another traffic element.  Don't forget permissive turns.
-def find_next_traffic_element_time():
-  min_time = end_time
-  for traffic_element_name in traffic_elements:
-    traffic_element = traffic_elements[traffic_element_name]
-    if (traffic_element["present"]):
-      return (current_time + clock_step)
-  return (None)
+      else:
+        if (the_timer["completion time"] < next_timer_completion_time):
+          next_timer_completion_time = the_timer["completion time"]
+    return (next_timer_completion_time)
+
+  # Find the time of the next action in the script.
+  def find_next_script_action_time(self):
+    next_script_action_time = None
+    if (len(self.script_actions) > 0):
+      next_script_action_time = self.script_actions[0][0]
+    if ((len(self.arrival_streams) > 0) and
+        ((next_script_action_time == None) or
+         (self.arrival_streams[0][0] < next_script_action_time))):
+      next_script_action_time = self.arrival_streams[0][0]
+    return (next_script_action_time)
+
+  # Find the next traffic element time.
+  # Someday compute the time until the next reaching of a milestone or
+  # another traffic element.  Don't forget permissive turns.
+  def find_next_traffic_element_time(self):
+    min_time = self.end_time
+    for traffic_element_name in self.traffic_elements:
+      traffic_element = self.traffic_elements[traffic_element_name]
+      if (traffic_element.present):
+        return (self.current_time + self.clock_step)
+    return (None)
 
-# Main loop
-while ((current_time < end_time) and (error_counter == 0)):
-
-  if (verbosity_level >= 5):
-    print (format_time(current_time) + " top of simulation loop.")
-
-  # Run the state machines.
-  for signal_face in signal_faces_list:
-    # If we are starting up enter state Red substate Walting for Clearance.
-    if ("state" not in signal_face):
-      enter_state (signal_face, "Red", "Waiting for Clearance", None)
-    state_name = signal_face["state"]
-    substate_name = signal_face["substate"]
-
-    # Test for exiting the current state.
-    new_state_name = None
-    new_substate_name = None
-    found_exit = None
-    states = finite_state_machine["states"]
-    state = states[state_name]
-    substate = None
-    for the_substate in state:
-      if (the_substate["name"] == substate_name):
-        substate = the_substate
+  # Sample the lanes and sensors at each sample time before the given
+  # time, or up to and including it.  Nothing changes between passes of
+  # the main loop, so each sample until the next pass is the same.
+  def take_samples (self, until, inclusive=False):
+    if (self.time_series_file_name == None):
+      return
+    if (self.time_series == None):
+      self.start_time_series ()
+    if ((self.next_sample_time > until) or
+        ((self.next_sample_time == until) and (not inclusive))):
+      return
+    values = self.sample_values ()
+    while ((self.next_sample_time < until) or
+           ((self.next_sample_time == until) and inclusive)):
+      self.time_series.add (float(self.next_sample_time), values)
+      self.next_sample_time = self.next_sample_time + self.sample_interval
+    return
+
+  # The columns of the time series are the number of traffic elements
+  # stopped and moving in each lane, and whether each sensor which
+  # traffic can trigger is occupied.
+  def start_time_series (self):
+    self.sample_lanes = sorted(set(
+      lane_name for segments in self.travel_path_segments.values()
+      for lane_name in segments.lane_names))
+    self.sample_sensors = list()
+    for signal_face in self.signal_faces_list:
+      for sensor_name in signal_face["sensors"]:
+        sensor = signal_face["sensors"][sensor_name]
+        if ("shape" in sensor):
+          self.sample_sensors.append (
+            (signal_face["name"] + "/" + sensor_name, sensor))
+    column_names = list()
+    for lane_name in self.sample_lanes:
+      column_names.append (lane_name + " stopped")
+      column_names.append (lane_name + " moving")
+    for sensor_full_name, sensor in self.sample_sensors:
+      column_names.append (sensor_full_name + " occupied")
+    self.time_series = TimeSeries (column_names, self.sample_interval)
+    first_sample = math.ceil (fractions.Fraction (self.current_time) /
+                              self.sample_interval)
+    self.next_sample_time = first_sample * self.sample_interval
+    return
+
+  # Take one sample of the lanes and sensors.
+  def sample_values (self):
+    values = np.zeros (len(self.time_series.column_names))
+    lane_columns = {lane_name: 2 * index
+                    for index, lane_name in enumerate(self.sample_lanes)}
+    for elements in self.travel_path_elements.values():
+      for traffic_element in elements.values():
+        column = lane_columns.get (traffic_element.current_lane)
+        if (column != None):
+          if (traffic_element.speed == 0):
+            values[column] = values[column] + 1
+          else:
+            values[column + 1] = values[column + 1] + 1
+    column = 2 * len(self.sample_lanes)
+    for sensor_full_name, sensor in self.sample_sensors:
+      if (sensor["value"]):
+        values[column] = 1
+      column = column + 1
+    return (values)
+
+  # Run one pass of the main loop: the state machines, the system
+  # programs, the script, the sensors, the traffic elements and the
+  # timers.  If nothing happened, advance the clock.  Return False
+  # if there is nothing left to do.
+  def step (self):
+
+    if (self.verbosity_level >= 5):
+      print (format_time(self.current_time) + " top of simulation loop.")
+
+    # Run the state machines.
+    for signal_face in self.signal_faces_list:
+      # If we are starting up enter state Red substate Walting for Clearance.
+      if ("state" not in signal_face):
+        self.enter_state (signal_face, "Red", "Waiting for Clearance", None)
+      state_name = signal_face["state"]
+      substate_name = signal_face["substate"]
+
+      # Test for exiting the current state.
+      new_state_name = None
+      new_substate_name = None
+      found_exit = None
+      states = self.finite_state_machine["states"]
+      state = states[state_name]
+      substate = None
+      for the_substate in state:
+        if (the_substate["name"] == substate_name):
+          substate = the_substate
+          break
+      if (substate == None):
+        print ("Invalid substate: " + state_name + "/" + substate_name + ".")
+        self.error_counter = self.error_counter + 1
         break
-    if (substate == None):
-      print ("Invalid substate: " + state_name + "/" + substate_name + ".")
-      error_counter = error_counter + 1
-      break
-    
-    if (verbosity_level >= 5):
-      print (format_time(current_time) + " Signal face " +
-             signal_face["name"] + " state " + signal_face["state"] +
-             " substate " + substate["name"] + " evaluating exits.")
-    for the_exit in substate["exits"]:
-      conditionals = the_exit [0]
-      conditions_all_true = True
-      for conditional in conditionals:
-        match conditional[0]:
-          case "toggle is true":
-            toggle_name = conditional[1]
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " Testing toggle " +
-                     signal_face["name"] + "/" + toggle_name + " for True.")
-            if (not toggle_value(signal_face, toggle_name)):
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + toggle_name +
-                       " is false.")
-              conditions_all_true = False
-            else:
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + toggle_name +
-                       " is true.")
-                
-          case "toggle is false":
-            toggle_name = conditional[1]
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " Testing toggle " +
-                     signal_face["name"] + "/" + toggle_name + " for False.")
-            if (toggle_value(signal_face, toggle_name)):
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + toggle_name +
-                       " is true.")
-              conditions_all_true = False
-            else:
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + toggle_name +
-                       " is false.")
-                
-          case "timer is completed":
-            timer_name = conditional[1]
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " Testing timer " +
-                     signal_face["name"] + "/" + timer_name +
-                     " for being complete.")
-            if (timer_state (signal_face, timer_name) != "completed"):
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + timer_name +
-                       " is not complete.")
-              conditions_all_true = False
-            else:
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + timer_name +
-                       " has completed.")
-                
-          case "timer not complete":
-            timer_name = conditional[1]
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " Testing timer " +
-                     signal_face["name"] + "/" + timer_name +
-                     " for being not complete.")
-            if (timer_state (signal_face, timer_name) == "completed"):
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + timer_name +
-                       " has completed.")
-              conditions_all_true = False
+
+      if (self.verbosity_level >= 5):
+        print (format_time(self.current_time) + " Signal face " +
+               signal_face["name"] + " state " + signal_face["state"] +
+               " substate " + substate["name"] + " evaluating exits.")
+      for the_exit in substate["exits"]:
+        conditionals = the_exit [0]
+        conditions_all_true = True
+        for conditional in conditionals:
+          match conditional[0]:
+            case "toggle is true":
+              toggle_name = conditional[1]
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " Testing toggle " +
+                       signal_face["name"] + "/" + toggle_name + " for True.")
+              if (not self.toggle_value(signal_face, toggle_name)):
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + toggle_name +
+                         " is false.")
+                conditions_all_true = False
+              else:
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + toggle_name +
+                         " is true.")
+
+            case "toggle is false":
+              toggle_name = conditional[1]
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " Testing toggle " +
+                       signal_face["name"] + "/" + toggle_name + " for False.")
+              if (self.toggle_value(signal_face, toggle_name)):
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + toggle_name +
+                         " is true.")
+                conditions_all_true = False
+              else:
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + toggle_name +
+                         " is false.")
+
+            case "timer is completed":
+              timer_name = conditional[1]
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " Testing timer " +
+                       signal_face["name"] + "/" + timer_name +
+                       " for being complete.")
+              if (timer_state (signal_face, timer_name) != "completed"):
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + timer_name +
+                         " is not complete.")
+                conditions_all_true = False
+              else:
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + timer_name +
+                         " has completed.")
+
+            case "timer not complete":
+              timer_name = conditional[1]
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " Testing timer " +
+                       signal_face["name"] + "/" + timer_name +
+                       " for being not complete.")
+              if (timer_state (signal_face, timer_name) == "completed"):
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + timer_name +
+                         " has completed.")
+                conditions_all_true = False
+              else:
+                if (self.verbosity_level >= 5):
+                  print (format_time(self.current_time) + "  " + timer_name +
+                         " has not completed.")
+
+            case _:
+              print ("Unknown condition test: " + conditional[0] + ".")
+              self.error_counter = self.error_counter + 1
+
+        if (conditions_all_true):
+          found_exit = the_exit
+          break
+
+      if (found_exit != None):
+        new_state_name = found_exit[1]
+        new_substate_name = found_exit[2]
+        self.enter_state (signal_face, new_state_name, new_substate_name,
+                          found_exit)
+
+    # Run the system programs.
+    self.green_request_granted()
+    self.clearance_requested()
+    self.partial_clearance_requested()
+    self.conflicting_paths_are_clear()
+    self.partial_conflicting_paths_are_clear()
+    self.safety_check()
+
+    # Run any ripe actionss in the script.
+    ripe_count = 0
+    for the_action in self.script_actions:
+      the_time = the_action[0]
+      the_operator = the_action[1]
+      signal_face_name = the_action[2]
+      the_operand = the_action[3]
+      permissive_delay = the_action[4]
+      if (the_time > self.current_time):
+        break
+      self.perform_script_action (the_operator, signal_face_name,
+                                  the_operand,
+                                  permissive_delay)
+      ripe_count = ripe_count + 1
+      self.no_activity = False
+
+    del self.script_actions[:ripe_count]
+
+    # Then any ripe generated arrivals.
+    while ((len(self.arrival_streams) > 0) and
+           (self.arrival_streams[0][0] <= self.current_time)):
+      the_time, stream_number, stream = heapq.heappop (self.arrival_streams)
+      self.perform_script_action (stream.element_type,
+                                  stream.signal_face_name,
+                                  stream.travel_path_name,
+                                  stream.permissive_delay)
+      stream.advance ()
+      if (stream.next_time != None):
+        heapq.heappush (self.arrival_streams,
+                        (stream.next_time, stream_number, stream))
+      self.no_activity = False
+
+    # See if any vehicles or pedestrians are activating any sensors
+    self.check_sensors()
+
+    # If there are active sensors, set their corresponding toggles.
+    for signal_face in self.signal_faces_list:
+      sensors = signal_face ["sensors"]
+      for sensor_name in sensors:
+        sensor = sensors[sensor_name]
+        if (sensor ["value"]):
+          if (self.verbosity_level >= 5):
+            print (format_time(self.current_time) + " sensor " +
+                   signal_face ["name"] + "/" + sensor ["name"] +
+                   " remains True.")
+
+          toggle_names = sensor["toggles"]
+          for toggle_name in toggle_names:
+            exploded_toggle_name = toggle_name.partition("/")
+            if (exploded_toggle_name[1] == ""):
+              toggle_signal_face_name = signal_face["name"]
+              root_toggle_name = toggle_name
             else:
-              if (verbosity_level >= 5):
-                print (format_time(current_time) + "  " + timer_name +
-                       " has not completed.")
+              toggle_signal_face_name = exploded_toggle_name[0]
+              root_toggle_name = exploded_toggle_name[2]
+
+            toggle_signal_face = (
+              self.signal_faces_dict[toggle_signal_face_name])
+            if (not self.toggle_value (toggle_signal_face, root_toggle_name)):
+              if (self.verbosity_level >= 5):
+                print (format_time(self.current_time) + " Sensor " +
+                       signal_face ["name"] + "/" + sensor_name + " is True.")
+              if (self.table_wanted (5)):
+                self.table_row (5, signal_face["name"],
+                                "  Sensor " + sensor_name + " is True. ")
+              self.set_toggle_value (toggle_signal_face, root_toggle_name,
+                                     True,
+                                     "sensor " + signal_face["name"] + "/" +
+                                     sensor_name)
+              self.no_activity = False          
+
+    # Update the positions of the cars, trucks and pedestrians.
+    # A traffic element which leaves is removed from the traffic elements
+    # dictionary, so go through a copy of it.
+    precomputed_moves = self.compute_free_moves()
+    for traffic_element in list(self.traffic_elements.values()):
+      if (traffic_element.present):
+        self.move_traffic_element(traffic_element,
+                                  precomputed_moves.get(traffic_element.name))
+
+    # Update the timers.
+    self.update_timers()
+
+    # We only update the clock if there is no activity.
+    if (self.no_activity):
+      next_timer_completion_time = self.find_next_timer_completion_time()
+      next_script_action_time = self.find_next_script_action_time()
+      next_traffic_element_time = self.find_next_traffic_element_time()
+
+      # If there are no timers running, no script actions waiting to run
+      # and no traffic elements present then we are done.
+      if ((next_timer_completion_time == None) and
+          (next_script_action_time == None) and
+          (next_traffic_element_time == None)):
+        return (False)
+
+      # Otherwise we advance the clock to the next significant event.
+      next_clock_time = self.end_time
+      if ((next_timer_completion_time != None) and
+          (next_timer_completion_time < next_clock_time)):
+        next_clock_time = next_timer_completion_time
+      if ((next_script_action_time != None) and
+          (next_script_action_time < next_clock_time)):
+        next_clock_time = next_script_action_time
+      if ((next_traffic_element_time != None) and
+          (next_traffic_element_time < next_clock_time)):
+        next_clock_time = next_traffic_element_time
+
+      if (self.do_trace):
+        self.trace ("advance clock", None,
+                    "Advance clock from " + format_time(self.current_time) +
+                    " to " + format_time(next_clock_time) + ".\n",
+                    fields={"next time": next_clock_time})
+
+      self.take_samples (next_clock_time)
+      self.current_time = next_clock_time
+      self.last_event_time = self.current_time
+    else:
+      self.no_activity = True
+    return (True)
 
-          case _:
-            print ("Unknown condition test: " + conditional[0] + ".")
-            error_counter = error_counter + 1
-            
-      if (conditions_all_true):
-        found_exit = the_exit
+  # Run the simulation until the given time, unless there is an error
+  # or nothing left to do.  Since the clock never advances past the end
+  # time, running to one time and then to a later one can differ from
+  # running to the later time directly.  To stop part way without that
+  # difference give a pause time: the simulation stops when its clock
+  # reaches the pause time, and a later call with the same end time
+  # continues it as though it had not stopped.  Return True if the
+  # simulation stopped at the pause time.
+  def run_until (self, end_time, pause_time=None):
+    # The clock advances to the end time when nothing happens before
+    # it, so keep the end time as a Fraction, like the clock.
+    self.end_time = fractions.Fraction (end_time)
+    while ((self.current_time < self.end_time) and
+           (self.error_counter == 0)):
+      if (not self.step ()):
         break
-      
-    if (found_exit != None):
-      new_state_name = found_exit[1]
-      new_substate_name = found_exit[2]
-      enter_state (signal_face, new_state_name, new_substate_name, found_exit)
-      
-  
-  # Run the system programs.
-  green_request_granted()
-  clearance_requested()
-  partial_clearance_requested()
-  conflicting_paths_are_clear()
-  partial_conflicting_paths_are_clear()
-  safety_check()
-    
-  # Run any ripe actionss in the script.
-  to_remove = set()
-  for the_action in script_set:
-    the_time = the_action[0]
-    the_operator = the_action[1]
-    signal_face_name = the_action[2]
-    the_operand = the_action[3]
-    permissive_delay = the_action[4]
-    if (the_time <= current_time):
-      perform_script_action (the_operator, signal_face_name, the_operand,
-                             permissive_delay)
-      to_remove.add(the_action)
-      no_activity = False
-      
-  for the_action in to_remove:
-    script_set.remove(the_action)
-
-  # See if any vehicles or pedestrians are activating any sensors
-  check_sensors()
-    
-  # If there are active sensors, set their corresponding toggles.
-  for signal_face in signal_faces_list:
-    sensors = signal_face ["sensors"]
-    for sensor_name in sensors:
-      sensor = sensors[sensor_name]
-      if (sensor ["value"]):
-        if (verbosity_level >= 5):
-          print (format_time(current_time) + " sensor " +
-                 signal_face ["name"] + "/" + sensor ["name"] +
-                 " remains True.")
-
-        toggle_names = sensor["toggles"]
-        for toggle_name in toggle_names:
-          exploded_toggle_name = toggle_name.partition("/")
-          if (exploded_toggle_name[1] == ""):
-            toggle_signal_face_name = signal_face["name"]
-            root_toggle_name = toggle_name
-          else:
-            toggle_signal_face_name = exploded_toggle_name[0]
-            root_toggle_name = exploded_toggle_name[2]
-
-          toggle_signal_face = signal_faces_dict[toggle_signal_face_name]
-          if (not toggle_value (toggle_signal_face, root_toggle_name)):
-            if (verbosity_level >= 5):
-              print (format_time(current_time) + " Sensor " +
-                     signal_face ["name"] + "/" + sensor_name + " is True.")
-            if (table_OK (5)):
-              table_file.write ("\\hline " + format_time_N(current_time) +
-                                " & " + signal_face["name"] +
-                                " &  Sensor " + sensor_name +
-                                " is True. \\\\\n")
-              if (flush_table_file):
-                table_file.flush()
-            set_toggle_value (toggle_signal_face, root_toggle_name, True,
-                              "sensor " + signal_face["name"] + "/" +
-                              sensor_name)
-            no_activity = False          
-        
-  # Update the positions of the cars, trucks and pedestrians.
-  for traffic_element_name in traffic_elements:
-    traffic_element = traffic_elements[traffic_element_name]
-    if (traffic_element["present"]):
-      move_traffic_element(traffic_element)
-        
-  # Update the timers.
-  update_timers()
-  
-  # We only update the clock if there is no activity.
-  if (no_activity):
-    next_timer_completion_time = find_next_timer_completion_time()
-    next_script_action_time = find_next_script_action_time()
-    next_traffic_element_time = find_next_traffic_element_time()
-
-    # If there are no timers running, no script actions waiting to run
-    # and no traffic elements present then we are done.
-    if ((next_timer_completion_time == None) and
-        (next_script_action_time == None) and
-        (next_traffic_element_time == None)):
+      if (self.error_counter > 0):
+        self.dump_flight_recorder ("an error")
+      if (self.flush_table_file and self.do_table_output):
+        self.table_file.flush()
+      if ((self.next_checkpoint_time != None) and
+          (self.current_time >= self.next_checkpoint_time)):
+        self.save_checkpoint (self.checkpoint_file_name)
+        self.schedule_checkpoints (self.checkpoint_file_name,
+                                   self.checkpoint_interval)
+      if ((pause_time != None) and (self.current_time >= pause_time) and
+          (self.current_time < self.end_time) and
+          (self.error_counter == 0)):
+        return (True)
+    return (False)
+
+  # Write a checkpoint each time another checkpoint_interval seconds
+  # of simulated time have passed.  An interval of None stops writing
+  # checkpoints.
+  def schedule_checkpoints (self, checkpoint_file_name, checkpoint_interval):
+    self.checkpoint_file_name = checkpoint_file_name
+    self.checkpoint_interval = checkpoint_interval
+    if (checkpoint_interval == None):
+      self.next_checkpoint_time = None
+    else:
+      self.next_checkpoint_time = (
+        (math.floor (fractions.Fraction (self.current_time) /
+                     checkpoint_interval) + 1) * checkpoint_interval)
+    return
+
+  # Save the state of the simulation in a checkpoint file.  The file is
+  # written under a temporary name and then renamed, so an interruption
+  # while writing it leaves the previous checkpoint intact.
+  def save_checkpoint (self, checkpoint_file_name):
+    checkpoint_file_name = pathlib.Path(checkpoint_file_name)
+    partial_file_name = checkpoint_file_name.with_name (
+      checkpoint_file_name.name + ".partial")
+    state = pickle.dumps (self, protocol=pickle.HIGHEST_PROTOCOL)
+    with open (partial_file_name, "wb") as checkpoint_file:
+      checkpoint_file.write (checkpoint_header)
+      checkpoint_file.write (zlib.compress (state))
+    os.replace (partial_file_name, checkpoint_file_name)
+    return
+
+  # Flush the open output files and return how much has been written
+  # to each, indexed by attribute.
+  def flush_output_files (self):
+    output_file_positions = dict()
+    for attribute in output_file_attributes:
+      if (hasattr (self, attribute)):
+        the_file = getattr (self, attribute)
+        the_file.flush()
+        output_file_positions[attribute] = the_file.tell()
+    return (output_file_positions)
+
+  # Open files cannot be pickled, so a checkpoint records instead how
+  # much had been written to each output file.
+  def __getstate__ (self):
+    output_file_positions = self.flush_output_files ()
+    state = dict(self.__dict__)
+    state["output_file_positions"] = output_file_positions
+    for attribute in output_file_positions:
+      if (not isinstance (state[attribute], output_writer_types)):
+        del state[attribute]
+    del state["bus"]
+    return (state)
+
+  # The subscribers are methods of the simulation, so subscribe them
+  # again rather than pickle them.
+  def __setstate__ (self, state):
+    self.__dict__.update (state)
+    self.subscribe_outputs ()
+    return
+
+  # Continue the simulation in a child process as well as in this one.
+  # The child shares the memory of this process until either changes
+  # it, so the fork is cheap however large the simulation.  The child
+  # writes to the output files named in output_file_names, indexed by
+  # attribute, which start as copies of what has been written so far.
+  # Like os.fork, return the child's process ID in this process and 0
+  # in the child.
+  def fork (self, output_file_names):
+    output_file_positions = self.flush_output_files ()
+    for attribute in output_file_positions:
+      if (attribute not in output_file_names):
+        raise ValueError ("a forked simulation needs its own " +
+                          attribute.replace("_", " "))
+    sys.stdout.flush()
+    process_id = os.fork()
+    if (process_id == 0):
+      for attribute in output_file_positions:
+        copy_output_file (attribute, getattr (self, attribute + "_name"),
+                          output_file_names[attribute],
+                          output_file_positions[attribute])
+        getattr (self, attribute).close()
+      self.output_file_positions = output_file_positions
+      self.reopen_output_files (output_file_names)
+    return (process_id)
+
+  # When resuming, anything written to the output files after the
+  # checkpoint is discarded, and writing continues from there.  The
+  # output can instead go to other files, given by attribute in
+  # output_file_names, provided they hold what had been written when
+  # the checkpoint was taken.
+  def reopen_output_files (self, output_file_names=None):
+    for attribute in self.output_file_positions:
+      if ((output_file_names != None) and (attribute in output_file_names)):
+        setattr (self, attribute + "_name", output_file_names[attribute])
+      if (isinstance (getattr (self, attribute, None),
+                      output_writer_types)):
+        getattr (self, attribute).reopen (
+          getattr (self, attribute + "_name"),
+          self.output_file_positions[attribute])
+        continue
+      the_file = open (getattr (self, attribute + "_name"), "r+")
+      the_file.seek (self.output_file_positions[attribute])
+      the_file.truncate ()
+      setattr (self, attribute, the_file)
+    del self.output_file_positions
+    return
+
+  # Write the end of the output files and close them.
+  def finish (self):
+    if (self.do_trace):
+      self.trace_signal_faces ("ending signal face", "Ending Signal Faces:\n")
+
+    # If requested, also print the maximum wait times.
+    if (self.print_statistics and (self.verbosity_level >= 1)):
+      for signal_face in self.signal_faces_list:
+        if ("max wait time" in signal_face):
+          print (format_time(self.current_time) + " signal face " +
+                 signal_face["name"] + " maximum wait " +
+                 format_time(signal_face["max wait time"]) + " at " +
+                 format_time(signal_face["max wait start"]) + ".")
+      for signal_face_name in sorted(self.wait_sketches):
+        summary = self.wait_sketches[signal_face_name].summary ()
+        print (format_time(self.current_time) + " signal face " +
+               signal_face_name + " " + str(summary["count"]) +
+               " waits: " + format_quantiles (summary) + ".")
+      for travel_path_name in sorted(self.travel_path_sketches):
+        sketches = self.travel_path_sketches[travel_path_name]
+        for measurement in travel_path_measurements:
+          summary = sketches[measurement].summary ()
+          print (format_time(self.current_time) + " travel path " +
+                 travel_path_name + " " + str(summary["count"]) +
+                 " exits " + measurement + ": " +
+                 format_quantiles (summary) + ".")
+
+    if (self.do_table_output and self.chunk_table):
+      self.table_file.finish ()
+    elif (self.do_table_output):
+      self.table_file.write (render_table.table_footer ())
+      self.table_file.close()
+    if (self.do_table_log):
+      self.table_log_file.close()
+    if (self.do_events_output):
+      self.events_file.close()
+    if (self.time_series_file_name != None):
+      self.take_samples (self.current_time, inclusive=True)
+      self.time_series.save (self.time_series_file_name)
+    if (self.do_trips_output):
+      for traffic_element in self.traffic_elements.values():
+        if (traffic_element.present):
+          self.write_trip (traffic_element, "present")
+      self.trips_file.close()
+    if (self.do_database_output):
+      self.database_file.close()
+
+    if (self.do_trace):
+      self.trace_file.close()
+    return
+
+  # Summarize the simulation in a form that can be written as JSON.
+  def statistics (self):
+    max_wait_times = dict()
+    mean_wait_times = dict()
+    for signal_face in self.signal_faces_list:
+      if ("max wait time" in signal_face):
+        max_wait_times[signal_face["name"]] = (
+          format_time(signal_face["max wait time"]))
+        mean_wait_times[signal_face["name"]] = (
+          format_time(signal_face["total wait time"] /
+                      signal_face["wait count"]))
+    mean_delay = 0.0
+    if (self.exit_count > 0):
+      mean_delay = self.total_delay / self.exit_count
+    return ({"simulated_time": format_time(self.current_time),
+             "last_event_time": format_time(self.last_event_time),
+             "error_count": self.error_counter,
+             "traffic_elements": self.traffic_element_count,
+             "max_wait_times": max_wait_times,
+             "mean_wait_times": mean_wait_times,
+             "exit_count": self.exit_count,
+             "mean_delay": format_time(mean_delay),
+             "distributions": self.distributions ()})
+
+  # Summarize the quantile sketches.
+  def distributions (self):
+    signal_faces = dict()
+    for signal_face_name in sorted(self.wait_sketches):
+      signal_faces[signal_face_name] = {
+        "wait": self.wait_sketches[signal_face_name].summary ()}
+    travel_paths = dict()
+    for travel_path_name in sorted(self.travel_path_sketches):
+      sketches = self.travel_path_sketches[travel_path_name]
+      travel_paths[travel_path_name] = {
+        measurement: sketches[measurement].summary ()
+        for measurement in travel_path_measurements}
+    return ({"signal faces": signal_faces, "travel paths": travel_paths})
+
+# A checkpoint file starts with this line, which names its format and
+# the version of that format.  The rest is the pickled simulation,
+# compressed.
+checkpoint_header = b"simulate_traffic checkpoint 10\n"
+
+# Copy what had been written to an output file when it was at
+# position.  An event database is copied whole, since its position is
+# a count of events; reopening it removes those recorded later.
+def copy_output_file (attribute, file_name, copy_file_name, position):
+  if (attribute == "database_file"):
+    shutil.copyfile (file_name, copy_file_name)
+    return
+  with open (file_name, "rb") as output_file:
+    pathlib.Path(copy_file_name).write_bytes (output_file.read (position))
+  return
+
+# Read a checkpoint file and return the simulation saved in it, ready
+# to continue.
+def load_checkpoint (checkpoint_file_name, output_file_names=None):
+  with open (checkpoint_file_name, "rb") as checkpoint_file:
+    header = checkpoint_file.readline()
+    if (header != checkpoint_header):
+      raise ValueError ("not a checkpoint, or from an incompatible " +
+                        "version of the simulator")
+    state = zlib.decompress (checkpoint_file.read())
+  simulation = pickle.loads (state)
+  simulation.reopen_output_files (output_file_names)
+  return (simulation)
+
+# Run what-if branches of a simulation.  Each branch is a name and a
+# script file; it continues the simulation from its present state in a
+# child process, with the rest of the script replaced by the branch's
+# script, until end_time.  Its output files are named after the
+# simulation's, with the branch name added.  At most jobs branches run
+# at once.  Return the statistics of each branch, indexed by name, with
+# the console output of the branch under "console".
+def run_branches (simulation, branches, end_time, jobs):
+  branch_statistics = dict()
+  running = list()
+  for branch_name, script_file_name in branches:
+    if (len(running) >= jobs):
+      collect_branch (running.pop (0), branch_statistics)
+    output_file_names = dict()
+    for attribute in output_file_attributes:
+      file_name = getattr (simulation, attribute + "_name")
+      if (file_name != None):
+        file_name = pathlib.Path(file_name)
+        output_file_names[attribute] = file_name.with_stem (
+          file_name.stem + "_" + branch_name)
+    read_end, write_end = os.pipe()
+    process_id = simulation.fork (output_file_names)
+    if (process_id == 0):
+      os.close (read_end)
+      exit_status = 0
+      try:
+        with contextlib.redirect_stdout (io.StringIO()) as console_text:
+          simulation.schedule_checkpoints (None, None)
+          if (simulation.time_series_file_name != None):
+            file_name = pathlib.Path(simulation.time_series_file_name)
+            simulation.time_series_file_name = file_name.with_stem (
+              file_name.stem + "_" + branch_name)
+          file_name = pathlib.Path(simulation.flight_recorder_file_name)
+          simulation.flight_recorder_file_name = file_name.with_stem (
+            file_name.stem + "_" + branch_name)
+          simulation.clear_script ()
+          simulation.load_script (script_file_name)
+          simulation.run_until (end_time)
+          simulation.finish ()
+          if (simulation.error_counter > 0):
+            print ("Encountered " + str(simulation.error_counter) +
+                   " errors.")
+        statistics = simulation.statistics ()
+        statistics["console"] = console_text.getvalue()
+      except Exception:
+        statistics = {"error": traceback.format_exc()}
+        exit_status = 1
+      with os.fdopen (write_end, "w") as result_file:
+        json.dump (statistics, result_file)
+      os._exit (exit_status)
+    os.close (write_end)
+    running.append ((branch_name, process_id, read_end))
+  while (len(running) > 0):
+    collect_branch (running.pop (0), branch_statistics)
+  return (branch_statistics)
+
+# Wait for a branch to finish and record its statistics.
+def collect_branch (branch, branch_statistics):
+  branch_name, process_id, read_end = branch
+  with os.fdopen (read_end, "r") as result_file:
+    result_text = result_file.read()
+  os.waitpid (process_id, 0)
+  if (result_text == ""):
+    branch_statistics[branch_name] = {"error": "the branch did not finish"}
+  else:
+    branch_statistics[branch_name] = json.loads (result_text)
+  return
+
+# The results of a run depend only on the simulator, the contents of its
+# input files and its options, so they are kept in a cache indexed by a
+# hash of those.  A later run with the same hash copies the output files
+# out of the cache instead of simulating.  The cache holds at most
+# cache_size megabytes; when it grows past that the entries used least
+# recently are removed.  A run with a trace file is never cached, nor is
+# a run which encounters errors.
+
+# The options which name input files; their contents go into the hash.
+cache_input_options = ("intersection_file", "script_input", "arrivals_file")
+
+# The options which name output files, and the name of each output file
+# in a cache entry.  Only whether the output was requested goes into
+# the hash.
+cache_output_options = {"events_file": "events.csv",
+                        "trips_file": "trips.csv",
+                        "database_file": "events.sqlite",
+                        "time_series_file": "time_series.npz",
+                        "table_file": "table.tex",
+                        "table_log_file": "table_log.jsonl",
+                        "last_event_time": "last_event_time.txt"}
+
+# The options which control the cache itself, or name files written
+# from the statistics, which the cache holds anyway.
+cache_control_options = ("no_cache", "cache_directory", "cache_size",
+                         "incremental_every", "statistics_file",
+                         "flight_recorder_size", "flight_recorder_file")
+
+# The default location of the cache.
+def default_cache_directory ():
+  cache_home = os.environ.get ("XDG_CACHE_HOME")
+  if ((cache_home == None) or (cache_home == "")):
+    cache_home = pathlib.Path.home() / ".cache"
+  return (pathlib.Path(cache_home) / "simulate_traffic")
+
+# The source files of the simulator and of the local modules it
+# imports, all of which decide what it writes.
+simulator_source_files = (__file__, binary_trace.__file__,
+                          columnar_events.__file__, event_bus.__file__,
+                          event_database.__file__, render_table.__file__)
+
+# Add the source of the simulator to a hash, so that a result computed
+# by an older version of it is not used.
+def hash_simulator_source (the_hash):
+  for source_file_name in simulator_source_files:
+    the_hash.update (pathlib.Path(source_file_name).read_bytes())
+  return
+
+# Compute the hash of a run from its parsed command line, leaving out
+# the options in excluded_options.
+def cache_key (arguments, excluded_options=()):
+  the_hash = hashlib.sha256 ()
+  hash_simulator_source (the_hash)
+  for option in sorted(arguments):
+    value = arguments[option]
+    if ((option in cache_control_options) or
+        (option in excluded_options)):
+      continue
+    if (option in cache_output_options):
+      value = (value != None)
+    if ((option in cache_input_options) and (value != None)):
+      value = hashlib.sha256 (pathlib.Path(value).read_bytes()).hexdigest()
+    the_hash.update ((option + "=" + repr(value) + "\n").encode())
+  return (the_hash.hexdigest())
+
+# Copy the results of a cached run to the requested output files and
+# the console.  Return the statistics of the run, or None if it is not
+# in the cache.
+def fetch_cached_results (cache_directory, key, arguments):
+  entry = cache_directory / key
+  try:
+    with open (entry / "statistics.json", "r") as statistics_file:
+      statistics = json.load (statistics_file)
+    for option in cache_output_options:
+      if (arguments[option] != None):
+        shutil.copyfile (entry / cache_output_options[option],
+                         arguments[option])
+    console_text = (entry / "console.txt").read_text()
+    os.utime (entry)
+  except OSError:
+    return (None)
+  sys.stdout.write (console_text)
+  return (statistics)
+
+# Write the statistics of a run as JSON, if a file was requested.
+def write_statistics_file (statistics_file_name, statistics):
+  if (statistics_file_name == None):
+    return
+  with open (statistics_file_name, "w") as statistics_file:
+    json.dump (statistics, statistics_file, indent=2)
+    statistics_file.write ("\n")
+  return
+
+# Save the results of a run in the cache, then trim the cache to size.
+# The entry is built under a temporary name and renamed into place, so
+# runs sharing the cache never see a partial entry.  If entry is given,
+# it is a partial entry already holding some of the results.
+def store_cached_results (cache_directory, key, arguments, console_text,
+                          statistics, cache_size, entry=None):
+  try:
+    cache_directory.mkdir (parents=True, exist_ok=True)
+    if (entry == None):
+      entry = pathlib.Path(tempfile.mkdtemp (dir=cache_directory,
+                                             prefix="partial-"))
+    for option in cache_output_options:
+      if (arguments[option] != None):
+        shutil.copyfile (arguments[option],
+                         entry / cache_output_options[option])
+    (entry / "console.txt").write_text (console_text)
+    with open (entry / "statistics.json", "w") as statistics_file:
+      json.dump (statistics, statistics_file, indent=2)
+    try:
+      os.rename (entry, cache_directory / key)
+    except OSError:
+      shutil.rmtree (entry, ignore_errors=True)
+    trim_cache (cache_directory, cache_size)
+  except OSError as the_error:
+    print ("Unable to save the results in the cache: " + str(the_error),
+           file=sys.stderr)
+  return
+
+# Remove the least recently used entries until the cache is no larger
+# than cache_size megabytes, and any abandoned partial entries.
+def trim_cache (cache_directory, cache_size):
+  entries = list()
+  total_size = 0
+  for entry in cache_directory.iterdir():
+    if (entry.name.startswith("partial-")):
+      # A partial entry more than a day old was left by a run which
+      # did not finish.
+      if (time.time() - entry.stat().st_mtime > 24 * 60 * 60):
+        shutil.rmtree (entry, ignore_errors=True)
+      continue
+    entry_size = sum(the_file.stat().st_size
+                     for the_file in entry.iterdir())
+    entries.append ((entry.stat().st_mtime, entry_size, entry))
+    total_size = total_size + entry_size
+  entries.sort (key=lambda the_entry: the_entry[0])
+  for entry_time, entry_size, entry in entries:
+    if (total_size <= cache_size * 1024 * 1024):
       break
+    shutil.rmtree (entry, ignore_errors=True)
+    total_size = total_size - entry_size
+  return
+
+# Every script starts its traffic after the intersection has settled
+# into its idle state, and until the script's first action the
+# simulation does not depend on the script or the duration.  So the
+# state of the simulation when its clock reaches that time, and what it
+# has written so far, are kept in the cache too, indexed by a hash which
+# leaves those out and includes the time.  A run which finds them there
+# replaces the script and continues from the script's first action.
+
+# The options which do not affect the simulation before the script's
+# first action.
+warm_start_excluded_options = ("script_input", "duration",
+                               "last_event_time", "checkpoint_file",
+                               "checkpoint_every", "resume_from")
+
+# The output files kept with a warm start, and their names in the
+# cache entry.
+warm_start_output_files = {"table_file": "table.tex",
+                           "events_file": "events.csv",
+                           "trips_file": "trips.csv",
+                           "database_file": "events.sqlite",
+                           "table_log_file": "table_log.jsonl"}
+
+# Compute the hash of a warm start at warm_start_time.
+def warm_start_key (arguments, warm_start_time):
+  the_arguments = dict(arguments)
+  the_arguments["warm_start_time"] = str(warm_start_time)
+  return (cache_key (the_arguments, warm_start_excluded_options))
+
+# Start a simulation from a cached warm start, writing to the output
+# files named in output_file_names.  Return the simulation, or None if
+# the warm start is not in the cache.
+def fetch_warm_start (cache_directory, key, output_file_names):
+  entry = cache_directory / key
+  try:
+    for attribute in output_file_names:
+      shutil.copyfile (entry / warm_start_output_files[attribute],
+                       output_file_names[attribute])
+    console_text = (entry / "console.txt").read_text()
+    simulation = load_checkpoint (entry / "state.ckpt", output_file_names)
+    os.utime (entry)
+  except (OSError, ValueError, zlib.error, pickle.UnpicklingError):
+    return (None)
+  sys.stdout.write (console_text)
+  return (simulation)
+
+# Save the state of a simulation which has just reached the script's
+# first action, along with what it has written so far.
+def store_warm_start (cache_directory, key, simulation, console_text,
+                      cache_size):
+  try:
+    cache_directory.mkdir (parents=True, exist_ok=True)
+    entry = pathlib.Path(tempfile.mkdtemp (dir=cache_directory,
+                                           prefix="partial-"))
+    simulation.save_checkpoint (entry / "state.ckpt")
+    for attribute in warm_start_output_files:
+      if (hasattr (simulation, attribute)):
+        copy_output_file (attribute,
+                          getattr (simulation, attribute + "_name"),
+                          entry / warm_start_output_files[attribute],
+                          getattr (simulation, attribute).tell())
+    (entry / "console.txt").write_text (console_text)
+    try:
+      os.rename (entry, cache_directory / key)
+    except OSError:
+      shutil.rmtree (entry, ignore_errors=True)
+    trim_cache (cache_directory, cache_size)
+  except OSError as the_error:
+    print ("Unable to save the warm start in the cache: " + str(the_error),
+           file=sys.stderr)
+  return
+
+# A run which is cached also saves checkpoints along the way in its
+# cache entry.  Each notes the time it was taken and a hash of the
+# script actions up to that time, which are all that the simulation
+# had seen.  A later run with the same options, except perhaps the
+# duration, whose script has the same actions up to the time of a
+# checkpoint, starts from the latest such checkpoint.  It copies the
+# output written before the checkpoint from the cache entry and replaces
+# the rest of the script with its own.  Editing a late part of a long
+# script thus reruns only that part.
+
+# Compute the hash of the actions of a script up to and including
+# the_time, in the order the simulation performs them.  Duplicate
+# actions are performed once, so they are hashed once.
+def script_prefix_hash (script_actions, the_time):
+  ordered_actions = list()
+  seen_actions = set()
+  for the_action in script_actions:
+    if ((the_action[0] <= the_time) and
+        (the_action not in seen_actions)):
+      seen_actions.add (the_action)
+      ordered_actions.append (the_action)
+  ordered_actions.sort (key=lambda the_action: the_action[0])
+  return (hashlib.sha256 (repr(ordered_actions).encode()).hexdigest())
+
+# Run a simulation to end_time, saving a checkpoint in entry every
+# interval seconds of simulated time.  Return the list of checkpoints,
+# in the form kept in checkpoints.json.
+def run_with_incremental_checkpoints (simulation, end_time, interval,
+                                      entry, script_actions, console):
+  checkpoints = list()
+  pause_time = ((math.floor (fractions.Fraction (simulation.current_time) /
+                             interval) + 1) * interval)
+  while (simulation.run_until (end_time, pause_time)):
+    checkpoint_time = simulation.current_time
+    checkpoint_file_name = "checkpoint-" + str(len(checkpoints)) + ".ckpt"
+    try:
+      simulation.save_checkpoint (entry / checkpoint_file_name)
+    except OSError:
+      simulation.run_until (end_time)
+      break
+    checkpoints.append (
+      {"time": str(checkpoint_time),
+       "prefix_hash": script_prefix_hash (script_actions, checkpoint_time),
+       "file": checkpoint_file_name,
+       "console_length": console.recording.tell(),
+       "output_positions": simulation.flush_output_files ()})
+    pause_time = ((math.floor (fractions.Fraction (checkpoint_time) /
+                               interval) + 1) * interval)
+  return (checkpoints)
+
+# Find the latest checkpoint in the cache, after start_time, from which
+# a run can start.  Return the cache entry holding it and its
+# description, or None.
+def find_incremental_start (cache_directory, base_key, script_actions,
+                            start_time, end_time):
+  best_start = None
+  if (not cache_directory.is_dir()):
+    return (None)
+  for entry in cache_directory.iterdir():
+    try:
+      with open (entry / "checkpoints.json", "r") as checkpoints_file:
+        checkpoints_info = json.load (checkpoints_file)
+    except (OSError, ValueError):
+      continue
+    if (checkpoints_info["base_key"] != base_key):
+      continue
+    for checkpoint in checkpoints_info["checkpoints"]:
+      checkpoint_time = fractions.Fraction (checkpoint["time"])
+      if ((checkpoint_time <= start_time) or (checkpoint_time >= end_time) or
+          ((best_start != None) and (checkpoint_time <= best_start[0]))):
+        continue
+      if (checkpoint["prefix_hash"] ==
+          script_prefix_hash (script_actions, checkpoint_time)):
+        best_start = (checkpoint_time, entry, checkpoint)
+  if (best_start == None):
+    return (None)
+  return (best_start[1:])
+
+# Start a simulation from a checkpoint found by find_incremental_start,
+# writing to the output files named in output_file_names.  Return the
+# simulation, or None if the checkpoint cannot be used.
+def fetch_incremental_start (incremental_start, output_file_names,
+                             script_file_name):
+  entry, checkpoint = incremental_start
+  try:
+    for attribute in output_file_names:
+      copy_output_file (attribute, entry / warm_start_output_files[attribute],
+                        output_file_names[attribute],
+                        checkpoint["output_positions"][attribute])
+    with open (entry / "console.txt", "r") as console_file:
+      console_text = console_file.read (checkpoint["console_length"])
+    simulation = load_checkpoint (entry / checkpoint["file"],
+                                  output_file_names)
+    os.utime (entry)
+  except (OSError, KeyError, ValueError, zlib.error,
+          pickle.UnpicklingError):
+    return (None)
+  sys.stdout.write (console_text)
+  simulation.clear_script ()
+  simulation.load_script (script_file_name,
+                          fractions.Fraction (checkpoint["time"]))
+  return (simulation)
+
+# Copy everything written to the console so it can be saved with the
+# rest of the results.
+class ConsoleRecorder:
+  def __init__ (self, console):
+    self.console = console
+    self.recording = io.StringIO()
+
+  def write (self, the_text):
+    self.recording.write (the_text)
+    return (self.console.write (the_text))
+
+  def flush (self):
+    self.console.flush()
+    return
+
+# Run the simulator from the command line, or from a list of command
+# line arguments.  Return the statistics of the run.
+def main (argument_list=None):
+  trace_file_name = None
+  trace_format = "text"
+  intersection_file_name = None
+  events_file_name = None
+  trips_file_name = None
+  events_format = "csv"
+  database_file_name = None
+  table_log_file_name = None
+  time_series_file_name = None
+  sample_interval = fractions.Fraction (1)
+  flight_recorder_size = 10000
+  flight_recorder_file_name = "flight_recorder.bin"
+  do_table_output = False
+  table_file_name = None
+  table_level = 0
+  end_time = decimal.Decimal ('0.000')
+  table_start_time  = decimal.Decimal ('-1.000')
+  table_end_time = decimal.Decimal ('Infinity')
+  table_caption = "no caption"
+  table_chunk_rows = None
+  table_chunk_seconds = None
+  do_script_input = False
+  do_last_event_time_output = False
+  clock_step = fractions.Fraction ("0.001")
+  print_statistics = False
+  explain_state_transitions = False
+  flush_table_file = False
+  only_important = False
+  show_substates = False
+  show_green_lists = False
+  verbosity_level = 1
+  cache_size = 1024
+  incremental_interval = fractions.Fraction (60)
+  checkpoint_file_name = None
+  checkpoint_interval = None
+  simulation = None
+  branches = list()
+  jobs = os.cpu_count()
+
+  # Parse the command line.
+  arguments = parser.parse_args (argument_list)
+  arguments = vars(arguments)
+
+  if (arguments ['trace_file'] != None):
+    trace_file_name = arguments ['trace_file']
+    trace_file_name = pathlib.Path(trace_file_name)
+
+  if (arguments ['trace_format'] != None):
+    trace_format = arguments ['trace_format']
+
+  if (arguments ['intersection_file'] != None):
+    intersection_file_name = arguments ['intersection_file']
+    intersection_file_name = pathlib.Path(intersection_file_name)
+
+  if (arguments ['events_file'] != None):
+    events_file_name = arguments ['events_file']
+    events_file_name = pathlib.Path(events_file_name)
+
+  if (arguments ['events_format'] != None):
+    events_format = arguments ['events_format']
+
+  if (arguments ['trips_file'] != None):
+    trips_file_name = pathlib.Path(arguments ['trips_file'])
+
+  if (arguments ['database_file'] != None):
+    database_file_name = pathlib.Path(arguments ['database_file'])
+
+  if (arguments ['time_series_file'] != None):
+    time_series_file_name = pathlib.Path(arguments ['time_series_file'])
+  if (arguments ['sample_interval'] != None):
+    sample_interval = fractions.Fraction (arguments ['sample_interval'])
+    if (sample_interval <= 0):
+      parser.error ("--sample-interval must be positive")
+  if (arguments ['flight_recorder_size'] != None):
+    flight_recorder_size = arguments ['flight_recorder_size']
+    if (flight_recorder_size < 0):
+      parser.error ("--flight-recorder-size must not be negative")
+  if (arguments ['flight_recorder_file'] != None):
+    flight_recorder_file_name = pathlib.Path(
+      arguments ['flight_recorder_file'])
+
+  if (arguments ['table_file'] != None):
+    do_table_output = True
+    table_file_name = arguments ['table_file']
+    table_file_name = pathlib.Path(table_file_name)
+
+  if (arguments ['table_log_file'] != None):
+    table_log_file_name = pathlib.Path(arguments ['table_log_file'])
+
+  if ((arguments ['table_level'] != None) and do_table_output):
+    table_level = arguments ['table_level']
+
+  if (arguments ['duration'] != None):
+    end_time = arguments ['duration']
+
+  if (arguments ['table_start'] != None):
+    table_start_time = arguments ['table_start']
+
+  if (arguments ['table_end'] != None):
+    table_end_time = arguments ['table_end']
+
+  if (arguments ['table_caption'] != None):
+    table_caption = arguments ['table_caption']
+
+  if (arguments ['table_chunk_rows'] != None):
+    table_chunk_rows = arguments ['table_chunk_rows']
+    if (table_chunk_rows <= 0):
+      parser.error ("--table-chunk-rows must be positive")
+
+  if (arguments ['table_chunk_seconds'] != None):
+    if (arguments ['table_chunk_seconds'] <= 0):
+      parser.error ("--table-chunk-seconds must be positive")
+    table_chunk_seconds = fractions.Fraction (
+      arguments ['table_chunk_seconds'])
+
+  if (arguments ['script_input'] != None):
+    do_script_input = True
+    script_file_name = arguments ['script_input']
+    script_file_name = pathlib.Path(script_file_name)
+
+  if (arguments ['last_event_time'] != None):
+    do_last_event_time_output = True
+    last_event_time_file_name = arguments ['last_event_time']
+    last_event_time_file_name = pathlib.Path(last_event_time_file_name)
+
+  if (arguments ['clock_step'] != None):
+    clock_step = arguments ['clock_step']
+    clock_step = decimal.Decimal (clock_step)
+    clock_step = fractions.Fraction (clock_step)
+
+  if (arguments ['print_statistics'] != None):
+    print_statistics = arguments ['print_statistics']
+
+  if (arguments ['explain_state_transitions'] != None):
+    explain_state_transitions = arguments ['explain_state_transitions']
+
+  if (arguments ['flush_table_file'] != None):
+    flush_table_file = arguments ['flush_table_file']
 
-    # Otherwise we advance the clock to the next significant event.
-    next_clock_time = end_time
-    if ((next_timer_completion_time != None) and
-        (next_timer_completion_time < next_clock_time)):
-      next_clock_time = next_timer_completion_time
-    if ((next_script_action_time != None) and
-        (next_script_action_time < next_clock_time)):
-      next_clock_time = next_script_action_time
-    if ((next_traffic_element_time != None) and
-        (next_traffic_element_time < next_clock_time)):
-      next_clock_time = next_traffic_element_time
-
-    if (do_trace):
-      trace_file.write ("Advance clock from " + format_time(current_time) +
-                        " to " + format_time(next_clock_time) + ".\n")
-      
-    current_time = next_clock_time
-    last_event_time = current_time
+  if (arguments ['only_important'] != None):
+    only_important = arguments ['only_important']
+
+  if (arguments ['show_substates'] != None):
+    show_substates = arguments ['show_substates']
+
+  if (arguments ['show_green_lists'] != None):
+    show_green_lists = arguments ['show_green_lists']
+
+  if (arguments ['verbose'] != None):
+    verbosity_level = int(arguments ['verbose'])
+
+  if (arguments ['cache_directory'] != None):
+    cache_directory = pathlib.Path(arguments ['cache_directory'])
   else:
-    no_activity = True
-  
-if (do_trace):
-  trace_file.write ("Ending Signal Faces:\n")
-  pprint.pprint (signal_faces_list, trace_file)
-
- # If requested, also print the maximum wait times.
-if (print_statistics and (verbosity_level >= 1)):
-  for signal_face in signal_faces_list:
-    if ("max wait time" in signal_face):
-      print (format_time(current_time) + " signal face " +
-             signal_face["name"] + " maximum wait " +
-             format_time(signal_face["max wait time"]) + " at " +
-             format_time(signal_face["max wait start"]) + ".")
-  
-if (do_table_output):
-  table_file.write ("\\hline \\end{longtable}\n")
-  table_file.close()
-
-# If requested, output the time of the last event, rounded up
-# to the nearest second.
-if (do_last_event_time_output):
-  last_event_time_file = open (last_event_time_file_name, "w")
-  last_event_time_file.write (str(int(last_event_time) + 2) + "\n")
-  last_event_time_file.close()
-  
-if (do_trace):
-  trace_file.close()
-
-if (error_counter > 0):
-  print ("Encountered " + str(error_counter) + " errors.")
+    cache_directory = default_cache_directory ()
+
+  if (arguments ['cache_size'] != None):
+    cache_size = arguments ['cache_size']
+
+  if (arguments ['incremental_every'] != None):
+    incremental_interval = fractions.Fraction (arguments ['incremental_every'])
+
+  if (arguments ['checkpoint_file'] != None):
+    checkpoint_file_name = arguments ['checkpoint_file']
+    checkpoint_file_name = pathlib.Path(checkpoint_file_name)
+
+  if (arguments ['checkpoint_every'] != None):
+    if (arguments ['checkpoint_file'] == None):
+      parser.error ("--checkpoint-every requires --checkpoint-file")
+    if (arguments ['checkpoint_every'] <= 0):
+      parser.error ("--checkpoint-every must be positive")
+    checkpoint_interval = fractions.Fraction (arguments ['checkpoint_every'])
+
+  if (arguments ['branch'] != None):
+    if (arguments ['branch_at'] == None):
+      parser.error ("--branch requires --branch-at")
+    for branch in arguments ['branch']:
+      branch_name, equals, branch_script_name = branch.partition ("=")
+      if ((equals != "=") or (branch_name == "") or
+          (branch_script_name == "")):
+        parser.error ("--branch must be given as name=script")
+      branches.append ((branch_name, pathlib.Path(branch_script_name)))
+    branch_time = fractions.Fraction (arguments ['branch_at'])
+
+  if (arguments ['jobs'] != None):
+    jobs = arguments ['jobs']
+
+  if (arguments ['resume_from'] != None):
+    try:
+      simulation = load_checkpoint (arguments ['resume_from'])
+    except (OSError, ValueError, zlib.error,
+            pickle.UnpicklingError) as the_error:
+      parser.error ("cannot resume from " + arguments ['resume_from'] +
+                    ": " + str(the_error))
+
+  # Use the results of an identical earlier run if there was one.  Runs
+  # which read or write checkpoints or have branches are never cached,
+  # since their results depend on more than their options and input
+  # files, nor are runs which write a chunked table, since the cache
+  # does not keep the chunks.
+  key = None
+  if ((not arguments ['no_cache']) and (trace_file_name == None) and
+      (table_chunk_rows == None) and (table_chunk_seconds == None) and
+      (arguments ['checkpoint_file'] == None) and
+      (arguments ['resume_from'] == None) and (len(branches) == 0)):
+    key = cache_key (arguments)
+    statistics = fetch_cached_results (cache_directory, key, arguments)
+    if (statistics != None):
+      write_statistics_file (arguments ['statistics_file'], statistics)
+      return (statistics)
+
+  # Start from the latest checkpoint of an earlier run whose script
+  # matches this one up to then, or else from the state at the script's
+  # first action, if the cache holds either.  Save checkpoints from this
+  # run in a partial cache entry, which becomes the entry for the run
+  # if it finishes without errors.  Generated arrivals can come before
+  # the script's first action, so runs with them start from the
+  # beginning.
+  warm_key = None
+  incremental_start = None
+  incremental_directory = None
+  if ((key != None) and do_script_input and
+      (arguments ['arrivals_file'] == None)):
+    script_actions = read_script (script_file_name)
+    if (len(script_actions) > 0):
+      warm_start_time = min(the_action[0] for the_action in script_actions)
+      if (warm_start_time <= end_time):
+        warm_key = warm_start_key (arguments, warm_start_time)
+        base_key = cache_key (arguments, warm_start_excluded_options)
+        incremental_start = find_incremental_start (
+          cache_directory, base_key, script_actions, warm_start_time,
+          end_time)
+        if (incremental_interval > 0):
+          try:
+            cache_directory.mkdir (parents=True, exist_ok=True)
+            incremental_directory = pathlib.Path(tempfile.mkdtemp (
+              dir=cache_directory, prefix="partial-"))
+          except OSError:
+            incremental_directory = None
+  output_file_names = dict()
+  if (table_file_name != None):
+    output_file_names["table_file"] = table_file_name
+  if (events_file_name != None):
+    output_file_names["events_file"] = events_file_name
+  if (trips_file_name != None):
+    output_file_names["trips_file"] = trips_file_name
+  if (database_file_name != None):
+    output_file_names["database_file"] = database_file_name
+  if (table_log_file_name != None):
+    output_file_names["table_log_file"] = table_log_file_name
+
+  # Copy the console output so it can be saved in the cache, if the run
+  # can be cached.
+  if (key != None):
+    console = ConsoleRecorder (sys.stdout)
+  else:
+    console = sys.stdout
+  with contextlib.redirect_stdout (console):
+    if (incremental_start != None):
+      simulation = fetch_incremental_start (incremental_start,
+                                            output_file_names,
+                                            script_file_name)
+    if ((simulation == None) and (warm_key != None)):
+      simulation = fetch_warm_start (cache_directory, warm_key,
+                                     output_file_names)
+      if (simulation != None):
+        simulation.clear_script ()
+        simulation.load_script (script_file_name)
+    if (simulation != None):
+      # The time series is written only at the end, to this run's file,
+      # and the flight recorder is this run's.
+      simulation.time_series_file_name = time_series_file_name
+      simulation.set_flight_recorder (flight_recorder_size,
+                                      flight_recorder_file_name)
+    if (simulation == None):
+      simulation = Simulation (
+        trace_file_name=trace_file_name, events_file_name=events_file_name,
+        table_file_name=table_file_name, table_level=table_level,
+        table_start_time=table_start_time, table_end_time=table_end_time,
+        table_caption=table_caption, flush_table_file=flush_table_file,
+        clock_step=clock_step, print_statistics=print_statistics,
+        explain_state_transitions=explain_state_transitions,
+        only_important=only_important, show_substates=show_substates,
+        show_green_lists=show_green_lists, verbosity_level=verbosity_level,
+        trips_file_name=trips_file_name,
+        time_series_file_name=time_series_file_name,
+        sample_interval=sample_interval,
+        events_format=events_format,
+        database_file_name=database_file_name,
+        table_log_file_name=table_log_file_name,
+        table_chunk_rows=table_chunk_rows,
+        table_chunk_seconds=table_chunk_seconds,
+        trace_format=trace_format,
+        flight_recorder_size=flight_recorder_size,
+        flight_recorder_file_name=flight_recorder_file_name)
+      simulation.load_intersection (intersection_file_name)
+      if (do_script_input):
+        simulation.load_script (script_file_name)
+      if (arguments ['arrivals_file'] != None):
+        simulation.load_arrivals (arguments ['arrivals_file'],
+                                  arguments ['arrivals_seed'])
+      if (warm_key != None):
+        simulation.run_until (warm_start_time)
+        if ((simulation.error_counter == 0) and
+            (simulation.flight_recorder_dumps == 0)):
+          store_warm_start (cache_directory, warm_key, simulation,
+                            console.recording.getvalue(), cache_size)
+    simulation.schedule_checkpoints (checkpoint_file_name,
+                                     checkpoint_interval)
+
+    # SIGUSR1 writes out the flight recorder, and the run goes on.
+    # Signals can only be caught in the main thread.
+    previous_handler = None
+    if (hasattr (signal, "SIGUSR1") and
+        (threading.current_thread() is threading.main_thread())):
+      previous_handler = signal.signal (
+        signal.SIGUSR1,
+        lambda signal_number, frame: simulation.dump_flight_recorder (
+          "SIGUSR1", requested=True))
+
+    # Pause at the branch time rather than ending there, so the main run
+    # goes on as though it had no branches.
+    if (len(branches) > 0):
+      simulation.run_until (end_time, pause_time=branch_time)
+      branch_statistics = run_branches (simulation, branches, end_time,
+                                        jobs)
+    if (incremental_directory != None):
+      checkpoints = run_with_incremental_checkpoints (
+        simulation, end_time, incremental_interval, incremental_directory,
+        script_actions, console)
+    else:
+      simulation.run_until (end_time)
+    if (arguments ['checkpoint_file'] != None):
+      simulation.save_checkpoint (checkpoint_file_name)
+    simulation.finish ()
+    if (previous_handler != None):
+      signal.signal (signal.SIGUSR1, previous_handler)
+
+    # If requested, output the time of the last event, rounded up
+    # to the nearest second.
+    if (do_last_event_time_output):
+      last_event_time_file = open (last_event_time_file_name, "w")
+      last_event_time_file.write (str(int(simulation.last_event_time) + 2) +
+                                  "\n")
+      last_event_time_file.close()
+
+    if (simulation.error_counter > 0):
+      print ("Encountered " + str(simulation.error_counter) + " errors.")
+
+    # Show the output of each branch after that of the main run.
+    for branch_name, branch_script_name in branches:
+      print ("Branch " + branch_name + ":")
+      if ("error" in branch_statistics[branch_name]):
+        print (branch_statistics[branch_name]["error"])
+      else:
+        sys.stdout.write (branch_statistics[branch_name]["console"])
+
+  statistics = simulation.statistics ()
+  if (len(branches) > 0):
+    statistics["branches"] = branch_statistics
+  if ((key != None) and (simulation.error_counter == 0) and
+      (simulation.flight_recorder_dumps == 0)):
+    if (incremental_directory != None):
+      try:
+        with open (incremental_directory / "checkpoints.json", "w") as \
+             checkpoints_file:
+          json.dump ({"base_key": base_key, "checkpoints": checkpoints},
+                     checkpoints_file, indent=2)
+      except OSError:
+        pass
+    store_cached_results (cache_directory, key, arguments,
+                          console.recording.getvalue(), statistics,
+                          cache_size, incremental_directory)
+  elif (incremental_directory != None):
+    shutil.rmtree (incremental_directory, ignore_errors=True)
+  write_statistics_file (arguments ['statistics_file'], statistics)
+  return (statistics)
+
+if (__name__ == "__main__"):
+  main ()
 
 # End of file simulate_traffic.py
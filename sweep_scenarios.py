@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# -*- coding: utf-8
+#
+# sweep_scenarios.py runs many traffic signal simulations in parallel.
+
+#   Copyright © 2026 by John Sauter <John_Sauter@systemeyescomputerstore.com>
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#   The author's contact information is as follows:
+#     John Sauter
+#     System Eyes Computer Store
+#     20A Northwest Blvd.  Ste 345
+#     Nashua, NH  03063-4066
+#     telephone: (603) 424-1188
+#     e-mail: John_Sauter@systemeyescomputerstore.com
+
+# The manifest is a JSON file listing the scenarios to run.  Each
+# scenario has a name, the command line arguments for simulate_traffic.py
+# and, optionally, a timeout in seconds:
+#
+# {"scenarios": [
+#   {"name": "idle_01",
+#    "arguments": ["--intersection", "one_way_bridge.json",
+#                  "--clock-step", "0.001", "--duration", "200",
+#                  "--table-level", "4", "--table-file", "idle_01_table.tex"],
+#    "timeout": 600}]}
+#
+# The intersection, script, checkpoint and branch script files are found
+# relative to the input directory, which defaults to the directory
+# holding the manifest.
+# Each scenario runs in its own subdirectory of the results directory,
+# so relative output file names land there, along with the console
+# output and a summary of the run.  The summaries of all the scenarios
+# are collected in summary.csv in the results directory as they finish.
+
+import os
+import sys
+import io
+import time
+import signal
+import traceback
+import contextlib
+import multiprocessing
+import pathlib
+import json
+import csv
+import argparse
+
+# The simulator options that name input files.
+input_options = ("--intersection-file", "--script-input", "--arrivals-file",
+                 "--resume-from")
+
+# The columns of the summary file.
+summary_fields = ("name", "status", "elapsed_seconds", "simulated_time",
+                  "last_event_time", "error_count", "traffic_elements",
+                  "max_wait_times", "mean_wait_times", "exit_count",
+                  "mean_delay", "message")
+
+# Raised in a worker when a scenario runs past its timeout.
+class ScenarioTimeout (Exception):
+  pass
+
+def timeout_handler (signal_number, frame):
+  raise ScenarioTimeout ()
+
+# Each worker imports the simulator once and keeps it for all of the
+# scenarios it runs.
+def start_worker ():
+  global simulate_traffic
+  import simulate_traffic
+  return
+
+# Run one scenario in a worker.  Whatever happens to the scenario,
+# return its summary, so one failure does not stop the sweep.
+def run_scenario (scenario):
+  summary = {"name": scenario["name"]}
+  scenario_directory = scenario["directory"]
+  scenario_directory.mkdir (parents=True, exist_ok=True)
+  original_directory = os.getcwd()
+  start_clock = time.monotonic()
+  console_file = open (scenario_directory / "console.txt", "w")
+  previous_handler = signal.signal (signal.SIGALRM, timeout_handler)
+  try:
+    os.chdir (scenario_directory)
+    if (scenario["timeout"] != None):
+      signal.setitimer (signal.ITIMER_REAL, scenario["timeout"])
+    with (contextlib.redirect_stdout (console_file),
+          contextlib.redirect_stderr (console_file)):
+      statistics = simulate_traffic.main (scenario["arguments"])
+    summary.update (statistics)
+    if (statistics["error_count"] > 0):
+      summary["status"] = "errors"
+    else:
+      summary["status"] = "completed"
+  except ScenarioTimeout:
+    summary["status"] = "timeout"
+    summary["message"] = ("ran longer than " + str(scenario["timeout"]) +
+                          " seconds")
+  except (Exception, SystemExit) as the_exception:
+    summary["status"] = "failed"
+    summary["message"] = repr(the_exception)
+    console_file.write (traceback.format_exc())
+  finally:
+    signal.setitimer (signal.ITIMER_REAL, 0)
+    signal.signal (signal.SIGALRM, previous_handler)
+    os.chdir (original_directory)
+    console_file.close()
+  summary["elapsed_seconds"] = round(time.monotonic() - start_clock, 3)
+  with open (scenario_directory / "summary.json", "w") as summary_file:
+    json.dump (summary, summary_file, indent=2)
+    summary_file.write ("\n")
+  return (summary)
+
+# Replace the name of an input file by its full path name, since each
+# scenario runs in its own directory.  The value of --branch is
+# name=script, and only the script is an input file.
+def resolve_input (option, value, input_directory):
+  if (option == "--branch"):
+    branch_name, equals, script_name = value.partition("=")
+    if (equals != "="):
+      return (value)
+    return (branch_name + "=" + resolve_input (None, script_name,
+                                               input_directory))
+  return (os.path.abspath (input_directory / value))
+
+# Replace the names of input files in a scenario's arguments by their
+# full path names.  Abbreviations of the options are allowed, as they
+# are by the simulator, except that --branch cannot be abbreviated,
+# since it is also the start of --branch-at.
+def resolve_inputs (the_arguments, input_directory):
+  resolved = list()
+  resolve_option = None
+  for the_argument in the_arguments:
+    if (resolve_option != None):
+      resolved.append (resolve_input (resolve_option, the_argument,
+                                      input_directory))
+      resolve_option = None
+      continue
+    option, equals, value = the_argument.partition("=")
+    is_input = ((option == "--branch") or
+                ((len(option) > 2) and option.startswith("--") and
+                 any(full_option.startswith(option)
+                     for full_option in input_options)))
+    if (is_input and (equals == "=")):
+      resolved.append (option + "=" +
+                       resolve_input (option, value, input_directory))
+    else:
+      resolved.append (the_argument)
+      if (is_input):
+        resolve_option = option
+  return (resolved)
+
+# Read the manifest and check each scenario before any are run.
+def read_manifest (manifest_file_name, input_directory, results_directory,
+                   default_timeout):
+  global error_counter
+  import simulate_traffic
+
+  with open (manifest_file_name, "r") as manifest_file:
+    manifest = json.load (manifest_file)
+  scenarios = list()
+  names = set()
+  for scenario_info in manifest["scenarios"]:
+    name = scenario_info["name"]
+    if ((name in names) or (name != pathlib.Path(name).name)):
+      print ("Scenario name " + name + " is invalid or used twice.")
+      error_counter = error_counter + 1
+      continue
+    names.add (name)
+    the_arguments = resolve_inputs (scenario_info["arguments"],
+                                    input_directory)
+    try:
+      with contextlib.redirect_stderr (io.StringIO()) as error_text:
+        simulate_traffic.parser.parse_args (the_arguments)
+    except SystemExit:
+      print ("Scenario " + name + " has invalid arguments: " +
+             (error_text.getvalue().strip().splitlines() + [""])[-1])
+      error_counter = error_counter + 1
+      continue
+    timeout = scenario_info.get ("timeout", default_timeout)
+    scenarios.append ({"name": name, "arguments": the_arguments,
+                       "timeout": timeout,
+                       "directory": results_directory / name})
+  return (scenarios)
+
+def main ():
+  global error_counter
+
+  parser = argparse.ArgumentParser (
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=('Run many traffic signal simulations in parallel.'),
+    epilog=('Copyright © 2026 by John Sauter' + '\n' +
+            'License GPL3+: GNU GPL version 3 or later; ' + '\n' +
+            'see <https://gnu.org/licenses/gpl.html> for the full text ' +
+            'of the license.' + '\n' +
+            'This is free software: ' +
+            'you are free to change and redistribute it. ' + '\n' +
+            'There is NO WARRANTY, to the extent permitted by law. ' + '\n' +
+            '\n'))
+
+  parser.add_argument ('--version', action='version',
+                       version='sweep_scenarios 0.1 2026-10-19',
+                       help='print the version number and exit')
+  parser.add_argument ('--manifest', metavar='manifest', required=True,
+                       help='JSON list of the scenarios to run')
+  parser.add_argument ('--results-directory', metavar='results_directory',
+                       required=True,
+                       help='write the output of each scenario into a ' +
+                       'subdirectory of this directory')
+  parser.add_argument ('--input-directory', metavar='input_directory',
+                       help='where to find the intersection and script ' +
+                       'files, default is the directory of the manifest')
+  parser.add_argument ('--jobs', type=int, metavar='jobs',
+                       help='number of scenarios to run at once, ' +
+                       'default is the number of processors')
+  parser.add_argument ('--timeout', type=float, metavar='timeout',
+                       help='stop a scenario that runs longer than this ' +
+                       'many seconds, unless the manifest says otherwise')
+  parser.add_argument ('--verbose', type=int, metavar='verbosity_level',
+                       help='control the amount of output from the ' +
+                       'program: 1 is normal, 0 suppresses summary messages')
+
+  arguments = vars(parser.parse_args ())
+  manifest_file_name = pathlib.Path(arguments ['manifest']).resolve()
+  results_directory = pathlib.Path(arguments ['results_directory']).resolve()
+  if (arguments ['input_directory'] != None):
+    input_directory = pathlib.Path(arguments ['input_directory']).resolve()
+  else:
+    input_directory = manifest_file_name.parent
+  jobs = os.cpu_count()
+  if (arguments ['jobs'] != None):
+    jobs = arguments ['jobs']
+  verbosity_level = 1
+  if (arguments ['verbose'] != None):
+    verbosity_level = arguments ['verbose']
+
+  error_counter = 0
+  scenarios = read_manifest (manifest_file_name, input_directory,
+                             results_directory, arguments ['timeout'])
+  results_directory.mkdir (parents=True, exist_ok=True)
+
+  # Write each summary as soon as its scenario finishes.
+  counts = dict()
+  start_clock = time.monotonic()
+  with open (results_directory / "summary.csv", "w", newline="") as \
+       summary_file:
+    writer = csv.DictWriter (summary_file, fieldnames=summary_fields,
+                             extrasaction="ignore")
+    writer.writeheader()
+    with multiprocessing.Pool (processes=min(jobs, max(len(scenarios), 1)),
+                               initializer=start_worker) as pool:
+      for summary in pool.imap_unordered (run_scenario, scenarios):
+        row = dict(summary)
+        for field in ("max_wait_times", "mean_wait_times"):
+          row[field] = json.dumps (summary.get (field, dict()))
+        writer.writerow (row)
+        summary_file.flush()
+        status = summary["status"]
+        counts[status] = counts.get(status, 0) + 1
+        if (verbosity_level >= 2):
+          print (summary["name"] + ": " + status + " in " +
+                 str(summary["elapsed_seconds"]) + " seconds.")
+
+  if (verbosity_level >= 1):
+    print ("Ran " + str(len(scenarios)) + " scenarios in " +
+           f'{time.monotonic() - start_clock:.1f}' + " seconds: " +
+           ", ".join(str(counts[status]) + " " + status
+                     for status in sorted(counts)) + ".")
+  for status in counts:
+    if (status != "completed"):
+      error_counter = error_counter + counts[status]
+  if (error_counter > 0):
+    print ("Encountered " + str(error_counter) + " errors.")
+    sys.exit (1)
+  return
+
+if (__name__ == "__main__"):
+  main ()
+
+# End of file sweep_scenarios.py
@@ -9,4 +9,10 @@ if [[ $diff_result -ne 0 ]]; then
   exit $diff_result
 fi
 
+diff lane_merge_output.csv lane_merge_expected_output.csv
+diff_result=$?
+if [[ $diff_result -ne 0 ]]; then
+  exit $diff_result
+fi
+
 # End of file verify_files_template.sh